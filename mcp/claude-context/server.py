@@ -1,89 +1,1057 @@
 #!/usr/bin/env python3
 """Claude Context MCP Server - Conversational context management"""
 
+import asyncio
+from bisect import bisect_right
+from collections import Counter, OrderedDict
+from concurrent.futures import ThreadPoolExecutor
+import gzip
+import hashlib
+import heapq
+from array import array
 import json
+import math
 import os
+import re
+import sqlite3
+import threading
+import time
+import uuid
+import weakref
+import zlib
+from itertools import accumulate
 from pathlib import Path
-from typing import Any
+from typing import Any, Callable
 from datetime import datetime
 
 from mcp.server import Server
 from mcp.server.stdio import stdio_server
 from mcp.types import Tool, TextContent
 
+try:
+    import zstandard
+    ZSTD_AVAILABLE = True
+except ImportError:
+    ZSTD_AVAILABLE = False
+
 CONTEXT_PATH = Path(os.getenv("CONTEXT_PATH", "/data"))
+CONTEXT_INDEX_PATH = Path(os.getenv("CONTEXT_INDEX_PATH", str(CONTEXT_PATH / ".search-index.sqlite3")))
+# zstd, gzip or none; zstd falls back to gzip when zstandard is not installed
+CONTEXT_COMPRESSION = os.getenv("CONTEXT_COMPRESSION", "zstd").lower()
+CONTEXT_COMPRESSION_LEVEL = os.getenv("CONTEXT_COMPRESSION_LEVEL")
+CONTEXT_CHUNK_PATH = Path(os.getenv("CONTEXT_CHUNK_PATH", str(CONTEXT_PATH / ".chunks")))
+# Content-defined chunk sizes: boundaries fall on line ends picked by a hash of the line
+CONTEXT_CHUNK_MIN_BYTES = int(os.getenv("CONTEXT_CHUNK_MIN_BYTES", str(2 * 1024)))
+CONTEXT_CHUNK_AVG_BYTES = int(os.getenv("CONTEXT_CHUNK_AVG_BYTES", str(8 * 1024)))
+CONTEXT_CHUNK_MAX_BYTES = int(os.getenv("CONTEXT_CHUNK_MAX_BYTES", str(64 * 1024)))
+MERGE_SEPARATOR = "\n\n---\n\n"
+# Storage operations run on a bounded thread pool so the event loop stays responsive
+CONTEXT_WORKERS = int(os.getenv("CONTEXT_WORKERS", "4"))
+CONTEXT_MAX_PENDING = int(os.getenv("CONTEXT_MAX_PENDING", "64"))
+# Byte budget of the in-process LRU cache of parsed contexts
+CONTEXT_CACHE_BYTES = int(os.getenv("CONTEXT_CACHE_BYTES", str(64 * 1024 * 1024)))
 
 server = Server("claude-context")
 
+TOKEN_RE = re.compile(r"\w+")
+HEADING_RE = re.compile(rb"^#{1,6}[ \t]+(.+?)[ \t#]*\r?$", re.MULTILINE)
+SNIPPET_BYTES = 200
+DEFAULT_RANGE_BYTES = 64 * 1024
+# One byte offset is kept every LINE_INDEX_STEP lines to seek line ranges
+LINE_INDEX_STEP = 1000
+
+def tokenize(text: str) -> list[str]:
+    """Split text into lowercase word tokens"""
+    return [match.group(0).lower() for match in TOKEN_RE.finditer(text)]
+
+def tokenize_with_positions(text: str) -> dict[str, list[int]]:
+    """Map each lowercase token to the UTF-8 byte offsets where it occurs"""
+    positions: dict[str, list[int]] = {}
+    ascii_only = text.isascii()
+    byte_offset = last = 0
+    for match in TOKEN_RE.finditer(text):
+        if ascii_only:
+            byte_offset = match.start()
+        else:
+            byte_offset += len(text[last:match.start()].encode())
+            last = match.start()
+        positions.setdefault(match.group(0).lower(), []).append(byte_offset)
+    return positions
+
+def trim_utf8(raw: bytes) -> tuple[int, bytes]:
+    """Drop partial UTF-8 characters at both ends of a byte slice.
+
+    Returns the number of leading bytes dropped and the trimmed slice.
+    """
+    head = 0
+    while head < len(raw) and raw[head] & 0xC0 == 0x80:
+        head += 1
+    tail = len(raw)
+    lead = tail - 1
+    while lead >= head and raw[lead] & 0xC0 == 0x80:
+        lead -= 1
+    if lead >= head:
+        first = raw[lead]
+        width = 1 if first < 0x80 else 2 if first < 0xE0 else 3 if first < 0xF0 else 4
+        if tail - lead < width:
+            tail = lead
+    return head, raw[head:tail]
+
+ZSTD_MAGIC = b"\x28\xb5\x2f\xfd"
+GZIP_MAGIC = b"\x1f\x8b"
+
+class Codec:
+    """Block compressor selected by CONTEXT_COMPRESSION / CONTEXT_COMPRESSION_LEVEL"""
+
+    def __init__(self, name: str, level: str = None):
+        if name == "zstd" and not ZSTD_AVAILABLE:
+            name = "gzip"
+        if name not in ("zstd", "gzip", "none"):
+            raise ValueError(f"Unknown CONTEXT_COMPRESSION: {name}")
+        self.name = name
+        self.level = int(level) if level else {"zstd": 3, "gzip": 6, "none": 0}[name]
+        if name == "zstd":
+            self._compressor = zstandard.ZstdCompressor(level=self.level)
+
+    def compress(self, data: bytes) -> bytes:
+        if self.name == "zstd":
+            return self._compressor.compress(data)
+        if self.name == "gzip":
+            return gzip.compress(data, compresslevel=self.level, mtime=0)
+        return data
+
+def decompress(data: bytes) -> bytes:
+    """Decode a stored blob, detecting the format from its magic bytes"""
+    if data.startswith(ZSTD_MAGIC):
+        if not ZSTD_AVAILABLE:
+            raise RuntimeError("Context is zstd-compressed but zstandard is not installed")
+        return zstandard.ZstdDecompressor().decompress(data)
+    if data.startswith(GZIP_MAGIC):
+        return gzip.decompress(data)
+    return data
+
+def atomic_write(path: Path, data: bytes):
+    """Write `data` to `path` through a temp file, fsync and rename"""
+    tmp_path = path.with_name(f".{path.name}.{uuid.uuid4().hex}.tmp")
+    try:
+        with open(tmp_path, 'wb') as f:
+            f.write(data)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, path)
+    except BaseException:
+        tmp_path.unlink(missing_ok=True)
+        raise
+    try:
+        dir_fd = os.open(path.parent, os.O_RDONLY)
+    except OSError:
+        return
+    try:
+        os.fsync(dir_fd)
+    except OSError:
+        # Some filesystems do not support fsync on directories
+        pass
+    finally:
+        os.close(dir_fd)
+
+def split_chunks(raw: bytes) -> list[bytes]:
+    """Split a body into content-defined chunks.
+
+    A chunk ends after a line whose CRC falls below a threshold proportional
+    to the line length, so chunks average CONTEXT_CHUNK_AVG_BYTES and an edit
+    only changes the chunks around it. Lines longer than the max are cut hard.
+    """
+    chunks = []
+    current: list[bytes] = []
+    size = 0
+    for line in raw.splitlines(keepends=True):
+        while len(line) > CONTEXT_CHUNK_MAX_BYTES:
+            if current:
+                chunks.append(b"".join(current))
+                current, size = [], 0
+            chunks.append(line[:CONTEXT_CHUNK_MAX_BYTES])
+            line = line[CONTEXT_CHUNK_MAX_BYTES:]
+        current.append(line)
+        size += len(line)
+        if size >= CONTEXT_CHUNK_MAX_BYTES or (
+            size >= CONTEXT_CHUNK_MIN_BYTES
+            and zlib.crc32(line) % CONTEXT_CHUNK_AVG_BYTES < len(line)
+        ):
+            chunks.append(b"".join(current))
+            current, size = [], 0
+    if current:
+        chunks.append(b"".join(current))
+    return chunks
+
+def find_sections(raw: bytes) -> list[dict]:
+    """Split a body into markdown sections by heading"""
+    sections = []
+    headings = [(m.start(), m.group(1).decode(errors="replace")) for m in HEADING_RE.finditer(raw)]
+    if not headings or headings[0][0] > 0:
+        headings.insert(0, (0, ""))
+    for i, (offset, title) in enumerate(headings):
+        end = headings[i + 1][0] if i + 1 < len(headings) else len(raw)
+        sections.append({"title": title, "offset": offset, "length": end - offset})
+    return sections
+
+def build_content_index(raw: bytes) -> tuple[list[int], list[dict]]:
+    """Compute the sparse line index and markdown sections of a content body"""
+    line_index = [0]
+    line = 0
+    pos = raw.find(b"\n")
+    while pos != -1:
+        line += 1
+        if line % LINE_INDEX_STEP == 0:
+            line_index.append(pos + 1)
+        pos = raw.find(b"\n", pos + 1)
+    return line_index, find_sections(raw)
+
+def best_window(occurrences: list[tuple[int, str]], weights: dict[str, float], width: int) -> tuple[int, int]:
+    """Find the span of at most `width` bytes covering the highest-weighted matches.
+
+    `occurrences` is a list of (offset, term) sorted by offset. A window scores
+    the summed weight of the distinct terms it contains, with the number of
+    occurrences as tie-breaker. Returns (start, end) of the matched span.
+    """
+    best = (-1.0, 0, 0, 0)
+    counts: dict[str, int] = {}
+    left = 0
+    for right, (offset, term) in enumerate(occurrences):
+        counts[term] = counts.get(term, 0) + 1
+        while offset + len(term.encode()) - occurrences[left][0] > width and left < right:
+            left_term = occurrences[left][1]
+            counts[left_term] -= 1
+            if not counts[left_term]:
+                del counts[left_term]
+            left += 1
+        score = sum(weights[t] for t in counts)
+        if (score, right - left) > best[:2]:
+            best = (score, right - left, occurrences[left][0], offset + len(term.encode()))
+    return best[2], best[3]
+
+class ContextIndex:
+    """Persistent inverted index over saved contexts, ranked with BM25.
+
+    Documents are keyed by file name plus mtime/size, so a refresh only
+    re-indexes files that changed and drops files removed from disk.
+    Each thread gets its own connection; writers are serialized by a lock
+    while readers run concurrently under WAL.
+    """
+
+    SCHEMA_VERSION = "3"
+    K1 = 1.2
+    B = 0.75
+
+    def __init__(self, path: Path):
+        self.path = path
+        self._local = threading.local()
+        self._write_lock = threading.Lock()
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self._init_schema()
+
+    @property
+    def db(self) -> sqlite3.Connection:
+        connection = getattr(self._local, "connection", None)
+        if connection is None:
+            connection = self._local.connection = sqlite3.connect(str(self.path), timeout=30)
+            connection.execute("PRAGMA synchronous=NORMAL")
+        return connection
+
+    def _init_schema(self):
+        self.db.execute("CREATE TABLE IF NOT EXISTS meta (key TEXT PRIMARY KEY, value TEXT)")
+        row = self.db.execute("SELECT value FROM meta WHERE key = 'schema_version'").fetchone()
+        if row is None or row[0] != self.SCHEMA_VERSION:
+            # Index layout changed: drop everything and rebuild lazily on next refresh
+            self.db.executescript("""
+                DROP TABLE IF EXISTS postings;
+                DROP TABLE IF EXISTS docs;
+            """)
+        self.db.executescript("""
+            CREATE TABLE IF NOT EXISTS docs (
+                id INTEGER PRIMARY KEY,
+                file TEXT UNIQUE NOT NULL,
+                name TEXT NOT NULL,
+                mtime_ns INTEGER NOT NULL,
+                size INTEGER NOT NULL,
+                length INTEGER NOT NULL,
+                bytes INTEGER NOT NULL,
+                created_at TEXT
+            );
+            CREATE TABLE IF NOT EXISTS postings (
+                term TEXT NOT NULL,
+                doc_id INTEGER NOT NULL,
+                tf INTEGER NOT NULL,
+                positions BLOB NOT NULL,
+                PRIMARY KEY (term, doc_id)
+            ) WITHOUT ROWID;
+            CREATE INDEX IF NOT EXISTS postings_doc ON postings (doc_id);
+        """)
+        self.db.execute(
+            "INSERT OR REPLACE INTO meta (key, value) VALUES ('schema_version', ?)",
+            (self.SCHEMA_VERSION,)
+        )
+        self.db.commit()
+
+    def _remove(self, file: str):
+        row = self.db.execute("SELECT id FROM docs WHERE file = ?", (file,)).fetchone()
+        if row:
+            self.db.execute("DELETE FROM postings WHERE doc_id = ?", (row[0],))
+            self.db.execute("DELETE FROM docs WHERE id = ?", (row[0],))
+
+    def _add(self, file: str, stat: os.stat_result, context: dict):
+        self._remove(file)
+        positions = tokenize_with_positions(context["content"])
+        length = sum(len(offsets) for offsets in positions.values())
+
+        cursor = self.db.execute(
+            "INSERT INTO docs (file, name, mtime_ns, size, length, bytes, created_at) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (file, context["name"], stat.st_mtime_ns, stat.st_size, length,
+             len(context["content"].encode()), context.get("created_at"))
+        )
+        self.db.executemany(
+            "INSERT INTO postings (term, doc_id, tf, positions) VALUES (?, ?, ?, ?)",
+            [
+                (term, cursor.lastrowid, len(offsets), array("I", offsets).tobytes())
+                for term, offsets in positions.items()
+            ]
+        )
+
+    def update(self, file_path: Path, context: dict):
+        """Index a context that was just written, without re-reading it"""
+        with self._write_lock:
+            self._add(file_path.name, file_path.stat(), context)
+            self.db.commit()
+
+    def refresh(self, root: Path, load: Callable[[Path], dict]):
+        """Re-index files added, changed or removed since the last refresh.
+
+        `load` reads a full context (including content) from its header file.
+        """
+        with self._write_lock:
+            on_disk = {}
+            with os.scandir(root) as entries:
+                for entry in entries:
+                    if entry.name.endswith(".json") and entry.is_file():
+                        on_disk[entry.name] = entry.stat()
+
+            indexed = {
+                file: (mtime_ns, size)
+                for file, mtime_ns, size in self.db.execute("SELECT file, mtime_ns, size FROM docs")
+            }
+
+            for file in indexed.keys() - on_disk.keys():
+                self._remove(file)
+
+            for file, stat in on_disk.items():
+                if indexed.get(file) == (stat.st_mtime_ns, stat.st_size):
+                    continue
+                try:
+                    self._add(file, stat, load(root / file))
+                except (OSError, json.JSONDecodeError, KeyError):
+                    # Unreadable or foreign file: make sure no stale entry survives
+                    self._remove(file)
+
+            self.db.commit()
+
+    def stats(self) -> dict:
+        documents, terms = self.db.execute(
+            "SELECT (SELECT COUNT(*) FROM docs), (SELECT COUNT(DISTINCT term) FROM postings)"
+        ).fetchone()
+        return {"documents": documents, "terms": terms}
+
+    def search(self, query: str, limit: int, read_bytes: Callable[[str, int, int], bytes]) -> list[dict]:
+        """Return the top `limit` contexts for `query` ranked by BM25.
+
+        Each result carries a snippet around its best-scoring match window,
+        highlight offsets relative to the snippet and the number of matches.
+        Only the snippet ranges of the top `limit` contexts are read from disk,
+        through `read_bytes(name, start, end)`.
+        """
+        terms = set(tokenize(query))
+        if not terms or limit <= 0:
+            return []
+
+        total_docs, avg_length = self.db.execute(
+            "SELECT COUNT(*), AVG(length) FROM docs"
+        ).fetchone()
+        if not total_docs:
+            return []
+        avg_length = avg_length or 1.0
+
+        scores: dict[int, float] = {}
+        idfs: dict[str, float] = {}
+        for term in terms:
+            postings = self.db.execute(
+                "SELECT p.doc_id, p.tf, d.length FROM postings p "
+                "JOIN docs d ON d.id = p.doc_id WHERE p.term = ?",
+                (term,)
+            ).fetchall()
+            if not postings:
+                continue
+            df = len(postings)
+            idf = idfs[term] = math.log(1 + (total_docs - df + 0.5) / (df + 0.5))
+            for doc_id, tf, length in postings:
+                norm = tf + self.K1 * (1 - self.B + self.B * length / avg_length)
+                scores[doc_id] = scores.get(doc_id, 0.0) + idf * tf * (self.K1 + 1) / norm
+
+        top = heapq.nlargest(limit, scores.items(), key=lambda item: item[1])
+        results = []
+        for doc_id, score in top:
+            name, total_bytes, created_at = self.db.execute(
+                "SELECT name, bytes, created_at FROM docs WHERE id = ?", (doc_id,)
+            ).fetchone()
+            occurrences = []
+            for term, blob in self.db.execute(
+                "SELECT term, positions FROM postings WHERE doc_id = ? AND term IN (%s)"
+                % ",".join("?" * len(idfs)),
+                (doc_id, *idfs)
+            ):
+                occurrences.extend((offset, term) for offset in array("I", blob))
+            occurrences.sort()
+
+            match_start, match_end = best_window(occurrences, idfs, SNIPPET_BYTES)
+            pad = max(0, SNIPPET_BYTES - (match_end - match_start)) // 2
+            start = max(0, min(match_start - pad, total_bytes - SNIPPET_BYTES))
+            end = min(total_bytes, start + SNIPPET_BYTES)
+            try:
+                raw = read_bytes(name, start, end)
+            except (OSError, ValueError, KeyError):
+                # Removed or corrupted since the last refresh
+                continue
+            head, raw = trim_utf8(raw)
+            start += head
+
+            def char_offset(byte_offset: int) -> int:
+                return len(raw[:byte_offset].decode(errors="ignore"))
+
+            results.append({
+                "name": name,
+                "score": round(score, 4),
+                "match_count": len(occurrences),
+                "snippet": raw.decode(errors="replace"),
+                "snippet_offset": start,
+                "highlights": [
+                    [char_offset(offset - start), char_offset(offset - start + len(term.encode()))]
+                    for offset, term in occurrences
+                    if start <= offset and offset + len(term.encode()) <= start + len(raw)
+                ],
+                "created_at": created_at
+            })
+        return results
+
+def chunk_digests(header) -> set[str]:
+    """Digests of the chunks a header references; empty for inline or foreign files"""
+    if not isinstance(header, dict) or not isinstance(header.get("chunks"), list):
+        return set()
+    return {ref[0] for ref in header["chunks"] if isinstance(ref, list) and ref and isinstance(ref[0], str)}
+
+class ChunkStore:
+    """Content-addressed store of compressed chunks, one file per SHA-256.
+
+    Each chunk carries a count of the context headers referencing it, kept
+    up to date by rebind() on every header write. Writers pin the chunks they
+    are about to reference until their header is on disk; a chunk is deleted
+    only once it is neither referenced nor pinned, so a concurrent save
+    cannot lose a chunk it found already present.
+    """
+
+    def __init__(self, root: Path, codec: "Codec"):
+        self.root = root
+        self.codec = codec
+        self.lock = threading.Lock()
+        self.pins: Counter[str] = Counter()
+        self.refs: Counter[str] = Counter()
+        self.collected = self.collected_bytes = 0
+        root.mkdir(parents=True, exist_ok=True)
+
+    def _path(self, digest: str) -> Path:
+        return self.root / digest[:2] / digest
+
+    def put(self, data: bytes) -> tuple[str, int]:
+        """Store and pin a chunk unless already present; returns (digest, bytes written)"""
+        digest = hashlib.sha256(data).hexdigest()
+        path = self._path(digest)
+        with self.lock:
+            self.pins[digest] += 1
+            if path.exists():
+                return digest, 0
+        path.parent.mkdir(exist_ok=True)
+        stored = self.codec.compress(data)
+        atomic_write(path, stored)
+        return digest, len(stored)
+
+    def pin(self, digests: list[str]) -> list[str]:
+        """Pin chunks referenced from elsewhere; returns the digests already missing"""
+        with self.lock:
+            self.pins.update(digests)
+            return [digest for digest in digests if not self._path(digest).exists()]
+
+    def unpin(self, digests: list[str]):
+        with self.lock:
+            self.pins.subtract(digests)
+            for digest in set(digests):
+                if self.pins[digest] <= 0:
+                    del self.pins[digest]
+
+    def count(self, digests: set[str]):
+        """Add the references of a header found on disk (used at startup)"""
+        with self.lock:
+            self.refs.update(digests)
+
+    def rebind(self, added: set[str], removed: set[str]) -> int:
+        """Move one header's references from `removed` to `added` chunks.
+
+        Removed chunks left with no references and no pins are deleted.
+        Returns the chunks deleted.
+        """
+        with self.lock:
+            self.refs.update(added)
+            self.refs.subtract(removed)
+            deleted = 0
+            for digest in removed:
+                if self.refs[digest] > 0:
+                    continue
+                del self.refs[digest]
+                if self.pins.get(digest):
+                    continue
+                path = self._path(digest)
+                try:
+                    size = path.stat().st_size
+                    path.unlink()
+                except FileNotFoundError:
+                    continue
+                deleted += 1
+                self.collected_bytes += size
+            self.collected += deleted
+            return deleted
+
+    def get(self, digest: str) -> bytes:
+        with open(self._path(digest), 'rb') as f:
+            return decompress(f.read())
+
+    def stats(self) -> dict:
+        with self.lock:
+            return {
+                "referenced": len(self.refs),
+                "pinned": len(self.pins),
+                "collected": self.collected,
+                "collected_bytes": self.collected_bytes
+            }
+
+class ContextCache:
+    """LRU cache of parsed context headers and bodies bounded by a byte budget.
+
+    Entries are validated against the header file's mtime/size, so edits made
+    behind the server's back are noticed on the next lookup. The cost of an
+    entry is approximated by the header file size plus the raw body size.
+    """
+
+    def __init__(self, budget: int):
+        self.budget = budget
+        self.entries: OrderedDict[str, tuple] = OrderedDict()
+        self.bytes = 0
+        self.lock = threading.Lock()
+        self.hits = self.misses = self.evictions = self.invalidations = 0
+
+    def _discard(self, name: str):
+        entry = self.entries.pop(name, None)
+        if entry is not None:
+            self.bytes -= entry[4]
+
+    def get(self, name: str, stat: os.stat_result, with_body: bool = False):
+        """Return the cached (header, body) for `name` if still current, else None.
+
+        body is None when only the header is cached; a lookup that needs the
+        body counts as a miss in that case but still returns the header.
+        """
+        with self.lock:
+            entry = self.entries.get(name)
+            if entry is not None and entry[:2] != (stat.st_mtime_ns, stat.st_size):
+                self._discard(name)
+                self.invalidations += 1
+                entry = None
+            if entry is None or (with_body and entry[3] is None):
+                self.misses += 1
+            else:
+                self.hits += 1
+            if entry is None:
+                return None
+            self.entries.move_to_end(name)
+            return entry[2], entry[3]
+
+    def put(self, name: str, stat: os.stat_result, header: dict, body: bytes = None):
+        cost = stat.st_size + (len(body) if body is not None else 0)
+        with self.lock:
+            self._discard(name)
+            if cost > self.budget:
+                return
+            self.entries[name] = (stat.st_mtime_ns, stat.st_size, header, body, cost)
+            self.bytes += cost
+            while self.bytes > self.budget:
+                _, evicted = self.entries.popitem(last=False)
+                self.bytes -= evicted[4]
+                self.evictions += 1
+
+    def stats(self) -> dict:
+        with self.lock:
+            lookups = self.hits + self.misses
+            return {
+                "entries": len(self.entries),
+                "bytes": self.bytes,
+                "budget_bytes": self.budget,
+                "hits": self.hits,
+                "misses": self.misses,
+                "hit_ratio": round(self.hits / lookups, 4) if lookups else None,
+                "evictions": self.evictions,
+                "invalidations": self.invalidations
+            }
+
 class ContextManager:
     def __init__(self):
         CONTEXT_PATH.mkdir(parents=True, exist_ok=True)
+        self.index = ContextIndex(CONTEXT_INDEX_PATH)
+        self.codec = Codec(CONTEXT_COMPRESSION, CONTEXT_COMPRESSION_LEVEL)
+        self.chunks = ChunkStore(CONTEXT_CHUNK_PATH, self.codec)
+        self.cache = ContextCache(CONTEXT_CACHE_BYTES)
+        for file_path in CONTEXT_PATH.glob("*.json"):
+            try:
+                self.chunks.count(chunk_digests(self._read_header(file_path)))
+            except (OSError, json.JSONDecodeError):
+                # Unreadable or foreign file: it references no chunks
+                continue
+
+    def _write_header(self, header: dict, chunk_refs: list[list], new_raw: int, new_bytes: int,
+                      started: float, body: bytes = None) -> dict:
+        """Commit a header pointing at already-stored, pinned chunks and report storage stats.
+
+        new_raw and new_bytes are the uncompressed and stored sizes of the
+        chunks this write added: the ratio covers compression of those chunks
+        only, while bytes served by existing chunks count as dedup savings.
+        The header (and body, when known) is written through to the cache.
+        Chunk reference counts move from the replaced header to the new one,
+        and chunks left unreferenced are deleted.
+        """
+        try:
+            old_digests = chunk_digests(self._lookup(header["name"])[0])
+        except (OSError, json.JSONDecodeError, KeyError, TypeError, AttributeError):
+            # Missing, unreadable or foreign file: it referenced no chunks
+            old_digests = set()
+        header["codec"] = self.codec.name
+        header["chunks"] = chunk_refs
+        file_path = CONTEXT_PATH / f"{header['name']}.json"
+        atomic_write(file_path, json.dumps(header).encode())
+        self.cache.put(header["name"], file_path.stat(), dict(header), body)
+        new_digests = {ref[0] for ref in chunk_refs}
+        header["storage"] = {
+            "codec": self.codec.name,
+            "level": self.codec.level,
+            "raw_bytes": header["content_bytes"],
+            "chunks": len(chunk_refs),
+            "new_chunk_bytes": new_bytes,
+            "ratio": round(new_raw / new_bytes, 2) if new_bytes else None,
+            "dedup_saved_bytes": header["content_bytes"] - new_raw,
+            "collected_chunks": self.chunks.rebind(new_digests - old_digests, old_digests - new_digests),
+            "write_ms": round((time.perf_counter() - started) * 1000, 2)
+        }
+        return header
 
     def save_context(self, name: str, content: str, metadata: dict = None):
-        """Save a context to file"""
-        context = {
+        """Save a context as a JSON header listing content-addressed chunks.
+
+        Chunks already in the store (from earlier saves or other contexts)
+        are referenced, not rewritten.
+        """
+        started = time.perf_counter()
+        raw = content.encode()
+
+        chunk_refs, new_raw, new_bytes = [], 0, 0
+        try:
+            for chunk in split_chunks(raw):
+                digest, written = self.chunks.put(chunk)
+                chunk_refs.append([digest, len(chunk), chunk.count(b"\n")])
+                if written:
+                    new_raw += len(chunk)
+                    new_bytes += written
+            context = self._save_header(name, content, raw, metadata, chunk_refs, new_raw, new_bytes, started)
+        finally:
+            self.chunks.unpin([ref[0] for ref in chunk_refs])
+        context["content"] = content
+        self.index.update(CONTEXT_PATH / f"{name}.json", context)
+        return context
+
+    def _save_header(self, name: str, content: str, raw: bytes, metadata: dict,
+                     chunk_refs: list[list], new_raw: int, new_bytes: int, started: float) -> dict:
+        header = {
             "name": name,
-            "content": content,
             "metadata": metadata or {},
             "created_at": datetime.now().isoformat(),
-            "updated_at": datetime.now().isoformat()
+            "updated_at": datetime.now().isoformat(),
+            "content_bytes": len(raw),
+            "content_chars": len(content),
+            "line_count": raw.count(b"\n") + 1,
+            "sections": find_sections(raw)
         }
+        return self._write_header(header, chunk_refs, new_raw, new_bytes, started, raw)
+
+    def _read_header(self, file_path: Path) -> dict:
+        with open(file_path, 'rb') as f:
+            return json.loads(f.read())
 
+    def _parse_header(self, file_path: Path) -> dict:
+        """Read a header, deriving the layout fields for legacy inline contexts"""
+        header = self._read_header(file_path)
+        if "content" in header:
+            raw = header["content"].encode()
+            line_index, sections = build_content_index(raw)
+            header.update({
+                "content_bytes": len(raw),
+                "content_chars": len(header["content"]),
+                "line_count": raw.count(b"\n") + 1,
+                "line_index": line_index,
+                "sections": sections
+            })
+        return header
+
+    def _lookup(self, name: str, with_body: bool = False) -> tuple[dict, bytes]:
+        """Return a context's parsed header and body through the cache.
+
+        The body is None when it is not cached and `with_body` is False.
+        Returned objects are shared with the cache and must not be mutated.
+        """
         file_path = CONTEXT_PATH / f"{name}.json"
-        with open(file_path, 'w') as f:
-            json.dump(context, f, indent=2)
+        try:
+            stat = file_path.stat()
+        except FileNotFoundError:
+            raise FileNotFoundError(f"Context '{name}' not found") from None
+
+        entry = self.cache.get(name, stat, with_body)
+        if entry is not None and (entry[1] is not None or not with_body):
+            return entry
+        header = entry[0] if entry is not None else self._parse_header(file_path)
+        body = self._read_content(header, 0, header["content_bytes"]) if with_body else None
+        self.cache.put(name, stat, header, body)
+        return header, body
+
+    def load_header(self, name: str) -> dict:
+        """Load a context header (everything except the content)"""
+        header = dict(self._lookup(name)[0])
+        header.pop("content", None)
+        return header
+
+    def _read_content(self, header: dict, start: int, end: int, body: bytes = None) -> bytes:
+        """Read bytes [start, end) of the body described by `header`"""
+        if body is not None:
+            return body[start:end]
+        if "content" in header:
+            return header["content"].encode()[start:end]
+        if start >= end:
+            return b""
 
+        ends = list(accumulate(ref[1] for ref in header["chunks"]))
+        parts = []
+        i = bisect_right(ends, start)
+        while i < len(ends) and ends[i] - header["chunks"][i][1] < end:
+            chunk_start = ends[i] - header["chunks"][i][1]
+            chunk = self.chunks.get(header["chunks"][i][0])
+            parts.append(chunk[max(0, start - chunk_start):end - chunk_start])
+            i += 1
+        return b"".join(parts)
+
+    def _load_file(self, file_path: Path) -> dict:
+        context = self._read_header(file_path)
+        if "content" not in context:
+            context["content"] = self._read_content(context, 0, context["content_bytes"]).decode()
         return context
 
     def load_context(self, name: str):
-        """Load a context from file"""
-        file_path = CONTEXT_PATH / f"{name}.json"
-        if not file_path.exists():
-            raise FileNotFoundError(f"Context '{name}' not found")
+        """Load a context, served from the cache when the file is unchanged"""
+        header, body = self._lookup(name, with_body=True)
+        return {**header, "content": body.decode()}
+
+    def read_bytes(self, name: str, start: int, end: int) -> bytes:
+        """Read bytes [start, end) of a context body without loading all of it"""
+        header, body = self._lookup(name)
+        return self._read_content(header, start, end, body)
+
+    def _line_offset(self, header: dict, line: int, body: bytes = None) -> int:
+        """Byte offset of the start of 1-based `line`.
+
+        Seeks to the chunk holding the line using per-chunk newline counts
+        (or the sparse line index of inline contexts), then scans forward.
+        """
+        if "chunks" in header:
+            offset = lines_before = 0
+            for _, length, newlines in header["chunks"]:
+                if lines_before + newlines >= line - 1:
+                    break
+                offset += length
+                lines_before += newlines
+            remaining = line - 1 - lines_before
+        else:
+            checkpoint = min((line - 1) // LINE_INDEX_STEP, len(header["line_index"]) - 1)
+            offset = header["line_index"][checkpoint]
+            remaining = line - 1 - checkpoint * LINE_INDEX_STEP
+        while remaining > 0 and offset < header["content_bytes"]:
+            chunk = self._read_content(
+                header, offset, min(offset + DEFAULT_RANGE_BYTES, header["content_bytes"]), body
+            )
+            pos = 0
+            while remaining > 0:
+                found = chunk.find(b"\n", pos)
+                if found == -1:
+                    break
+                pos = found + 1
+                remaining -= 1
+            offset += pos if remaining == 0 else len(chunk)
+        return min(offset, header["content_bytes"])
+
+    def load_range(self, name: str, offset: int = None, length: int = None,
+                   start_line: int = None, line_count: int = None, section=None) -> dict:
+        """Load part of a context by byte range, line range or section.
+
+        Ranges are snapped to UTF-8 character boundaries; `next_offset` is the
+        byte offset to continue from, or None when the end was reached.
+        """
+        header, body = self._lookup(name)
+        total = header["content_bytes"]
+
+        if section is not None:
+            sections = header["sections"]
+            if isinstance(section, str) and not section.isdigit():
+                matches = [s for s in sections if s["title"] == section]
+                if not matches:
+                    raise ValueError(f"Section '{section}' not found in context '{name}'")
+                selected = matches[0]
+            else:
+                index = int(section)
+                if not 0 <= index < len(sections):
+                    raise ValueError(f"Section index {index} out of range (0-{len(sections) - 1})")
+                selected = sections[index]
+            start, end = selected["offset"], selected["offset"] + selected["length"]
+        elif start_line is not None:
+            start = self._line_offset(header, max(1, int(start_line)), body)
+            if line_count is None:
+                end = total
+            elif int(line_count) < 1:
+                raise ValueError("line_count must be at least 1")
+            else:
+                end = self._line_offset(header, max(1, int(start_line)) + int(line_count), body)
+        else:
+            start = max(0, int(offset or 0))
+            length = int(length if length is not None else DEFAULT_RANGE_BYTES)
+            if length < 1:
+                raise ValueError("length must be at least 1")
+            end = start + length
+
+        start, end = min(start, total), min(end, total)
+        raw = self._read_content(header, start, end, body)
+        head, raw = trim_utf8(raw)
+        start += head
+
+        return {
+            "name": name,
+            "offset": start,
+            "length": len(raw),
+            "total_bytes": total,
+            # None also when nothing was consumed, so paging by next_offset always terminates
+            "next_offset": start + len(raw) if raw and start + len(raw) < total else None,
+            "content": raw.decode(errors="replace")
+        }
 
-        with open(file_path, 'r') as f:
-            return json.load(f)
+    def _chunk_refs(self, header: dict) -> tuple[list[list], int, int]:
+        """Pinned chunk references of a context, chunking inline contexts on the fly.
+
+        Also returns the uncompressed and stored sizes of any chunks written.
+        """
+        if "chunks" in header:
+            digests = [ref[0] for ref in header["chunks"]]
+            if self.chunks.pin(digests):
+                self.chunks.unpin(digests)
+                raise ValueError(f"Context '{header['name']}' was rewritten during the merge, retry")
+            return header["chunks"], 0, 0
+        refs, new_raw, new_bytes = [], 0, 0
+        for chunk in split_chunks(self._read_content(header, 0, header["content_bytes"])):
+            digest, written = self.chunks.put(chunk)
+            refs.append([digest, len(chunk), chunk.count(b"\n")])
+            if written:
+                new_raw += len(chunk)
+                new_bytes += written
+        return refs, new_raw, new_bytes
 
     def merge_contexts(self, names: list[str], merged_name: str):
-        """Merge multiple contexts into one"""
-        contexts = []
+        """Merge multiple contexts into one.
+
+        The merged context references the sources' chunks, so the cost is
+        proportional to the number of chunk references rather than bytes.
+        Source headers come from the shared context cache. The search index
+        picks the merged context up on its next refresh.
+        """
+        started = time.perf_counter()
+        headers = []
         for name in names:
             try:
-                ctx = self.load_context(name)
-                contexts.append(ctx)
+                headers.append(self._lookup(name)[0])
             except FileNotFoundError:
                 pass
 
-        if not contexts:
+        if not headers:
             raise ValueError("No valid contexts found to merge")
 
-        merged_content = "\n\n---\n\n".join([ctx["content"] for ctx in contexts])
-        merged_metadata = {
-            "source_contexts": names,
-            "merged_at": datetime.now().isoformat()
-        }
+        separator = MERGE_SEPARATOR.encode()
+        separator_digest, new_bytes = self.chunks.put(separator)
+        new_raw = len(separator) if new_bytes else 0
+        pinned = [separator_digest]
+        try:
+            chunk_refs, sections = [], []
+            offset = chars = lines = 0
+            for i, header in enumerate(headers):
+                if i:
+                    chunk_refs.append([separator_digest, len(separator), separator.count(b"\n")])
+                    sections[-1]["length"] += len(separator)
+                    offset += len(separator)
+                    chars += len(MERGE_SEPARATOR)
+                refs, written_raw, written = self._chunk_refs(header)
+                new_raw += written_raw
+                new_bytes += written
+                pinned.extend(ref[0] for ref in refs)
+                chunk_refs.extend(refs)
+                sections.extend(
+                    {**section, "offset": section["offset"] + offset} for section in header["sections"]
+                )
+                offset += header["content_bytes"]
+                chars += header.get("content_chars", header["content_bytes"])
+                lines += header["line_count"] - 1
 
-        return self.save_context(merged_name, merged_content, merged_metadata)
+            merged_header = {
+                "name": merged_name,
+                "metadata": {
+                    "source_contexts": names,
+                    "merged_at": datetime.now().isoformat()
+                },
+                "created_at": datetime.now().isoformat(),
+                "updated_at": datetime.now().isoformat(),
+                "content_bytes": offset,
+                "content_chars": chars,
+                "line_count": lines + separator.count(b"\n") * (len(headers) - 1) + 1,
+                "sections": sections
+            }
+            return self._write_header(merged_header, chunk_refs, new_raw, new_bytes, started)
+        finally:
+            self.chunks.unpin(pinned)
 
     def search_contexts(self, query: str, limit: int = 5):
-        """Search contexts by keyword"""
-        results = []
-        for file_path in CONTEXT_PATH.glob("*.json"):
+        """Search contexts by keyword, ranked with BM25"""
+        self.index.refresh(CONTEXT_PATH, self._load_file)
+        return self.index.search(query, int(limit), self.read_bytes)
+
+class StoragePool:
+    """Runs blocking storage operations on a bounded thread pool.
+
+    Writes to the same context name are serialized by per-name locks while
+    unrelated operations run concurrently. Queue wait (submit to start) and
+    execution time are tracked per operation.
+    """
+
+    def __init__(self, workers: int, max_pending: int):
+        self.workers = workers
+        self.executor = ThreadPoolExecutor(max_workers=workers, thread_name_prefix="context-io")
+        self.pending = asyncio.Semaphore(max_pending)
+        self.locks: weakref.WeakValueDictionary[str, asyncio.Lock] = weakref.WeakValueDictionary()
+        self.in_flight = 0
+        self.operations: dict[str, dict] = {}
+
+    def _lock(self, name: str) -> asyncio.Lock:
+        lock = self.locks.get(name)
+        if lock is None:
+            lock = self.locks[name] = asyncio.Lock()
+        return lock
+
+    def _record(self, operation: str, wait: float, elapsed: float, failed: bool):
+        stats = self.operations.setdefault(operation, {
+            "count": 0, "errors": 0,
+            "wait_ms_total": 0.0, "wait_ms_max": 0.0,
+            "exec_ms_total": 0.0, "exec_ms_max": 0.0
+        })
+        stats["count"] += 1
+        stats["errors"] += failed
+        stats["wait_ms_total"] += wait * 1000
+        stats["wait_ms_max"] = max(stats["wait_ms_max"], wait * 1000)
+        stats["exec_ms_total"] += elapsed * 1000
+        stats["exec_ms_max"] = max(stats["exec_ms_max"], elapsed * 1000)
+
+    async def run(self, operation: str, func: Callable, *args, lock: str = None):
+        """Run func(*args) on the pool, holding the per-name lock `lock` if given"""
+        submitted = time.perf_counter()
+        timing = {}
+
+        def timed():
+            timing["started"] = time.perf_counter()
             try:
-                with open(file_path, 'r') as f:
-                    context = json.load(f)
-                    if query.lower() in context["content"].lower():
-                        results.append({
-                            "name": context["name"],
-                            "snippet": context["content"][:200] + "...",
-                            "created_at": context["created_at"]
-                        })
-            except (json.JSONDecodeError, KeyError):
-                continue
+                return func(*args)
+            finally:
+                timing["finished"] = time.perf_counter()
 
-        return results[:limit]
+        async with self.pending:
+            name_lock = self._lock(lock) if lock is not None else None
+            if name_lock is not None:
+                await name_lock.acquire()
+            self.in_flight += 1
+            failed = True
+            try:
+                result = await asyncio.get_running_loop().run_in_executor(self.executor, timed)
+                failed = False
+                return result
+            finally:
+                self.in_flight -= 1
+                if name_lock is not None:
+                    name_lock.release()
+                started = timing.get("started", time.perf_counter())
+                self._record(
+                    operation,
+                    started - submitted,
+                    timing.get("finished", started) - started,
+                    failed
+                )
+
+    def stats(self) -> dict:
+        operations = {}
+        for operation, stats in self.operations.items():
+            count = stats["count"] or 1
+            operations[operation] = {
+                "count": stats["count"],
+                "errors": stats["errors"],
+                "wait_ms_avg": round(stats["wait_ms_total"] / count, 3),
+                "wait_ms_max": round(stats["wait_ms_max"], 3),
+                "exec_ms_avg": round(stats["exec_ms_total"] / count, 3),
+                "exec_ms_max": round(stats["exec_ms_max"], 3)
+            }
+        return {
+            "workers": self.workers,
+            "in_flight": self.in_flight,
+            "operations": operations
+        }
 
 context_manager = ContextManager()
+storage_pool = StoragePool(CONTEXT_WORKERS, CONTEXT_MAX_PENDING)
+
+def strip_layout(context: dict) -> dict:
+    """Drop storage internals from a context before returning it to clients"""
+    for key in ("line_index", "storage"):
+        context.pop(key, None)
+    if "chunks" in context:
+        context["chunk_count"] = len(context.pop("chunks"))
+    return context
+
+def format_storage(storage: dict) -> str:
+    ratio = f"compression ratio {storage['ratio']}x" if storage["ratio"] else "no new chunks"
+    return (
+        f"{storage['codec']} level {storage['level']}: {storage['raw_bytes']} bytes in "
+        f"{storage['chunks']} chunks, {storage['new_chunk_bytes']} new bytes written, "
+        f"{ratio}, {storage['dedup_saved_bytes']} bytes deduplicated, "
+        f"{storage['collected_chunks']} unreferenced chunks removed, "
+        f"write {storage['write_ms']} ms"
+    )
 
 @server.list_tools()
 async def list_tools() -> list[Tool]:
@@ -103,11 +1071,24 @@ async def list_tools() -> list[Tool]:
         ),
         Tool(
             name="context_load",
-            description="Load a previously saved context",
+            description=(
+                "Load a previously saved context. Large contexts can be read in parts by "
+                "byte range (offset/length), line range (start_line/line_count) or section; "
+                "metadata_only returns the header with size, line count and section list."
+            ),
             inputSchema={
                 "type": "object",
                 "properties": {
-                    "name": {"type": "string", "description": "Context name to load"}
+                    "name": {"type": "string", "description": "Context name to load"},
+                    "metadata_only": {"type": "boolean", "default": False, "description": "Return only metadata and layout, no content"},
+                    "offset": {"type": "number", "description": "Byte offset to start reading from"},
+                    "length": {"type": "number", "minimum": 1, "description": f"Max bytes to read (default {DEFAULT_RANGE_BYTES})"},
+                    "start_line": {"type": "number", "description": "1-based line to start reading from"},
+                    "line_count": {"type": "number", "minimum": 1, "description": "Number of lines to read (default: to the end)"},
+                    "section": {
+                        "type": ["string", "number"],
+                        "description": "Markdown section to read, by heading title or index"
+                    }
                 },
                 "required": ["name"]
             }
@@ -130,7 +1111,7 @@ async def list_tools() -> list[Tool]:
         ),
         Tool(
             name="context_search",
-            description="Search for contexts containing a keyword",
+            description="Search saved contexts by keywords, ranked by relevance (BM25)",
             inputSchema={
                 "type": "object",
                 "properties": {
@@ -139,41 +1120,82 @@ async def list_tools() -> list[Tool]:
                 },
                 "required": ["query"]
             }
+        ),
+        Tool(
+            name="context_stats",
+            description="Get storage worker pool, context cache and search index statistics",
+            inputSchema={
+                "type": "object",
+                "properties": {}
+            }
         )
     ]
 
 @server.call_tool()
 async def call_tool(name: str, arguments: Any) -> list[TextContent]:
     if name == "context_save":
-        result = context_manager.save_context(
+        result = await storage_pool.run(
+            "save",
+            context_manager.save_context,
             arguments["name"],
             arguments["content"],
-            arguments.get("metadata")
+            arguments.get("metadata"),
+            lock=arguments["name"]
         )
         return [TextContent(
             type="text",
-            text=f"Saved context '{result['name']}' with {len(result['content'])} characters"
+            text=(
+                f"Saved context '{result['name']}' with {len(result['content'])} characters "
+                f"({format_storage(result['storage'])})"
+            )
         )]
 
     elif name == "context_load":
-        context = context_manager.load_context(arguments["name"])
+        if arguments.get("metadata_only", False):
+            header = await storage_pool.run("load_metadata", context_manager.load_header, arguments["name"])
+            return [TextContent(type="text", text=json.dumps(strip_layout(header), indent=2))]
+
+        range_keys = ("offset", "length", "start_line", "line_count", "section")
+        if any(arguments.get(key) is not None for key in range_keys):
+            result = await storage_pool.run(
+                "load_range",
+                lambda: context_manager.load_range(
+                    arguments["name"],
+                    offset=arguments.get("offset"),
+                    length=arguments.get("length"),
+                    start_line=arguments.get("start_line"),
+                    line_count=arguments.get("line_count"),
+                    section=arguments.get("section")
+                )
+            )
+            return [TextContent(type="text", text=json.dumps(result))]
+
+        context = await storage_pool.run("load", context_manager.load_context, arguments["name"])
         return [TextContent(
             type="text",
-            text=json.dumps(context, indent=2)
+            text=json.dumps(strip_layout(context))
         )]
 
     elif name == "context_merge":
-        result = context_manager.merge_contexts(
+        result = await storage_pool.run(
+            "merge",
+            context_manager.merge_contexts,
             arguments["names"],
-            arguments["merged_name"]
+            arguments["merged_name"],
+            lock=arguments["merged_name"]
         )
         return [TextContent(
             type="text",
-            text=f"Merged {len(arguments['names'])} contexts into '{result['name']}'"
+            text=(
+                f"Merged {len(arguments['names'])} contexts into '{result['name']}' "
+                f"({format_storage(result['storage'])})"
+            )
         )]
 
     elif name == "context_search":
-        results = context_manager.search_contexts(
+        results = await storage_pool.run(
+            "search",
+            context_manager.search_contexts,
             arguments["query"],
             arguments.get("limit", 5)
         )
@@ -182,6 +1204,18 @@ async def call_tool(name: str, arguments: Any) -> list[TextContent]:
             text=json.dumps(results, indent=2)
         )]
 
+    elif name == "context_stats":
+        stats = {
+            "storage": storage_pool.stats(),
+            "cache": context_manager.cache.stats(),
+            "chunks": context_manager.chunks.stats(),
+            "index": await storage_pool.run("index_stats", context_manager.index.stats)
+        }
+        return [TextContent(
+            type="text",
+            text=json.dumps(stats, indent=2)
+        )]
+
     raise ValueError(f"Unknown tool: {name}")
 
 async def main():
@@ -189,5 +1223,4 @@ async def main():
         await server.run(read_stream, write_stream, server.create_initialization_options())
 
 if __name__ == "__main__":
-    import asyncio
     asyncio.run(main())
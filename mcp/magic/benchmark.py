@@ -0,0 +1,104 @@
+#!/usr/bin/env python3
+"""Magic server benchmark - concurrent AI calls against the local stub API
+
+Starts stub_server.py in-process, points the server at it and compares one
+call_ai() round trip with N concurrent ones. With the pooled async client
+N calls (N <= MAGIC_MAX_CONCURRENCY) should take about as long as one.
+With --stream the calls stream SSE chunks and the report adds
+time-to-first-token and tokens/sec. The fault options make the stub fail
+or stall a share of requests; the report then adds the dispatcher's
+retry, circuit breaker, fallback and hedging counters.
+
+Usage:
+    python benchmark.py --calls 8 --delay 0.5
+    python benchmark.py --calls 8 --stream --tokens 100 --token-delay 0.01
+    python benchmark.py --calls 50 --concurrency 4 --delay 0.05 --fail-rate 0.2 --fail-status 429 \
+        --slow-rate 0.1 --slow-delay 2 --hedge-after p95 --models primary/model,backup/model
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import time
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--calls", type=int, default=8, help="Concurrent calls")
+    parser.add_argument("--delay", type=float, default=0.5, help="Stub reply delay in seconds")
+    parser.add_argument("--concurrency", type=int, default=None,
+                        help="MAGIC_MAX_CONCURRENCY (default: --calls)")
+    parser.add_argument("--stream", action="store_true", help="Use streaming completions")
+    parser.add_argument("--tokens", type=int, default=20, help="Chunks per streamed stub reply")
+    parser.add_argument("--token-delay", type=float, default=0.02, help="Seconds between streamed chunks")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="Fraction of stub requests that fail")
+    parser.add_argument("--fail-status", type=int, default=503, help="HTTP status of injected failures")
+    parser.add_argument("--fail-models", default="", help="Comma-separated models the stub always fails")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="Fraction of stub requests that stall")
+    parser.add_argument("--slow-delay", type=float, default=2.0, help="Reply delay of stalled requests")
+    parser.add_argument("--hedge-after", default="", help="MAGIC_HEDGE_AFTER (\"p95\" or seconds)")
+    parser.add_argument("--models", default="", help="MAGIC_MODELS fallback list")
+    return parser.parse_args()
+
+async def benchmark(args):
+    import server
+
+    started = time.perf_counter()
+    await server.call_ai("warm up the connection pool", stream=args.stream)
+    single = time.perf_counter() - started
+    if args.hedge_after == "p95":
+        # The p95 threshold needs a latency history before hedging starts
+        for i in range(20):
+            await server.call_ai(f"latency sample {i}")
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(
+        server.call_ai(f"concurrent call {i}", stream=args.stream) for i in range(args.calls)
+    ))
+    concurrent = time.perf_counter() - started
+    errors = [r for r in results if r.startswith("[AI")]
+
+    await server.get_ai_client().close()
+    report = {
+        "calls": args.calls,
+        "max_concurrency": server.MAGIC_MAX_CONCURRENCY,
+        "stub_delay": args.delay,
+        "single_seconds": round(single, 3),
+        "concurrent_seconds": round(concurrent, 3),
+        "speedup_vs_serial": round(single * args.calls / concurrent, 2) if concurrent else None,
+        "errors": errors[:3]
+    }
+    if args.stream:
+        report["streaming"] = server.stream_stats.report()
+    if args.fail_rate or args.fail_models or args.slow_rate or args.hedge_after:
+        report["dispatch"] = server.dispatcher.report()
+    return report
+
+def main():
+    args = parse_args()
+    here = os.path.dirname(os.path.abspath(__file__))
+    sys.path.insert(0, here)
+    from stub_server import start_stub
+
+    httpd = start_stub(
+        delay=args.delay, tokens=args.tokens, token_delay=args.token_delay,
+        fail_rate=args.fail_rate, fail_status=args.fail_status,
+        fail_models=[m for m in args.fail_models.split(",") if m],
+        slow_rate=args.slow_rate, slow_delay=args.slow_delay
+    )
+    os.environ["OPENROUTER_BASE_URL"] = f"http://127.0.0.1:{httpd.server_address[1]}"
+    os.environ["OPENROUTER_API_KEY"] = "stub"
+    os.environ["MAGIC_MAX_CONCURRENCY"] = str(args.concurrency or args.calls)
+    os.environ["MAGIC_HEDGE_AFTER"] = args.hedge_after
+    if args.models:
+        os.environ["MAGIC_MODELS"] = args.models
+    try:
+        report = asyncio.run(benchmark(args))
+        report["stub_requests"] = httpd.requests
+    finally:
+        httpd.shutdown()
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
@@ -1,8 +1,20 @@
 #!/usr/bin/env python3
 """Magic MCP Server - AI-powered utilities and transformations"""
 
+import asyncio
+import contextvars
+import csv
+import hashlib
+import io
+import itertools
 import json
 import os
+import random
+import re
+import sqlite3
+import time
+from collections import OrderedDict, deque
+from functools import lru_cache, partial
 from typing import Any
 
 from mcp.server import Server
@@ -10,7 +22,8 @@ from mcp.server.stdio import stdio_server
 from mcp.types import Tool, TextContent
 
 try:
-    import openai
+    import httpx
+    from openai import APIConnectionError, APIStatusError, AsyncOpenAI
     OPENAI_AVAILABLE = True
 except ImportError:
     OPENAI_AVAILABLE = False
@@ -19,9 +32,256 @@ server = Server("magic")
 
 # Configure OpenRouter API
 OPENROUTER_API_KEY = os.getenv("OPENROUTER_API_KEY", "")
-if OPENROUTER_API_KEY and OPENAI_AVAILABLE:
-    openai.api_key = OPENROUTER_API_KEY
-    openai.api_base = "https://openrouter.ai/api/v1"
+OPENROUTER_BASE_URL = os.getenv("OPENROUTER_BASE_URL", "https://openrouter.ai/api/v1")
+MAGIC_MODEL = os.getenv("MAGIC_MODEL", "anthropic/claude-3-haiku")
+# Comma-separated fallback order, tried left to right (default: MAGIC_MODEL only)
+MAGIC_MODELS = [m.strip() for m in os.getenv("MAGIC_MODELS", MAGIC_MODEL).split(",") if m.strip()]
+# Max upstream requests in flight; extra calls wait for a free slot
+MAGIC_MAX_CONCURRENCY = int(os.getenv("MAGIC_MAX_CONCURRENCY", "8"))
+# Per-request timeout in seconds
+MAGIC_TIMEOUT = float(os.getenv("MAGIC_TIMEOUT", "60"))
+
+# Response cache: in-memory LRU entries, optional SQLite file for the disk tier
+MAGIC_CACHE_ENTRIES = int(os.getenv("MAGIC_CACHE_ENTRIES", "512"))
+MAGIC_CACHE_PATH = os.getenv("MAGIC_CACHE_PATH", "")
+# Default TTL in seconds (0 disables caching) and per-tool overrides, e.g. "magic_generate=600,magic_analyze=86400"
+MAGIC_CACHE_TTL = float(os.getenv("MAGIC_CACHE_TTL", "3600"))
+MAGIC_CACHE_TTLS = os.getenv("MAGIC_CACHE_TTLS", "")
+
+# Chunked map-reduce: inputs longer than MAGIC_CHUNK_CHARS are split and
+# at most MAGIC_MAP_CONCURRENCY chunks of one call are processed at once
+MAGIC_CHUNK_CHARS = int(os.getenv("MAGIC_CHUNK_CHARS", "12000"))
+MAGIC_MAP_CONCURRENCY = int(os.getenv("MAGIC_MAP_CONCURRENCY", str(MAGIC_MAX_CONCURRENCY)))
+
+# Streaming: forward tokens as MCP progress notifications, batched every MAGIC_STREAM_INTERVAL seconds
+MAGIC_STREAM = os.getenv("MAGIC_STREAM", "false").lower() in ("1", "true", "yes")
+MAGIC_STREAM_INTERVAL = float(os.getenv("MAGIC_STREAM_INTERVAL", "0.1"))
+
+# Dispatch: retries with jittered exponential backoff, per-model circuit breaker, hedging
+MAGIC_RETRIES = int(os.getenv("MAGIC_RETRIES", "2"))
+MAGIC_BACKOFF_BASE = float(os.getenv("MAGIC_BACKOFF_BASE", "0.5"))
+MAGIC_BACKOFF_MAX = float(os.getenv("MAGIC_BACKOFF_MAX", "8"))
+# Consecutive failures that open a model's circuit, and seconds before a trial request
+MAGIC_BREAKER_THRESHOLD = int(os.getenv("MAGIC_BREAKER_THRESHOLD", "5"))
+MAGIC_BREAKER_COOLDOWN = float(os.getenv("MAGIC_BREAKER_COOLDOWN", "30"))
+# Send a duplicate request when the first is slower than this: "" (off), "p95" or seconds
+MAGIC_HEDGE_AFTER = os.getenv("MAGIC_HEDGE_AFTER", "")
+
+# Accounting: recent calls kept for percentiles/histograms, optional JSONL log of every call
+MAGIC_STATS_WINDOW = int(os.getenv("MAGIC_STATS_WINDOW", "1000"))
+MAGIC_STATS_PATH = os.getenv("MAGIC_STATS_PATH", "")
+# Directory magic_stats exports are written to (default: the directory of MAGIC_STATS_PATH; unset disables exports)
+MAGIC_STATS_EXPORT_DIR = os.getenv(
+    "MAGIC_STATS_EXPORT_DIR", os.path.dirname(os.path.abspath(MAGIC_STATS_PATH)) if MAGIC_STATS_PATH else ""
+)
+# USD per million tokens, e.g. "anthropic/claude-3-haiku=0.25:1.25" (prompt:completion)
+MAGIC_PRICES = os.getenv("MAGIC_PRICES", "")
+# Prompt-size guard: estimated token limit per request, and "trim" or "reject" when exceeded
+MAGIC_MAX_PROMPT_TOKENS = int(os.getenv("MAGIC_MAX_PROMPT_TOKENS", "50000"))
+MAGIC_PROMPT_GUARD = os.getenv("MAGIC_PROMPT_GUARD", "trim").lower()
+
+ai_client = None
+ai_slots = asyncio.Semaphore(MAGIC_MAX_CONCURRENCY)
+
+def get_ai_client():
+    """Get or create the async client sharing one pooled keep-alive connection pool"""
+    global ai_client
+    if ai_client is None:
+        ai_client = AsyncOpenAI(
+            api_key=OPENROUTER_API_KEY,
+            base_url=OPENROUTER_BASE_URL,
+            timeout=MAGIC_TIMEOUT,
+            max_retries=0,
+            http_client=httpx.AsyncClient(
+                limits=httpx.Limits(
+                    max_connections=MAGIC_MAX_CONCURRENCY,
+                    max_keepalive_connections=MAGIC_MAX_CONCURRENCY,
+                    keepalive_expiry=60
+                ),
+                timeout=MAGIC_TIMEOUT
+            )
+        )
+    return ai_client
+
+class ResponseCache:
+    """LRU + optional SQLite cache of completions keyed by request hash.
+
+    Concurrent identical requests share one upstream call (single-flight).
+    The call runs as its own task, so a cancelled caller only stops waiting;
+    the call itself is cancelled once no caller is left. Failed calls are
+    never cached.
+    """
+
+    def __init__(self, max_entries: int, path: str = "", default_ttl: float = 3600, ttls: str = ""):
+        self.max_entries = max_entries
+        self.default_ttl = default_ttl
+        self.ttls = {}
+        for item in filter(None, (part.strip() for part in ttls.split(","))):
+            tool, _, seconds = item.partition("=")
+            self.ttls[tool.strip()] = float(seconds)
+        self.entries: OrderedDict[str, tuple] = OrderedDict()
+        # key -> [task, number of callers awaiting it]
+        self.inflight: dict[str, list] = {}
+        self.stats = {
+            "hits": 0, "disk_hits": 0, "misses": 0, "coalesced": 0,
+            "evictions": 0, "saved_tokens": 0, "saved_seconds": 0.0
+        }
+        self.db = None
+        if path:
+            os.makedirs(os.path.dirname(os.path.abspath(path)), exist_ok=True)
+            self.db = sqlite3.connect(path)
+            self.db.execute("PRAGMA journal_mode=WAL")
+            self.db.execute("""
+                CREATE TABLE IF NOT EXISTS responses (
+                    key TEXT PRIMARY KEY,
+                    text TEXT NOT NULL,
+                    tokens INTEGER NOT NULL,
+                    seconds REAL NOT NULL,
+                    expires REAL NOT NULL
+                )
+            """)
+            self.db.execute("DELETE FROM responses WHERE expires < ?", (time.time(),))
+            self.db.commit()
+
+    @staticmethod
+    def key(*parts) -> str:
+        return hashlib.sha256(json.dumps(parts, sort_keys=True).encode("utf-8")).hexdigest()
+
+    def ttl(self, tool: str = None) -> float:
+        return self.ttls.get(tool, self.default_ttl)
+
+    def _get(self, key: str):
+        entry = self.entries.get(key)
+        if entry is not None:
+            if entry[3] >= time.time():
+                self.entries.move_to_end(key)
+                self.stats["hits"] += 1
+                return entry
+            del self.entries[key]
+        if self.db is not None:
+            row = self.db.execute(
+                "SELECT text, tokens, seconds, expires FROM responses WHERE key = ? AND expires >= ?",
+                (key, time.time())
+            ).fetchone()
+            if row:
+                self._remember(key, tuple(row))
+                self.stats["disk_hits"] += 1
+                return row
+        return None
+
+    def _remember(self, key: str, entry: tuple):
+        self.entries[key] = entry
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.max_entries:
+            self.entries.popitem(last=False)
+            self.stats["evictions"] += 1
+
+    def _put(self, key: str, text: str, tokens: int, seconds: float, ttl: float):
+        entry = (text, tokens, seconds, time.time() + ttl)
+        self._remember(key, entry)
+        if self.db is not None:
+            self.db.execute("INSERT OR REPLACE INTO responses VALUES (?, ?, ?, ?, ?)", (key, *entry))
+            self.db.commit()
+
+    async def get_or_call(self, key: str, ttl: float, call) -> str:
+        """Return a cached completion or await `call()` -> (text, tokens) once per key"""
+        if ttl > 0:
+            entry = self._get(key)
+            if entry is not None:
+                self.stats["saved_tokens"] += entry[1]
+                self.stats["saved_seconds"] += entry[2]
+                return entry[0]
+
+        flight = self.inflight.get(key)
+        if flight is not None:
+            self.stats["coalesced"] += 1
+        else:
+            self.stats["misses"] += 1
+            flight = self.inflight[key] = [asyncio.create_task(self._fill(key, ttl, call)), 0]
+            flight[0].add_done_callback(partial(self._settle, key, flight))
+
+        task = flight[0]
+        flight[1] += 1
+        try:
+            return await asyncio.shield(task)
+        except asyncio.CancelledError:
+            if flight[1] == 1 and not task.done():
+                # Last caller gone: stop the upstream call and let the next caller start afresh
+                self._settle(key, flight, task)
+                task.cancel()
+            raise
+        finally:
+            flight[1] -= 1
+
+    async def _fill(self, key: str, ttl: float, call) -> str:
+        started = time.perf_counter()
+        text, tokens = await call()
+        if ttl > 0:
+            self._put(key, text, tokens, time.perf_counter() - started, ttl)
+        return text
+
+    def _settle(self, key: str, flight: list, task: asyncio.Task):
+        if self.inflight.get(key) is flight:
+            del self.inflight[key]
+        if task.done() and not task.cancelled():
+            # Mark retrieved so a failure nobody awaited is not logged
+            task.exception()
+
+    def clear(self):
+        self.entries.clear()
+        if self.db is not None:
+            self.db.execute("DELETE FROM responses")
+            self.db.commit()
+
+    def report(self) -> dict:
+        lookups = self.stats["hits"] + self.stats["disk_hits"] + self.stats["misses"] + self.stats["coalesced"]
+        served = lookups - self.stats["misses"]
+        report = dict(self.stats)
+        report["saved_seconds"] = round(report["saved_seconds"], 3)
+        report["hit_rate"] = round(served / lookups, 3) if lookups else None
+        report["entries"] = len(self.entries)
+        report["max_entries"] = self.max_entries
+        report["disk"] = self.db.execute("SELECT COUNT(*) FROM responses").fetchone()[0] if self.db else None
+        report["ttls"] = {"default": self.default_ttl, **self.ttls}
+        return report
+
+response_cache = ResponseCache(MAGIC_CACHE_ENTRIES, MAGIC_CACHE_PATH, MAGIC_CACHE_TTL, MAGIC_CACHE_TTLS)
+
+class StreamStats:
+    """Time-to-first-token and decode throughput of recent streamed calls"""
+
+    def __init__(self, window: int = 256):
+        self.calls = 0
+        self.samples = deque(maxlen=window)
+
+    def record(self, ttft: float, tokens: int, decode_seconds: float):
+        self.calls += 1
+        rate = tokens / decode_seconds if tokens > 1 and decode_seconds > 0 else None
+        self.samples.append((ttft, tokens, rate))
+
+    def report(self) -> dict:
+        if not self.samples:
+            return {"calls": self.calls}
+        ttfts = sorted(sample[0] for sample in self.samples)
+        rates = [sample[2] for sample in self.samples if sample[2] is not None]
+        last = self.samples[-1]
+        return {
+            "calls": self.calls,
+            "window": len(self.samples),
+            "ttft_ms": {
+                "avg": round(sum(ttfts) / len(ttfts) * 1000, 1),
+                "p50": round(ttfts[len(ttfts) // 2] * 1000, 1),
+                "p95": round(ttfts[min(len(ttfts) - 1, int(len(ttfts) * 0.95))] * 1000, 1)
+            },
+            "tokens_per_sec": round(sum(rates) / len(rates), 1) if rates else None,
+            "last": {
+                "ttft_ms": round(last[0] * 1000, 1),
+                "tokens": last[1],
+                "tokens_per_sec": round(last[2], 1) if last[2] else None
+            }
+        }
+
+stream_stats = StreamStats()
 
 @server.list_tools()
 async def list_tools() -> list[Tool]:
@@ -34,7 +294,11 @@ async def list_tools() -> list[Tool]:
                 "properties": {
                     "data": {"type": "string", "description": "Data to transform"},
                     "transformation": {"type": "string", "description": "Transformation description"},
-                    "format": {"type": "string", "description": "Output format", "default": "text"}
+                    "format": {"type": "string", "description": "Output format", "default": "text"},
+                    "input_format": {"type": "string", "description": "Format of data; with csv or tsv the header row is repeated in every chunk (default: format)"},
+                    "chunked": {"type": "boolean", "description": "Split data into chunks processed concurrently (default: automatic for data longer than chunk_size)"},
+                    "chunk_size": {"type": "integer", "description": "Max characters per chunk", "default": MAGIC_CHUNK_CHARS},
+                    "stream": {"type": "boolean", "description": "Stream tokens as progress notifications", "default": MAGIC_STREAM}
                 },
                 "required": ["data", "transformation"]
             }
@@ -50,7 +314,10 @@ async def list_tools() -> list[Tool]:
                         "type": "string",
                         "enum": ["structure", "pattern", "sentiment", "summary"],
                         "description": "Type of analysis"
-                    }
+                    },
+                    "chunked": {"type": "boolean", "description": "Split data into chunks processed concurrently (default: automatic for data longer than chunk_size)"},
+                    "chunk_size": {"type": "integer", "description": "Max characters per chunk", "default": MAGIC_CHUNK_CHARS},
+                    "stream": {"type": "boolean", "description": "Stream tokens as progress notifications", "default": MAGIC_STREAM}
                 },
                 "required": ["data", "analysis_type"]
             }
@@ -63,59 +330,987 @@ async def list_tools() -> list[Tool]:
                 "properties": {
                     "description": {"type": "string", "description": "What to generate"},
                     "language": {"type": "string", "description": "Programming language or format"},
-                    "style": {"type": "string", "description": "Style guidelines"}
+                    "style": {"type": "string", "description": "Style guidelines"},
+                    "stream": {"type": "boolean", "description": "Stream tokens as progress notifications", "default": MAGIC_STREAM}
                 },
                 "required": ["description"]
             }
         ),
         Tool(
             name="magic_execute",
-            description="Execute advanced AI-powered operations",
+            description="Execute local deterministic operations without an AI call: reverse, count_words, to_json, "
+                        "csv_to_json, json_to_csv, a single pipeline op, or a chained pipeline",
             inputSchema={
                 "type": "object",
                 "properties": {
-                    "command": {"type": "string", "description": "Command to execute"},
-                    "parameters": {"type": "object", "description": "Command parameters"}
+                    "command": {
+                        "type": "string",
+                        "description": "reverse, count_words, to_json, csv_to_json, json_to_csv, pipeline, or one of: "
+                                       + ", ".join(PIPELINE_OPS)
+                    },
+                    "parameters": {
+                        "type": "object",
+                        "description": "Command parameters. Pipelines take input, steps ([{op, ...args}]), "
+                                       "input_format (json|jsonl|csv|lines|text) and output_format"
+                    }
                 },
                 "required": ["command"]
             }
+        ),
+        Tool(
+            name="magic_stats",
+            description="Show token usage, latency/queue histograms per tool and model, cache, dispatch and streaming statistics",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "clear_cache": {"type": "boolean", "description": "Empty the response cache", "default": False},
+                    "export_name": {"type": "string", "description": "Write recent per-call records to this JSONL file name in MAGIC_STATS_EXPORT_DIR"}
+                }
+            }
         )
     ]
 
-async def call_ai(prompt: str, system_message: str = "") -> str:
-    """Call AI API if available, otherwise return placeholder"""
+CHARS_PER_TOKEN = 4
+
+def estimate_tokens(text: str) -> int:
+    """Rough token count for English-like text"""
+    return (len(text) + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN
+
+LATENCY_BUCKETS_MS = (50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000)
+
+def percentile(sorted_values: list, fraction: float):
+    if not sorted_values:
+        return None
+    return sorted_values[min(len(sorted_values) - 1, int(len(sorted_values) * fraction))]
+
+def parse_prices(spec: str) -> dict:
+    prices = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        model, _, rates = item.rpartition("=")
+        prompt_rate, _, completion_rate = rates.partition(":")
+        prices[model.strip()] = (float(prompt_rate), float(completion_rate or prompt_rate))
+    return prices
+
+current_tool = contextvars.ContextVar("current_tool", default=None)
+
+class Accounting:
+    """Per-call token, latency and queueing records with totals per tool and model"""
+
+    def __init__(self, window: int, path: str = "", prices: str = ""):
+        self.calls = deque(maxlen=window)
+        self.path = path
+        self.prices = parse_prices(prices)
+        self.totals: dict[str, dict] = {"tool": {}, "model": {}}
+        self.guard = {"trimmed": 0, "rejected": 0}
+        self.started = time.time()
+
+    def cost(self, model: str, prompt_tokens: int, completion_tokens: int):
+        if model not in self.prices:
+            return None
+        prompt_rate, completion_rate = self.prices[model]
+        return (prompt_tokens * prompt_rate + completion_tokens * completion_rate) / 1_000_000
+
+    def record(self, model: str, queue: float, latency: float, prompt_tokens: int = 0,
+               completion_tokens: int = 0, error: Exception = None, stream: bool = False):
+        call = {
+            "ts": round(time.time(), 3),
+            "tool": current_tool.get() or "call_ai",
+            "model": model,
+            "prompt_tokens": prompt_tokens,
+            "completion_tokens": completion_tokens,
+            "latency_ms": round(latency * 1000, 1),
+            "queue_ms": round(queue * 1000, 1),
+            "stream": stream,
+            "error": type(error).__name__ if error else None
+        }
+        cost = self.cost(model, prompt_tokens, completion_tokens)
+        if cost is not None:
+            call["cost_usd"] = round(cost, 6)
+        self.calls.append(call)
+
+        for kind in ("tool", "model"):
+            totals = self.totals[kind].setdefault(call[kind], {
+                "calls": 0, "errors": 0, "prompt_tokens": 0, "completion_tokens": 0,
+                "latency_ms": 0.0, "queue_ms": 0.0, "cost_usd": 0.0
+            })
+            totals["calls"] += 1
+            totals["errors"] += 1 if error else 0
+            totals["prompt_tokens"] += prompt_tokens
+            totals["completion_tokens"] += completion_tokens
+            totals["latency_ms"] += call["latency_ms"]
+            totals["queue_ms"] += call["queue_ms"]
+            totals["cost_usd"] += cost or 0.0
+
+        if self.path:
+            try:
+                with open(self.path, "a", encoding="utf-8") as f:
+                    f.write(json.dumps(call) + "\n")
+            except OSError:
+                pass  # Stats logging must never fail a call
+
+    def export(self, directory: str, name: str) -> tuple[str, int]:
+        """Write the recent-call window as JSONL to a file named `name` in `directory`.
+
+        Only a plain file name is accepted, so callers cannot write outside the
+        configured export directory. Returns the path and the number of records.
+        """
+        if not directory:
+            raise ValueError("exports are disabled; set MAGIC_STATS_EXPORT_DIR or MAGIC_STATS_PATH")
+        if not name or name != os.path.basename(name) or name.startswith("."):
+            raise ValueError(f"export_name must be a plain file name, got {name!r}")
+        path = os.path.join(directory, name)
+        if self.path and os.path.abspath(path) == os.path.abspath(self.path):
+            raise ValueError("export_name must not overwrite the MAGIC_STATS_PATH log")
+        with open(path, "w", encoding="utf-8") as f:
+            for call in self.calls:
+                f.write(json.dumps(call) + "\n")
+        return path, len(self.calls)
+
+    @staticmethod
+    def summarize(calls: list, histogram: bool = True) -> dict:
+        latencies = sorted(call["latency_ms"] for call in calls if not call["error"])
+        queues = sorted(call["queue_ms"] for call in calls)
+        summary = {
+            "calls": len(calls),
+            "errors": sum(1 for call in calls if call["error"]),
+            "latency_ms": {
+                "p50": percentile(latencies, 0.5), "p95": percentile(latencies, 0.95),
+                "p99": percentile(latencies, 0.99), "max": latencies[-1] if latencies else None
+            },
+            "queue_ms": {"p50": percentile(queues, 0.5), "p95": percentile(queues, 0.95),
+                         "max": queues[-1] if queues else None}
+        }
+        if histogram:
+            buckets = {f"<={bound}": 0 for bound in LATENCY_BUCKETS_MS}
+            buckets[f">{LATENCY_BUCKETS_MS[-1]}"] = 0
+            for latency in latencies:
+                bucket = next((f"<={b}" for b in LATENCY_BUCKETS_MS if latency <= b), f">{LATENCY_BUCKETS_MS[-1]}")
+                buckets[bucket] += 1
+            summary["latency_ms"]["histogram"] = buckets
+        return summary
+
+    def report(self) -> dict:
+        totals = {}
+        for kind, groups in self.totals.items():
+            totals[kind] = {}
+            for name, group in groups.items():
+                entry = dict(group)
+                entry["avg_latency_ms"] = round(entry.pop("latency_ms") / entry["calls"], 1)
+                entry["avg_queue_ms"] = round(entry.pop("queue_ms") / entry["calls"], 1)
+                entry["cost_usd"] = round(entry["cost_usd"], 6) if self.prices else None
+                totals[kind][name] = entry
+        calls = list(self.calls)
+        return {
+            "since": time.strftime("%Y-%m-%dT%H:%M:%S", time.localtime(self.started)),
+            "prompt_tokens": sum(g["prompt_tokens"] for g in self.totals["model"].values()),
+            "completion_tokens": sum(g["completion_tokens"] for g in self.totals["model"].values()),
+            "recent": self.summarize(calls),
+            "recent_by_tool": {
+                tool: self.summarize([call for call in calls if call["tool"] == tool], histogram=False)
+                for tool in dict.fromkeys(call["tool"] for call in calls)
+            },
+            "totals": totals,
+            "prompt_guard": {"max_prompt_tokens": MAGIC_MAX_PROMPT_TOKENS, "mode": MAGIC_PROMPT_GUARD, **self.guard}
+        }
+
+accounting = Accounting(MAGIC_STATS_WINDOW, MAGIC_STATS_PATH, MAGIC_PRICES)
+
+def guard_prompt(prompt: str, system_message: str) -> str:
+    """Trim (keeping head and tail) or reject prompts above MAGIC_MAX_PROMPT_TOKENS"""
+    estimated = estimate_tokens(prompt) + estimate_tokens(system_message)
+    if MAGIC_MAX_PROMPT_TOKENS <= 0 or estimated <= MAGIC_MAX_PROMPT_TOKENS:
+        return prompt
+    if MAGIC_PROMPT_GUARD == "reject":
+        accounting.guard["rejected"] += 1
+        raise ValueError(
+            f"Prompt of ~{estimated} tokens exceeds MAGIC_MAX_PROMPT_TOKENS={MAGIC_MAX_PROMPT_TOKENS}; "
+            "use chunked mode or shorter data"
+        )
+    accounting.guard["trimmed"] += 1
+    keep = max(0, (MAGIC_MAX_PROMPT_TOKENS - estimate_tokens(system_message)) * CHARS_PER_TOKEN - 100)
+    head, tail = prompt[:keep * 3 // 4], prompt[len(prompt) - keep // 4:] if keep // 4 else ""
+    return f"{head}\n[... {len(prompt) - len(head) - len(tail)} characters trimmed ...]\n{tail}"
+
+class CircuitOpenError(Exception):
+    pass
+
+class PartialStreamError(Exception):
+    """A stream failed after tokens were forwarded; retrying would duplicate them"""
+
+def is_retryable(error: Exception) -> bool:
+    if isinstance(error, (APIConnectionError, asyncio.TimeoutError)):
+        return True
+    if isinstance(error, APIStatusError):
+        return error.status_code in (408, 409, 425, 429) or error.status_code >= 500
+    return False
+
+def retry_after(error: Exception):
+    """Seconds requested by a Retry-After header, if any"""
+    response = getattr(error, "response", None)
+    value = response.headers.get("retry-after") if response is not None else None
+    try:
+        return float(value) if value is not None else None
+    except ValueError:
+        return None
+
+class CircuitBreaker:
+    """Opens after `threshold` consecutive failures; after `cooldown` lets one trial through"""
+
+    def __init__(self, threshold: int, cooldown: float):
+        self.threshold = threshold
+        self.cooldown = cooldown
+        self.failures = 0
+        self.opened_at = None
+        self.trial = False
+
+    @property
+    def state(self) -> str:
+        if self.opened_at is None:
+            return "closed"
+        return "half-open" if time.monotonic() - self.opened_at >= self.cooldown else "open"
+
+    def allow(self) -> bool:
+        state = self.state
+        if state == "closed":
+            return True
+        if state == "half-open" and not self.trial:
+            self.trial = True
+            return True
+        return False
+
+    def success(self):
+        self.failures = 0
+        self.opened_at = None
+        self.trial = False
+
+    def failure(self):
+        self.failures += 1
+        if self.trial or self.failures >= self.threshold:
+            self.opened_at = time.monotonic()
+        self.trial = False
+
+    def release(self):
+        """End a trial without a verdict: the breaker stays half-open for the next probe"""
+        self.trial = False
+
+class Dispatcher:
+    """Sends a request to the first healthy model, retrying, hedging and falling back"""
+
+    def __init__(self, models: list[str], retries: int, backoff_base: float, backoff_max: float,
+                 breaker_threshold: int, breaker_cooldown: float, hedge_after: str = ""):
+        self.models = models
+        self.retries = retries
+        self.backoff_base = backoff_base
+        self.backoff_max = backoff_max
+        self.hedge_after = hedge_after.strip().lower()
+        self.breakers = {model: CircuitBreaker(breaker_threshold, breaker_cooldown) for model in models}
+        self.latencies = {model: deque(maxlen=200) for model in models}
+        self.stats = {
+            "requests": 0, "attempts": 0, "retries": 0, "failures": 0, "fallbacks": 0,
+            "short_circuits": 0, "hedges": 0, "hedge_wins": 0, "hedges_skipped": 0
+        }
+
+    def backoff(self, attempt: int, error: Exception) -> float:
+        """Full-jitter exponential backoff, stretched to honour Retry-After"""
+        delay = random.uniform(0, min(self.backoff_max, self.backoff_base * 2 ** attempt))
+        requested = retry_after(error)
+        if requested is not None:
+            delay = max(delay, min(requested, self.backoff_max))
+        return delay
+
+    def hedge_delay(self, model: str):
+        if not self.hedge_after:
+            return None
+        if self.hedge_after != "p95":
+            return float(self.hedge_after)
+        samples = sorted(self.latencies[model])
+        if len(samples) < 20:
+            return None
+        return samples[int(len(samples) * 0.95)]
+
+    async def timed(self, model: str, call, slot: asyncio.Event = None):
+        """Await call(model), sampling its latency from when it got a request slot.
+
+        `call` invokes its `on_start` callback once it holds a slot, so time
+        spent queued behind other requests never counts as model latency.
+        """
+        started = None
+
+        def on_start():
+            nonlocal started
+            started = time.perf_counter()
+            if slot is not None:
+                slot.set()
+
+        result = await call(model, on_start=on_start)
+        if started is not None:
+            self.latencies[model].append(time.perf_counter() - started)
+        return result
+
+    async def hedged(self, model: str, call):
+        """Run call(model); if it outlives the hedge delay, race it against a duplicate.
+
+        The delay counts from when the request got a slot, and no duplicate is
+        sent while every slot is busy, so queueing never triggers a hedge.
+        """
+        delay = self.hedge_delay(model)
+        if delay is None:
+            return await self.timed(model, call)
+
+        slot = asyncio.Event()
+        primary = asyncio.create_task(self.timed(model, call, slot))
+        waiting = asyncio.create_task(slot.wait())
+        tasks = {primary}
+        try:
+            await asyncio.wait({primary, waiting}, return_when=asyncio.FIRST_COMPLETED)
+            done, _ = await asyncio.wait(tasks, timeout=delay)
+            if not done:
+                if ai_slots.locked():
+                    self.stats["hedges_skipped"] += 1
+                else:
+                    self.stats["hedges"] += 1
+                    tasks.add(asyncio.create_task(self.timed(model, call)))
+            error = None
+            while tasks:
+                done, tasks = await asyncio.wait(tasks, return_when=asyncio.FIRST_COMPLETED)
+                for task in done:
+                    if task.exception() is None:
+                        if task is not primary:
+                            self.stats["hedge_wins"] += 1
+                        return task.result()
+                    error = error or task.exception()
+            raise error
+        finally:
+            waiting.cancel()
+            for task in tasks:
+                task.cancel()
+
+    async def dispatch(self, call, hedge: bool = True):
+        """Await call(model) -> result on the first model that succeeds"""
+        self.stats["requests"] += 1
+        last_error = None
+        for index, model in enumerate(self.models):
+            breaker = self.breakers[model]
+            for attempt in range(self.retries + 1):
+                probe = breaker.state == "half-open"
+                if not breaker.allow():
+                    self.stats["short_circuits"] += 1
+                    break
+                self.stats["attempts"] += 1
+                try:
+                    result = await (self.hedged(model, call) if hedge else self.timed(model, call))
+                except Exception as e:
+                    last_error = e
+                    self.stats["failures"] += 1
+                    if isinstance(e, APIStatusError) and e.status_code == 404:
+                        break  # Unknown model: go straight to the next one
+                    if not is_retryable(e):
+                        breaker.success()  # Upstream answered; the request itself is bad
+                        raise
+                    breaker.failure()
+                    delay = self.backoff(attempt, e)
+                else:
+                    breaker.success()
+                    if index:
+                        self.stats["fallbacks"] += 1
+                    return result
+                finally:
+                    if probe:
+                        # A cancelled or 404 trial gave no verdict; free it for another probe
+                        breaker.release()
+                if attempt < self.retries:
+                    self.stats["retries"] += 1
+                    await asyncio.sleep(delay)
+        if last_error is None:
+            raise CircuitOpenError(f"Circuit open for all models: {', '.join(self.models)}")
+        raise last_error
+
+    def report(self) -> dict:
+        models = {}
+        for model in self.models:
+            samples = sorted(self.latencies[model])
+            models[model] = {
+                "circuit": self.breakers[model].state,
+                "consecutive_failures": self.breakers[model].failures,
+                "p95_ms": round(samples[int(len(samples) * 0.95)] * 1000, 1) if samples else None
+            }
+        return {**self.stats, "hedge_after": self.hedge_after or None, "models": models}
+
+dispatcher = Dispatcher(
+    MAGIC_MODELS, MAGIC_RETRIES, MAGIC_BACKOFF_BASE, MAGIC_BACKOFF_MAX,
+    MAGIC_BREAKER_THRESHOLD, MAGIC_BREAKER_COOLDOWN, MAGIC_HEDGE_AFTER
+)
+
+async def request_completion(model: str, messages: list[dict], max_tokens: int, timeout: float,
+                             on_start=None) -> tuple[str, int]:
+    """Send one chat completion upstream, returning (text, total tokens).
+
+    `on_start` is called once the request holds one of the ai_slots.
+    """
+    queued = time.perf_counter()
+    async with ai_slots:
+        started = time.perf_counter()
+        if on_start is not None:
+            on_start()
+        try:
+            response = await get_ai_client().chat.completions.create(
+                model=model,
+                messages=messages,
+                max_tokens=max_tokens,
+                timeout=timeout
+            )
+        except Exception as e:
+            accounting.record(model, started - queued, time.perf_counter() - started, error=e)
+            raise
+    latency = time.perf_counter() - started
+    text = response.choices[0].message.content or ""
+    usage = response.usage
+    prompt_tokens = usage.prompt_tokens if usage else sum(estimate_tokens(m["content"]) for m in messages)
+    completion_tokens = usage.completion_tokens if usage else estimate_tokens(text)
+    accounting.record(model, started - queued, latency, prompt_tokens, completion_tokens)
+    return text, prompt_tokens + completion_tokens
+
+def progress_reporter():
+    """Return an async (tokens, text) callback sending MCP progress notifications, if the client asked for them"""
+    try:
+        ctx = server.request_context
+    except LookupError:
+        return None
+    token = ctx.meta.progressToken if ctx.meta else None
+    if token is None:
+        return None
+
+    async def report(tokens: int, text: str):
+        try:
+            await ctx.session.send_progress_notification(
+                token, tokens, message=text, related_request_id=ctx.request_id
+            )
+        except Exception:
+            pass  # A lost notification must not abort the completion
+
+    return report
+
+async def stream_completion(model: str, messages: list[dict], max_tokens: int, timeout: float,
+                            report=None, on_start=None) -> tuple[str, int]:
+    """Stream one chat completion, forwarding deltas to `report` and recording TTFT and tokens/sec"""
+    queued = time.perf_counter()
+    async with ai_slots:
+        started = time.perf_counter()
+        if on_start is not None:
+            on_start()
+        first_token = None
+        last_report = started
+        parts, pending, deltas, usage = [], [], 0, None
+        try:
+            stream = await get_ai_client().chat.completions.create(
+                model=model,
+                messages=messages,
+                max_tokens=max_tokens,
+                timeout=timeout,
+                stream=True,
+                stream_options={"include_usage": True}
+            )
+            async for chunk in stream:
+                if chunk.usage:
+                    usage = chunk.usage
+                delta = chunk.choices[0].delta.content if chunk.choices else None
+                if not delta:
+                    continue
+                now = time.perf_counter()
+                if first_token is None:
+                    first_token = now
+                deltas += 1
+                parts.append(delta)
+                pending.append(delta)
+                if report and now - last_report >= MAGIC_STREAM_INTERVAL:
+                    await report(deltas, "".join(pending))
+                    pending.clear()
+                    last_report = now
+        except Exception as e:
+            accounting.record(model, started - queued, time.perf_counter() - started, error=e, stream=True)
+            if deltas:
+                raise PartialStreamError(f"Stream interrupted after {deltas} chunks: {e}") from e
+            raise
+        if report and pending:
+            await report(deltas, "".join(pending))
+
+    finished = time.perf_counter()
+    first_token = first_token or finished
+    text = "".join(parts)
+    prompt_tokens = usage.prompt_tokens if usage else sum(estimate_tokens(m["content"]) for m in messages)
+    completion_tokens = usage.completion_tokens if usage else deltas
+    stream_stats.record(first_token - started, completion_tokens, finished - first_token)
+    accounting.record(model, started - queued, finished - started, prompt_tokens, completion_tokens, stream=True)
+    return text, prompt_tokens + completion_tokens
+
+async def call_ai(prompt: str, system_message: str = "", timeout: float = None, tool: str = None,
+                  stream: bool = False) -> str:
+    """Call AI API if available, otherwise return placeholder.
+
+    Responses are cached per `tool` TTL. At most MAGIC_MAX_CONCURRENCY
+    calls are sent at once; `timeout` overrides MAGIC_TIMEOUT for this request.
+    With `stream`, tokens are forwarded as progress notifications as they arrive.
+    """
     if not OPENAI_AVAILABLE or not OPENROUTER_API_KEY:
         return f"[AI unavailable - would process: {prompt[:100]}...]"
 
+    tool_token = current_tool.set(tool)
     try:
+        prompt = guard_prompt(prompt, system_message)
         messages = []
         if system_message:
             messages.append({"role": "system", "content": system_message})
         messages.append({"role": "user", "content": prompt})
 
-        response = openai.ChatCompletion.create(
-            model="anthropic/claude-3-haiku",
-            messages=messages,
-            max_tokens=1000
-        )
-        return response.choices[0].message.content
+        max_tokens = 1000
+        key = response_cache.key(MAGIC_MODELS, system_message, prompt, {"max_tokens": max_tokens})
+        if stream:
+            # Hedging would forward every token twice
+            request = partial(stream_completion, messages=messages, max_tokens=max_tokens,
+                              timeout=timeout or MAGIC_TIMEOUT, report=progress_reporter())
+            call = partial(dispatcher.dispatch, request, hedge=False)
+        else:
+            request = partial(request_completion, messages=messages, max_tokens=max_tokens,
+                              timeout=timeout or MAGIC_TIMEOUT)
+            call = partial(dispatcher.dispatch, request)
+        return await response_cache.get_or_call(key, response_cache.ttl(tool), call)
     except Exception as e:
         return f"[AI error: {str(e)}]"
+    finally:
+        current_tool.reset(tool_token)
+
+HEADING_PATTERN = re.compile(r"^(#{1,6} |\S.*\n[=-]{3,}$)", re.MULTILINE)
+
+def split_chunks(text: str, max_chars: int, repeat_header: bool = False) -> list[str]:
+    """Split text into chunks of at most max_chars, preferring structural boundaries.
+
+    Blocks are separated at blank lines and markdown headings and packed
+    greedily; blocks that are still too long fall back to line, then word,
+    then hard character boundaries. With repeat_header (CSV/TSV input) the
+    first line is put at the top of every chunk and counts towards max_chars.
+    """
+    if len(text) <= max_chars:
+        return [text]
+    if repeat_header:
+        header, _, body = text.partition("\n")
+        if body.strip() and len(header) + 1 < max_chars:
+            return [f"{header}\n{chunk}" for chunk in split_chunks(body, max_chars - len(header) - 1)]
+
+    blocks = []
+    for block in re.split(r"\n\s*\n", text):
+        starts = [m.start() for m in HEADING_PATTERN.finditer(block) if m.start() > 0]
+        blocks.extend(block[a:b] for a, b in zip([0] + starts, starts + [len(block)]))
+
+    # (separator before the piece, piece): lines of a split block stay one newline apart
+    pieces = []
+    for block in blocks:
+        if len(block) <= max_chars:
+            pieces.append(("\n\n", block))
+            continue
+        separator = "\n\n"
+        for line in block.splitlines():
+            while len(line) > max_chars:
+                cut = line.rfind(" ", 0, max_chars)
+                cut = cut if cut > 0 else max_chars
+                pieces.append((separator, line[:cut]))
+                line = line[cut:].lstrip()
+                separator = " "
+            pieces.append((separator, line))
+            separator = "\n"
+
+    chunks, current = [], ""
+    for separator, piece in pieces:
+        if not piece.strip():
+            continue
+        candidate = f"{current}{separator}{piece}" if current else piece
+        if len(candidate) <= max_chars:
+            current = candidate
+        else:
+            chunks.append(current)
+            current = piece
+    if current:
+        chunks.append(current)
+    return chunks
+
+def use_chunks(arguments: dict) -> tuple[bool, int]:
+    """Decide whether a tool call runs chunked, returning (chunked, chunk_size)"""
+    chunk_size = max(500, int(arguments.get("chunk_size", MAGIC_CHUNK_CHARS)))
+    chunked = arguments.get("chunked")
+    if chunked is None:
+        chunked = len(arguments["data"]) > chunk_size
+    ready = OPENAI_AVAILABLE and bool(OPENROUTER_API_KEY)
+    return chunked and ready, chunk_size
+
+def is_ai_error(result: str) -> bool:
+    return result.startswith("[AI error:")
+
+async def map_chunks(prompts: list[str], system_message: str, tool: str) -> list[str]:
+    """Run one AI call per prompt with at most MAGIC_MAP_CONCURRENCY in flight, keeping order"""
+    fan_out = asyncio.Semaphore(MAGIC_MAP_CONCURRENCY)
+
+    async def run(prompt):
+        async with fan_out:
+            return await call_ai(prompt, system_message, tool=tool)
+
+    return await asyncio.gather(*(run(prompt) for prompt in prompts))
+
+async def reduce_partials(partials: list[str], instruction: str, system_message: str,
+                          tool: str, chunk_size: int) -> str:
+    """Combine partial results with AI calls, in rounds if they don't fit one prompt"""
+    while len(partials) > 1:
+        groups, current = [], []
+        for partial in partials:
+            if current and sum(len(p) for p in current) + len(partial) > chunk_size:
+                groups.append(current)
+                current = []
+            current.append(partial)
+        groups.append(current)
+        if len(groups) == len(partials):
+            # Every partial fills a prompt on its own: pair them up to make progress
+            groups = [partials[i:i + 2] for i in range(0, len(partials), 2)]
+
+        prompts = [
+            f"{instruction}\n\n" + "\n\n".join(
+                f"### Part {i + 1}\n{partial}" for i, partial in enumerate(group)
+            )
+            for group in groups
+        ]
+        partials = await map_chunks(prompts, system_message, tool)
+        errors = [p for p in partials if is_ai_error(p)]
+        if errors:
+            return errors[0]
+    return partials[0]
+
+# Output formats whose records are lines; their chunks are joined without blank lines
+LINE_FORMATS = {"csv", "tsv", "jsonl", "ndjson", "lines", "log"}
+
+def combine_transformed(parts: list[str], output_format: str) -> str:
+    """Join transformed chunks in order, merging JSON arrays/objects when every part parses.
+
+    Line-oriented formats are joined one record per line; for CSV/TSV a header
+    row repeated at the top of later chunks is dropped.
+    """
+    output_format = output_format.lower()
+    if output_format in LINE_FORMATS:
+        lines = []
+        header = None
+        for part in parts:
+            part_lines = part.strip("\n").splitlines()
+            if output_format in ("csv", "tsv") and part_lines:
+                if header is None:
+                    header = part_lines[0]
+                elif part_lines[0] == header:
+                    part_lines = part_lines[1:]
+            lines.extend(part_lines)
+        return "\n".join(lines)
+    if output_format == "json":
+        try:
+            values = [json.loads(part) for part in parts]
+        except ValueError:
+            values = None
+        if values and all(isinstance(v, list) for v in values):
+            return json.dumps([item for value in values for item in value], indent=2)
+        if values and all(isinstance(v, dict) for v in values):
+            merged = {}
+            for value in values:
+                merged.update(value)
+            return json.dumps(merged, indent=2)
+    return "\n\n".join(part.strip() for part in parts)
+
+# Local pipeline engine for magic_execute: deterministic operators over a
+# stream of records, chained by a spec so reshaping needs no AI round trip
+
+PATH_TOKEN = re.compile(r"\.?([^.\[\]]+)|\[(\*|-?\d+)\]")
+WORD_PATTERN = re.compile(r"\w+", re.UNICODE)
+
+@lru_cache(maxsize=256)
+def parse_path(path: str) -> tuple:
+    """Parse "$.items[*].name" into ("items", "*", "name"); indices become ints"""
+    path = path.strip()
+    if path.startswith("$"):
+        path = path[1:]
+    parts, position = [], 0
+    for match in PATH_TOKEN.finditer(path):
+        if match.start() != position:
+            raise ValueError(f"Invalid path: {path}")
+        key, index = match.groups()
+        parts.append(key if key is not None else ("*" if index == "*" else int(index)))
+        position = match.end()
+    if position != len(path):
+        raise ValueError(f"Invalid path: {path}")
+    return tuple(parts)
+
+def select_path(value, parts: tuple):
+    """Yield every value matching a parsed path ("*" fans out over lists and objects)"""
+    if not parts:
+        yield value
+        return
+    part, rest = parts[0], parts[1:]
+    if part == "*":
+        children = value.values() if isinstance(value, dict) else value if isinstance(value, list) else ()
+        for child in children:
+            yield from select_path(child, rest)
+    elif isinstance(part, int):
+        if isinstance(value, list) and -len(value) <= part < len(value):
+            yield from select_path(value[part], rest)
+    elif isinstance(value, dict) and part in value:
+        yield from select_path(value[part], rest)
+
+def get_path(value, path: str):
+    """Single value at path (None if missing), or a list when the path has wildcards"""
+    if not path:
+        return value
+    parts = parse_path(path)
+    matches = select_path(value, parts)
+    if "*" in parts:
+        return list(matches)
+    return next(matches, None)
+
+def regex_flags(flags: str) -> int:
+    """Combine flag letters such as "im" into re flags"""
+    value = 0
+    for flag in flags.upper():
+        if flag not in "IMSX":
+            raise ValueError(f"Unknown regex flag: {flag}")
+        value |= getattr(re, flag)
+    return value
+
+def record_text(record) -> str:
+    return record if isinstance(record, str) else json.dumps(record, ensure_ascii=False)
+
+def hash_key(value):
+    """Hashable identity of a JSON value for dedupe/group"""
+    if value is None or isinstance(value, (str, int, float, bool)):
+        return (type(value).__name__, value)
+    return ("json", json.dumps(value, sort_keys=True))
+
+def sort_key(value):
+    # None sorts first, numbers before strings, everything else by its JSON text
+    if value is None:
+        return (0, 0)
+    if isinstance(value, (int, float)) and not isinstance(value, bool):
+        return (1, value)
+    if isinstance(value, str):
+        return (2, value)
+    return (3, json.dumps(value, sort_keys=True))
+
+def read_records(data, input_format: str):
+    """Stream records from raw input: json, jsonl, csv, lines or text"""
+    if input_format == "json":
+        value = json.loads(data) if isinstance(data, str) else data
+        yield from value if isinstance(value, list) else [value]
+    elif input_format == "jsonl":
+        for line in io.StringIO(data):
+            if line.strip():
+                yield json.loads(line)
+    elif input_format == "csv":
+        yield from csv.DictReader(io.StringIO(data))
+    elif input_format == "lines":
+        for line in io.StringIO(data):
+            yield line.rstrip("\r\n")
+    elif input_format == "text":
+        yield data if isinstance(data, str) else json.dumps(data)
+    else:
+        raise ValueError(f"Unknown input format: {input_format}")
+
+def write_records(records, output_format: str, aggregate: bool = False) -> str:
+    """Serialize the record stream: json, jsonl, csv, lines or text.
+
+    JSON output is always an array, except for the single result of an
+    aggregate op (count, stats), which is emitted as a bare value.
+    """
+    if output_format == "json":
+        values = list(records)
+        return json.dumps(values[0] if aggregate and len(values) == 1 else values,
+                          indent=2, ensure_ascii=False)
+    if output_format == "jsonl":
+        return "\n".join(json.dumps(record, ensure_ascii=False) for record in records)
+    if output_format == "csv":
+        rows = [record if isinstance(record, dict) else {"value": record} for record in records]
+        fields = list(dict.fromkeys(field for row in rows for field in row))
+        buffer = io.StringIO()
+        writer = csv.DictWriter(buffer, fieldnames=fields, lineterminator="\n")
+        writer.writeheader()
+        for row in rows:
+            writer.writerow({k: v if isinstance(v, (str, int, float)) or v is None else json.dumps(v)
+                             for k, v in row.items()})
+        return buffer.getvalue()
+    if output_format in ("lines", "text"):
+        return "\n".join(record_text(record) for record in records)
+    raise ValueError(f"Unknown output format: {output_format}")
+
+def op_select(records, path: str):
+    parts = parse_path(path)
+    for record in records:
+        yield from select_path(record, parts)
+
+def op_project(records, fields):
+    if isinstance(fields, list):
+        fields = {field.split(".")[-1].replace("[*]", ""): field for field in fields}
+    for record in records:
+        yield {name: get_path(record, path) for name, path in fields.items()}
+
+def op_filter(records, path: str = "", equals=None, not_equals=None, contains=None,
+              matches: str = None, gt=None, lt=None, exists: bool = None):
+    pattern = re.compile(matches) if matches is not None else None
+    for record in records:
+        value = get_path(record, path)
+        if exists is not None and (value is not None) != exists:
+            continue
+        if equals is not None and value != equals:
+            continue
+        if not_equals is not None and value == not_equals:
+            continue
+        if contains is not None and (value is None or contains not in value):
+            continue
+        if pattern is not None and (value is None or not pattern.search(record_text(value))):
+            continue
+        if gt is not None and not (value is not None and value > gt):
+            continue
+        if lt is not None and not (value is not None and value < lt):
+            continue
+        yield record
+
+def op_regex_extract(records, pattern: str, path: str = "", group=None, flags: str = ""):
+    regex = re.compile(pattern, regex_flags(flags))
+    for record in records:
+        for match in regex.finditer(record_text(get_path(record, path))):
+            if group is not None:
+                yield match.group(group)
+            elif regex.groupindex:
+                yield match.groupdict()
+            elif regex.groups:
+                yield list(match.groups()) if regex.groups > 1 else match.group(1)
+            else:
+                yield match.group(0)
+
+def op_regex_replace(records, pattern: str, replacement: str, path: str = "", flags: str = ""):
+    regex = re.compile(pattern, regex_flags(flags))
+    parts = parse_path(path) if path else ()
+    for record in records:
+        if not parts:
+            yield regex.sub(replacement, record_text(record))
+            continue
+        if "*" in parts or not isinstance(record, dict):
+            raise ValueError("regex_replace path must name a single field of object records")
+        target = record
+        for part in parts[:-1]:
+            target = target.get(part, {}) if isinstance(target, dict) else {}
+        if isinstance(target, dict) and isinstance(target.get(parts[-1]), str):
+            target[parts[-1]] = regex.sub(replacement, target[parts[-1]])
+        yield record
+
+def op_dedupe(records, key: str = ""):
+    seen = set()
+    for record in records:
+        marker = hash_key(get_path(record, key))
+        if marker not in seen:
+            seen.add(marker)
+            yield record
+
+def op_sort(records, key: str = "", reverse: bool = False):
+    yield from sorted(records, key=lambda record: sort_key(get_path(record, key)), reverse=reverse)
+
+def op_group(records, key: str, collect: str = None, top: int = None):
+    groups: dict[tuple, list] = {}
+    for record in records:
+        value = get_path(record, key)
+        entry = groups.setdefault(hash_key(value), [value, 0, []])
+        entry[1] += 1
+        if collect is not None:
+            entry[2].append(get_path(record, collect))
+    ordered = sorted(groups.values(), key=lambda entry: -entry[1])
+    for value, count, items in ordered[:top] if top else ordered:
+        yield {"key": value, "count": count, "items": items} if collect is not None else {"key": value, "count": count}
+
+def op_count(records):
+    yield {"count": sum(1 for _ in records)}
+
+def op_limit(records, n: int, offset: int = 0):
+    yield from itertools.islice(records, offset, offset + n)
+
+def op_stats(records, path: str = "", top: int = 10, lowercase: bool = True):
+    """Word/token statistics; tokens are estimated at ~4 characters each"""
+    counts: dict[str, int] = {}
+    totals = {"records": 0, "lines": 0, "words": 0, "chars": 0}
+    for record in records:
+        text = record_text(get_path(record, path))
+        totals["records"] += 1
+        totals["lines"] += text.count("\n") + 1
+        totals["chars"] += len(text)
+        for word in WORD_PATTERN.findall(text.lower() if lowercase else text):
+            totals["words"] += 1
+            counts[word] = counts.get(word, 0) + 1
+    top_words = sorted(counts.items(), key=lambda item: (-item[1], item[0]))[:top]
+    yield {
+        **totals,
+        "unique_words": len(counts),
+        "estimated_tokens": (totals["chars"] + CHARS_PER_TOKEN - 1) // CHARS_PER_TOKEN,
+        "top_words": [{"word": word, "count": count} for word, count in top_words]
+    }
+
+PIPELINE_OPS = {
+    "select": op_select,
+    "project": op_project,
+    "filter": op_filter,
+    "regex_extract": op_regex_extract,
+    "regex_replace": op_regex_replace,
+    "dedupe": op_dedupe,
+    "sort": op_sort,
+    "group": op_group,
+    "count": op_count,
+    "limit": op_limit,
+    "stats": op_stats
+}
+# Ops that reduce the stream to one summary record
+AGGREGATE_OPS = {"count", "stats"}
+
+def run_pipeline(data, steps: list[dict], input_format: str = None, output_format: str = "json") -> str:
+    """Chain operators lazily over the parsed input and serialize the result"""
+    if input_format is None:
+        input_format = "json" if not isinstance(data, str) or data.lstrip()[:1] in ("[", "{") else "lines"
+    records = read_records(data, input_format)
+    op = None
+    for step in steps:
+        step = dict(step)
+        op = step.pop("op", None)
+        if op not in PIPELINE_OPS:
+            raise ValueError(f"Unknown pipeline op: {op} (available: {', '.join(PIPELINE_OPS)})")
+        try:
+            records = PIPELINE_OPS[op](records, **step)
+        except TypeError as e:
+            raise ValueError(f"Bad arguments for {op}: {e}") from e
+    return write_records(records, output_format, aggregate=op in AGGREGATE_OPS)
 
 @server.call_tool()
 async def call_tool(name: str, arguments: Any) -> list[TextContent]:
     if name == "magic_transform":
-        prompt = f"""Transform the following data according to these instructions:
+        output_format = arguments.get('format', 'text')
+        system_message = "You are a data transformation expert."
+
+        def transform_prompt(data: str, note: str = "") -> str:
+            return f"""Transform the following data according to these instructions:{note}
 
 Data:
-{arguments['data']}
+{data}
 
 Transformation:
 {arguments['transformation']}
 
-Output format: {arguments.get('format', 'text')}"""
+Output format: {output_format}"""
+
+        chunked, chunk_size = use_chunks(arguments)
+        if not chunked:
+            result = await call_ai(transform_prompt(arguments['data']), system_message, tool=name,
+                                   stream=arguments.get("stream", MAGIC_STREAM))
+            return [TextContent(type="text", text=result)]
 
-        result = await call_ai(prompt, "You are a data transformation expert.")
+        input_format = arguments.get('input_format', output_format).lower()
+        chunks = split_chunks(arguments['data'], chunk_size, repeat_header=input_format in ("csv", "tsv"))
+        note = "\n(This is one part of a larger input; transform only this part and output only the result.)"
+        parts = await map_chunks([transform_prompt(chunk, note) for chunk in chunks], system_message, name)
+        errors = [part for part in parts if is_ai_error(part)]
+        result = errors[0] if errors else combine_transformed(parts, output_format)
         return [TextContent(type="text", text=result)]
 
     elif name == "magic_analyze":
@@ -127,9 +1322,29 @@ Output format: {arguments.get('format', 'text')}"""
         }
 
         analysis_type = arguments["analysis_type"]
-        prompt = f"{analysis_prompts[analysis_type]}\n\n{arguments['data']}"
+        system_message = f"You are a {analysis_type} analysis expert."
 
-        result = await call_ai(prompt, f"You are a {analysis_type} analysis expert.")
+        chunked, chunk_size = use_chunks(arguments)
+        if not chunked:
+            prompt = f"{analysis_prompts[analysis_type]}\n\n{arguments['data']}"
+            result = await call_ai(prompt, system_message, tool=name,
+                                   stream=arguments.get("stream", MAGIC_STREAM))
+            return [TextContent(type="text", text=result)]
+
+        chunks = split_chunks(arguments['data'], chunk_size)
+        partials = await map_chunks([
+            f"{analysis_prompts[analysis_type]}\n(This is one part of a larger input.)\n\n{chunk}"
+            for chunk in chunks
+        ], system_message, name)
+        errors = [partial for partial in partials if is_ai_error(partial)]
+        if errors:
+            return [TextContent(type="text", text=errors[0])]
+
+        result = await reduce_partials(
+            partials,
+            f"Combine these {analysis_type} analyses of consecutive parts of one input into a single {analysis_type} analysis of the whole input:",
+            system_message, name, chunk_size
+        )
         return [TextContent(type="text", text=result)]
 
     elif name == "magic_generate":
@@ -139,14 +1354,15 @@ Output format: {arguments.get('format', 'text')}"""
 
 Style: {arguments.get('style', 'clear and concise')}"""
 
-        result = await call_ai(prompt, "You are a code and content generation expert.")
+        result = await call_ai(prompt, "You are a code and content generation expert.", tool=name,
+                               stream=arguments.get("stream", MAGIC_STREAM))
         return [TextContent(type="text", text=result)]
 
     elif name == "magic_execute":
         command = arguments["command"]
         params = arguments.get("parameters", {})
 
-        # Simple command execution (can be extended)
+        # Simple commands, then the local pipeline engine
         if command == "reverse":
             text = params.get("text", "")
             return [TextContent(type="text", text=text[::-1])]
@@ -157,15 +1373,58 @@ Style: {arguments.get('style', 'clear and concise')}"""
         elif command == "to_json":
             data = params.get("data", {})
             return [TextContent(type="text", text=json.dumps(data, indent=2))]
+
+        params = dict(params)
+        data = params.pop("input", params.pop("data", params.pop("text", "")))
+        input_format = params.pop("input_format", None)
+        output_format = params.pop("output_format", None)
+        if command == "pipeline":
+            steps = params.get("steps", [])
+        elif command == "csv_to_json":
+            steps, input_format, output_format = [], "csv", output_format or "json"
+        elif command == "json_to_csv":
+            steps, input_format, output_format = [], input_format or "json", "csv"
+        elif command in PIPELINE_OPS:
+            steps = [{"op": command, **params}]
         else:
             return [TextContent(type="text", text=f"Unknown command: {command}")]
 
+        try:
+            result = run_pipeline(data, steps, input_format, output_format or "json")
+        except (ValueError, KeyError, TypeError, re.error, csv.Error) as e:
+            return [TextContent(type="text", text=f"Pipeline error: {e}")]
+        return [TextContent(type="text", text=result)]
+
+    elif name == "magic_stats":
+        if arguments.get("clear_cache", False):
+            response_cache.clear()
+        if arguments.get("export_name"):
+            try:
+                path, exported = accounting.export(MAGIC_STATS_EXPORT_DIR, arguments["export_name"])
+            except (OSError, ValueError) as e:
+                return [TextContent(type="text", text=f"Error: cannot export stats: {e}")]
+            stats_note = f"Exported {exported} call records to {path}"
+        else:
+            stats_note = None
+        stats = {
+            "usage": accounting.report(),
+            "cache": response_cache.report(),
+            "dispatch": dispatcher.report(),
+            "streaming": stream_stats.report()
+        }
+        if stats_note:
+            stats["export"] = stats_note
+        return [TextContent(type="text", text=json.dumps(stats, indent=2))]
+
     raise ValueError(f"Unknown tool: {name}")
 
 async def main():
     async with stdio_server() as (read_stream, write_stream):
-        await server.run(read_stream, write_stream, server.create_initialization_options())
+        try:
+            await server.run(read_stream, write_stream, server.create_initialization_options())
+        finally:
+            if ai_client is not None:
+                await ai_client.close()
 
 if __name__ == "__main__":
-    import asyncio
     asyncio.run(main())
@@ -0,0 +1,193 @@
+#!/usr/bin/env python3
+"""OpenAI-compatible stub API for exercising the Magic server offline
+
+Serves POST /chat/completions (and /v1/chat/completions) with a canned
+completion after a configurable delay, so concurrency and timeouts can be
+measured without network access or API credits. Requests with
+"stream": true get an SSE stream of --tokens chunks, one every
+--token-delay seconds after the first.
+
+Faults can be injected to exercise retries, the circuit breaker, model
+fallback and hedging: a fraction of requests fail with --fail-status,
+a fraction take --slow-delay instead of --delay, and requests for
+--fail-models always fail.
+
+Usage:
+    python stub_server.py --port 8099 --delay 0.5 --tokens 50 --token-delay 0.02
+    python stub_server.py --fail-rate 0.3 --fail-status 429 --slow-rate 0.05 --slow-delay 3
+    OPENROUTER_BASE_URL=http://127.0.0.1:8099 OPENROUTER_API_KEY=stub python server.py
+"""
+
+import argparse
+import json
+import random
+import sys
+import threading
+import time
+import uuid
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+class StubServer(ThreadingHTTPServer):
+    daemon_threads = True
+    # Default backlog of 5 stalls bursts of new connections on SYN retries
+    request_queue_size = 128
+
+    def handle_error(self, request, client_address):
+        # Cancelled (e.g. hedged) requests drop the connection mid-reply
+        if not isinstance(sys.exc_info()[1], ConnectionError):
+            super().handle_error(request, client_address)
+
+class StubHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        if self.server.verbose:
+            super().log_message(format, *args)
+
+    def send_json(self, status: int, payload: dict):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        if status == 429 and self.server.retry_after is not None:
+            self.send_header("Retry-After", str(self.server.retry_after))
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_POST(self):
+        length = int(self.headers.get("Content-Length", 0))
+        request = json.loads(self.rfile.read(length) or b"{}")
+        if self.path.rstrip("/") not in ("/chat/completions", "/v1/chat/completions"):
+            self.send_json(404, {"error": {"message": f"Unknown path {self.path}"}})
+            return
+
+        stub = self.server
+        model = request.get("model", "stub")
+        with stub.lock:
+            stub.requests += 1
+            fail = model in stub.fail_models or stub.random.random() < stub.fail_rate
+            slow = stub.random.random() < stub.slow_rate
+            if fail:
+                stub.failures += 1
+        time.sleep(stub.slow_delay if slow else stub.delay)
+        if fail:
+            self.send_json(stub.fail_status, {"error": {
+                "message": f"Injected failure for {model}", "code": stub.fail_status
+            }})
+            return
+
+        prompt = request.get("messages", [{}])[-1].get("content", "")
+        text = f"stub reply to {len(prompt)} chars"
+        prompt_tokens = sum(len(m.get("content", "").split()) for m in request.get("messages", []))
+        if request.get("stream"):
+            self.send_stream(request, prompt_tokens)
+            return
+
+        self.send_json(200, {
+            "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+            "object": "chat.completion",
+            "created": int(time.time()),
+            "model": request.get("model", "stub"),
+            "choices": [{
+                "index": 0,
+                "message": {"role": "assistant", "content": text},
+                "finish_reason": "stop"
+            }],
+            "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": len(text.split()),
+                "total_tokens": prompt_tokens + len(text.split())
+            }
+        })
+
+    def send_event(self, payload):
+        data = b"data: " + (payload if isinstance(payload, bytes) else json.dumps(payload).encode("utf-8")) + b"\n\n"
+        # Manual chunked transfer encoding keeps the HTTP/1.1 connection reusable
+        self.wfile.write(f"{len(data):x}\r\n".encode("ascii") + data + b"\r\n")
+        self.wfile.flush()
+
+    def send_stream(self, request: dict, prompt_tokens: int):
+        self.send_response(200)
+        self.send_header("Content-Type", "text/event-stream")
+        self.send_header("Cache-Control", "no-cache")
+        self.send_header("Transfer-Encoding", "chunked")
+        self.end_headers()
+
+        base = {
+            "id": f"chatcmpl-{uuid.uuid4().hex[:12]}",
+            "object": "chat.completion.chunk",
+            "created": int(time.time()),
+            "model": request.get("model", "stub")
+        }
+        tokens = self.server.tokens
+        for i in range(tokens):
+            if i:
+                time.sleep(self.server.token_delay)
+            delta = {"content": f"tok{i} "}
+            if i == 0:
+                delta["role"] = "assistant"
+            self.send_event({**base, "choices": [{
+                "index": 0, "delta": delta, "finish_reason": "stop" if i == tokens - 1 else None
+            }]})
+        if request.get("stream_options", {}).get("include_usage"):
+            self.send_event({**base, "choices": [], "usage": {
+                "prompt_tokens": prompt_tokens,
+                "completion_tokens": tokens,
+                "total_tokens": prompt_tokens + tokens
+            }})
+        self.send_event(b"[DONE]")
+        self.wfile.write(b"0\r\n\r\n")
+
+def start_stub(port: int = 0, delay: float = 0.5, verbose: bool = False,
+               tokens: int = 20, token_delay: float = 0.02,
+               fail_rate: float = 0.0, fail_status: int = 503, fail_models: tuple = (),
+               slow_rate: float = 0.0, slow_delay: float = 5.0,
+               retry_after: float = None, seed: int = None) -> StubServer:
+    """Start the stub in a daemon thread; the bound port is httpd.server_address[1]"""
+    httpd = StubServer(("127.0.0.1", port), StubHandler)
+    httpd.delay = delay
+    httpd.tokens = tokens
+    httpd.token_delay = token_delay
+    httpd.fail_rate = fail_rate
+    httpd.fail_status = fail_status
+    httpd.fail_models = set(fail_models)
+    httpd.slow_rate = slow_rate
+    httpd.slow_delay = slow_delay
+    httpd.retry_after = retry_after
+    httpd.random = random.Random(seed)
+    httpd.failures = 0
+    httpd.verbose = verbose
+    httpd.requests = 0
+    httpd.lock = threading.Lock()
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return httpd
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8099)
+    parser.add_argument("--delay", type=float, default=0.5, help="Seconds before each reply")
+    parser.add_argument("--tokens", type=int, default=20, help="Chunks per streamed reply")
+    parser.add_argument("--token-delay", type=float, default=0.02, help="Seconds between streamed chunks")
+    parser.add_argument("--fail-rate", type=float, default=0.0, help="Fraction of requests that fail")
+    parser.add_argument("--fail-status", type=int, default=503, help="HTTP status of injected failures")
+    parser.add_argument("--fail-models", default="", help="Comma-separated models that always fail")
+    parser.add_argument("--slow-rate", type=float, default=0.0, help="Fraction of requests using --slow-delay")
+    parser.add_argument("--slow-delay", type=float, default=5.0, help="Reply delay of slow requests")
+    parser.add_argument("--retry-after", type=float, default=None, help="Retry-After seconds sent with 429s")
+    parser.add_argument("--seed", type=int, default=None, help="Random seed for reproducible faults")
+    parser.add_argument("--verbose", action="store_true", help="Log every request")
+    args = parser.parse_args()
+
+    httpd = start_stub(
+        args.port, args.delay, args.verbose, args.tokens, args.token_delay,
+        args.fail_rate, args.fail_status, [m for m in args.fail_models.split(",") if m],
+        args.slow_rate, args.slow_delay, args.retry_after, args.seed
+    )
+    print(f"Stub API listening on http://127.0.0.1:{httpd.server_address[1]}")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        httpd.shutdown()
+
+if __name__ == "__main__":
+    main()
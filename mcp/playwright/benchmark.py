@@ -0,0 +1,210 @@
+#!/usr/bin/env python3
+"""Playwright server benchmark - navigation profiles against a local static site
+
+Starts fixture_site.py in-process and navigates the same pages with every
+profile (with and without JavaScript), then prints the per-profile timings
+and blocked request counts collected by the server as JSON. With --crawl it
+instead crawls the whole site with browser_crawl at each concurrency level
+and reports pages/sec, which should grow with the number of pool pages.
+With --cache it navigates the pages once in record mode and again in
+replay mode, with the fixture site stopped, against a temporary store.
+With --screenshots it compares capture time and payload size per format
+and downscaling setting on a full-page screenshot. With --extractions it
+runs the same browser_extract calls against the live page and against a
+browser_snapshot.
+
+Usage:
+    python benchmark.py --navigations 20 --images 30 --latency 0.02
+    python benchmark.py --crawl --pages 63 --concurrency 1,2,4,8 --latency 0.05
+    python benchmark.py --cache --navigations 20 --latency 0.05
+    python benchmark.py --screenshots 10
+    python benchmark.py --extractions 50
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--navigations", type=int, default=20, help="Navigations per profile")
+    parser.add_argument("--images", type=int, default=30, help="Images per fixture page")
+    parser.add_argument("--latency", type=float, default=0.02, help="Fixture latency per request (seconds)")
+    parser.add_argument("--wait-until", default="load", choices=["load", "domcontentloaded", "networkidle"])
+    parser.add_argument("--crawl", action="store_true", help="Benchmark browser_crawl instead of the profiles")
+    parser.add_argument("--pages", type=int, default=20, help="Fixture pages (all reachable from page 0)")
+    parser.add_argument("--concurrency", default="1,2,4,8", help="Crawl concurrency levels to compare")
+    parser.add_argument("--profile", default="text-only", help="Navigation profile used by the crawl")
+    parser.add_argument("--cache", action="store_true", help="Benchmark record then offline replay")
+    parser.add_argument("--screenshots", type=int, default=0, help="Screenshots per format/size setting")
+    parser.add_argument("--extractions", type=int, default=0, help="browser_extract calls, live and from a snapshot")
+    return parser.parse_args()
+
+async def benchmark_crawl(server, args, base_url):
+    runs = []
+    for concurrency in [int(c) for c in args.concurrency.split(",") if c]:
+        result = await server.call_tool("browser_crawl", {
+            "url": f"{base_url}/page/0.html",
+            "follow": {"selector": "a.next", "max_depth": args.pages},
+            "extract": {"selector": "table.items tr", "fields": {"name": "td.name", "price": "td.price"}, "all": True},
+            "concurrency": concurrency,
+            "max_pages": args.pages,
+            "host_rate": 0,
+            "profile": args.profile,
+            "wait_until": args.wait_until,
+            "compact": True
+        })
+        if result[0].text.startswith("Error"):
+            raise RuntimeError(result[0].text)
+        report = json.loads(result[0].text)
+        print(f"concurrency={concurrency:<3} {report['pages']} pages in {report['seconds']:.2f}s", file=sys.stderr)
+        runs.append({key: value for key, value in report.items() if key != "results"})
+    return {"pages": args.pages, "profile": args.profile, "fixture_latency": args.latency, "runs": runs}
+
+async def benchmark_cache(server, args, base_url, httpd):
+    async def navigate_all(mode):
+        started = time.perf_counter()
+        for i in range(args.navigations):
+            result = await server.call_tool("browser_navigate", {
+                "url": f"{base_url}/page/{i % args.pages}.html",
+                "page_id": "bench-cache",
+                "cache": mode,
+                "wait_until": args.wait_until
+            })
+            if result[0].text.startswith("Error"):
+                raise RuntimeError(result[0].text)
+        elapsed = time.perf_counter() - started
+        print(f"{mode:<7} {elapsed:.2f}s", file=sys.stderr)
+        return {"seconds": round(elapsed, 3), "ms_per_navigation": round(elapsed * 1000 / args.navigations, 1)}
+
+    record = await navigate_all("record")
+    fixture_requests = httpd.requests
+    httpd.shutdown()
+    replay = await navigate_all("replay")
+    return {
+        "navigations": args.navigations,
+        "fixture_latency": args.latency,
+        "record": record,
+        "replay_offline": replay,
+        "speedup": round(record["seconds"] / replay["seconds"], 1) if replay["seconds"] else None,
+        "cache": server.response_store.report(),
+        "fixture_requests": fixture_requests
+    }
+
+async def benchmark_screenshots(server, args, base_url):
+    await server.call_tool("browser_navigate", {"url": f"{base_url}/page/0.html", "page_id": "bench-shot"})
+    runs = {}
+    for image_format, max_dimension in [("png", 0), ("jpeg", 0), ("webp", 0), ("jpeg", 800), ("webp", 800)]:
+        sizes = []
+        started = time.perf_counter()
+        for _ in range(args.screenshots):
+            result = await server.call_tool("browser_screenshot", {
+                "page_id": "bench-shot",
+                "full_page": True,
+                "format": image_format,
+                "quality": 75,
+                "max_dimension": max_dimension
+            })
+            if result[0].text.startswith("Error"):
+                raise RuntimeError(result[0].text)
+            sizes.append(len(result[1].data))
+        elapsed = time.perf_counter() - started
+        label = f"{image_format}@{max_dimension or 'full'}"
+        print(f"{label:<10} {elapsed / args.screenshots * 1000:.0f} ms", file=sys.stderr)
+        runs[label] = {
+            "avg_ms": round(elapsed / args.screenshots * 1000, 1),
+            "avg_payload_bytes": sum(sizes) // len(sizes)
+        }
+    return {"screenshots_per_setting": args.screenshots, "full_page": True, "settings": runs}
+
+async def benchmark_extractions(server, args, base_url):
+    selectors = ["h1", "td.name", "table.items tr", "a.next", "img"]
+
+    async def run(page_id):
+        started = time.perf_counter()
+        for i in range(args.extractions):
+            result = await server.call_tool("browser_extract", {
+                "page_id": page_id, "selector": selectors[i % len(selectors)], "attribute": "text", "all": True
+            })
+            if result[0].text.startswith("Error"):
+                raise RuntimeError(result[0].text)
+        return time.perf_counter() - started
+
+    runs = {}
+    for page_id, use_snapshot in [("bench-live", False), ("bench-snapshot", True)]:
+        await server.call_tool("browser_navigate", {"url": f"{base_url}/page/0.html", "page_id": page_id})
+        snapshot_seconds = 0.0
+        if use_snapshot:
+            started = time.perf_counter()
+            await server.call_tool("browser_snapshot", {"page_id": page_id})
+            snapshot_seconds = time.perf_counter() - started
+        elapsed = await run(page_id)
+        print(f"{page_id:<15} {(elapsed + snapshot_seconds) * 1000:.0f} ms", file=sys.stderr)
+        runs[page_id.split("-")[1]] = {
+            "snapshot_ms": round(snapshot_seconds * 1000, 1),
+            "extract_ms_total": round(elapsed * 1000, 1),
+            "avg_extract_ms": round(elapsed * 1000 / args.extractions, 2)
+        }
+    return {"extractions": args.extractions, "runs": runs, "snapshots": server.snapshot_stats}
+
+async def benchmark(args, base_url, httpd):
+    import server
+
+    await server.pool.start()
+    try:
+        if args.crawl:
+            return await benchmark_crawl(server, args, base_url)
+        if args.cache:
+            return await benchmark_cache(server, args, base_url, httpd)
+        if args.screenshots:
+            return await benchmark_screenshots(server, args, base_url)
+        if args.extractions:
+            return await benchmark_extractions(server, args, base_url)
+        runs = [(profile, True) for profile in server.NAVIGATION_PROFILES] + [("text-only", False)]
+        for profile, javascript in runs:
+            page_id = f"bench-{profile}-{javascript}"
+            started = time.perf_counter()
+            for i in range(args.navigations):
+                result = await server.call_tool("browser_navigate", {
+                    "url": f"{base_url}/page/{i % args.pages}.html",
+                    "page_id": page_id,
+                    "profile": profile,
+                    "javascript": javascript,
+                    "wait_until": args.wait_until
+                })
+                if result[0].text.startswith("Error"):
+                    raise RuntimeError(result[0].text)
+            print(f"{profile:<10} js={javascript!s:<5} {time.perf_counter() - started:.2f}s", file=sys.stderr)
+            await server.call_tool("browser_close", {"page_id": page_id})
+        return {
+            "navigations_per_profile": args.navigations,
+            "images_per_page": args.images,
+            "fixture_latency": args.latency,
+            "profiles": server.navigation_stats.report()
+        }
+    finally:
+        await server.pool.shutdown()
+
+def main():
+    args = parse_args()
+    here = os.path.dirname(os.path.abspath(__file__))
+    sys.path.insert(0, here)
+    from fixture_site import start_site
+
+    httpd = start_site(pages=args.pages, images=args.images, latency=args.latency)
+    base_url = f"http://127.0.0.1:{httpd.server_address[1]}"
+    with tempfile.TemporaryDirectory() as cache_dir:
+        os.environ["PLAYWRIGHT_CACHE_PATH"] = cache_dir
+        try:
+            report = asyncio.run(benchmark(args, base_url, httpd))
+            report.setdefault("fixture_requests", httpd.requests)
+        finally:
+            httpd.shutdown()
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
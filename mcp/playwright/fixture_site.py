@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""Local static test site for benchmarking the Playwright server offline
+
+Serves generated pages with images, a stylesheet, a web font, a script and
+a tracker-like script from memory, with an optional per-request latency to
+mimic a real network.
+
+Usage:
+    python fixture_site.py --port 8098 --pages 20 --images 30 --latency 0.02
+"""
+
+import argparse
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# 1x1 transparent PNG, padded so images cost real bytes
+PNG = bytes.fromhex(
+    "89504e470d0a1a0a0000000d4948445200000001000000010806000000"
+    "1f15c4890000000d49444154789c6360000002000154a24f5d0000000049454e44ae426082"
+)
+
+def build_site(pages: int, images: int, image_bytes: int) -> dict[str, tuple[str, bytes]]:
+    """Map URL paths to (content type, body)"""
+    site = {
+        "/style.css": ("text/css", b"body { font-family: 'Fixture', serif; } " * 200),
+        "/font.woff2": ("font/woff2", b"\0" * 40000),
+        "/app.js": ("application/javascript",
+                    b"document.body.dataset.rendered = 'yes';"
+                    b"document.getElementById('dynamic').textContent = 'rendered by script';"),
+        "/googletagmanager.com/gtm.js": ("application/javascript", b"/* tracker */" * 500)
+    }
+    for i in range(images):
+        site[f"/img/{i}.png"] = ("image/png", PNG + b"\0" * image_bytes)
+
+    for n in range(pages):
+        links = "".join(f'<li><a class="next" href="/page/{m}.html">Page {m}</a></li>'
+                        for m in (n * 2 + 1, n * 2 + 2) if m < pages)
+        rows = "".join(f'<tr><td class="name">Item {n}-{r}</td><td class="price">{r * 3}</td></tr>'
+                       for r in range(20))
+        imgs = "".join(f'<img src="/img/{i}.png" alt="img {i}">' for i in range(images))
+        html = f"""<!doctype html>
+<html><head><title>Fixture page {n}</title>
+<link rel="stylesheet" href="/style.css">
+<link rel="preload" href="/font.woff2" as="font" crossorigin>
+<script src="/googletagmanager.com/gtm.js"></script>
+</head><body>
+<h1>Fixture page {n}</h1>
+<p id="dynamic">static</p>
+<table class="items">{rows}</table>
+<ul class="links">{links}</ul>
+<div class="gallery">{imgs}</div>
+<script src="/app.js"></script>
+</body></html>"""
+        site[f"/page/{n}.html"] = ("text/html; charset=utf-8", html.encode("utf-8"))
+    site["/"] = site["/index.html"] = site["/page/0.html"]
+    return site
+
+class FixtureServer(ThreadingHTTPServer):
+    daemon_threads = True
+    request_queue_size = 128
+
+class FixtureHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+
+    def log_message(self, format, *args):
+        pass
+
+    def do_GET(self):
+        with self.server.lock:
+            self.server.requests += 1
+        if self.server.latency:
+            time.sleep(self.server.latency)
+        entry = self.server.site.get(self.path.split("?")[0])
+        if entry is None:
+            body = b"not found"
+            self.send_response(404)
+            self.send_header("Content-Type", "text/plain")
+        else:
+            content_type, body = entry
+            self.send_response(200)
+            self.send_header("Content-Type", content_type)
+            self.send_header("Cache-Control", "no-store")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+def start_site(port: int = 0, pages: int = 20, images: int = 30, image_bytes: int = 20000,
+               latency: float = 0.0) -> FixtureServer:
+    """Serve the site from a daemon thread; the base URL is http://127.0.0.1:<httpd.server_address[1]>"""
+    httpd = FixtureServer(("127.0.0.1", port), FixtureHandler)
+    httpd.site = build_site(pages, images, image_bytes)
+    httpd.latency = latency
+    httpd.requests = 0
+    httpd.lock = threading.Lock()
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return httpd
+
+def main():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--port", type=int, default=8098)
+    parser.add_argument("--pages", type=int, default=20)
+    parser.add_argument("--images", type=int, default=30)
+    parser.add_argument("--image-bytes", type=int, default=20000)
+    parser.add_argument("--latency", type=float, default=0.0, help="Seconds added to every response")
+    args = parser.parse_args()
+
+    httpd = start_site(args.port, args.pages, args.images, args.image_bytes, args.latency)
+    print(f"Fixture site listening on http://127.0.0.1:{httpd.server_address[1]}/")
+    try:
+        threading.Event().wait()
+    except KeyboardInterrupt:
+        httpd.shutdown()
+
+if __name__ == "__main__":
+    main()
@@ -1,13 +1,28 @@
 #!/usr/bin/env python3
 """Playwright MCP Server - Browser automation and web scraping"""
 
+import base64
+import difflib
+import hashlib
+import html
+import itertools
 import json
+import os
+import re
+import tempfile
+import time
+from collections import OrderedDict, deque
+from contextlib import asynccontextmanager
+from email.utils import parsedate_to_datetime
+from functools import lru_cache
+from html.parser import HTMLParser
 from typing import Any
+from urllib.parse import urldefrag, urljoin, urlsplit
 import asyncio
 
 from mcp.server import Server
 from mcp.server.stdio import stdio_server
-from mcp.types import Tool, TextContent
+from mcp.types import Tool, TextContent, ImageContent, EmbeddedResource, BlobResourceContents
 
 try:
     from playwright.async_api import async_playwright, Browser, Page
@@ -17,26 +32,1312 @@ except ImportError:
 
 server = Server("playwright")
 
-# Global browser instance
-browser: Browser = None
-pages = {}
-
-async def get_browser():
-    """Get or create browser instance"""
-    global browser
-    if browser is None:
-        if not PLAYWRIGHT_AVAILABLE:
-            raise RuntimeError("Playwright not available")
-        playwright = await async_playwright().start()
-        browser = await playwright.chromium.launch(headless=True)
-    return browser
-
-async def get_page(page_id: str = "default") -> Page:
-    """Get or create a page"""
-    if page_id not in pages:
-        browser = await get_browser()
-        pages[page_id] = await browser.new_page()
-    return pages[page_id]
+# Page pool: isolated contexts kept pre-warmed, capped and evicted when idle
+PLAYWRIGHT_PREWARM = int(os.getenv("PLAYWRIGHT_PREWARM", "2"))
+PLAYWRIGHT_MAX_PAGES = int(os.getenv("PLAYWRIGHT_MAX_PAGES", "16"))
+PLAYWRIGHT_IDLE_TIMEOUT = float(os.getenv("PLAYWRIGHT_IDLE_TIMEOUT", "300"))
+# Relaunch the browser after this many navigations to bound leaks (0 = never)
+PLAYWRIGHT_RECYCLE_AFTER = int(os.getenv("PLAYWRIGHT_RECYCLE_AFTER", "500"))
+
+# Navigation profiles: resource types aborted by request interception, plus tracker URLs
+NAVIGATION_PROFILES = {
+    "full": {"types": frozenset(), "trackers": False},
+    "no-media": {"types": frozenset({"image", "media", "font"}), "trackers": True},
+    "text-only": {"types": frozenset({"image", "media", "font", "stylesheet", "manifest", "other"}), "trackers": True}
+}
+PLAYWRIGHT_PROFILE = os.getenv("PLAYWRIGHT_PROFILE", "full")
+# Comma-separated URL substrings blocked by the no-media and text-only profiles
+PLAYWRIGHT_BLOCK_URLS = os.getenv(
+    "PLAYWRIGHT_BLOCK_URLS",
+    "google-analytics.com,googletagmanager.com,doubleclick.net,googlesyndication.com,"
+    "facebook.net,connect.facebook.com,hotjar.com,segment.io,mixpanel.com,clarity.ms,"
+    "scorecardresearch.com,adservice.google.com"
+)
+TRACKER_PATTERN = re.compile("|".join(
+    re.escape(part.strip()) for part in PLAYWRIGHT_BLOCK_URLS.split(",") if part.strip()
+) or r"(?!)")
+
+# Crawling: pages fetched in parallel from the pool, spaced out per host
+PLAYWRIGHT_CRAWL_CONCURRENCY = int(os.getenv("PLAYWRIGHT_CRAWL_CONCURRENCY", "4"))
+PLAYWRIGHT_CRAWL_MAX_PAGES = int(os.getenv("PLAYWRIGHT_CRAWL_MAX_PAGES", "100"))
+PLAYWRIGHT_CRAWL_TIMEOUT = float(os.getenv("PLAYWRIGHT_CRAWL_TIMEOUT", "30"))
+# Navigations started per second on the same host (0 = unlimited)
+PLAYWRIGHT_CRAWL_HOST_RATE = float(os.getenv("PLAYWRIGHT_CRAWL_HOST_RATE", "5"))
+
+# Response cache: off | cache (honours Cache-Control/Expires) | record | replay (offline)
+CACHE_MODES = ("off", "cache", "record", "replay")
+PLAYWRIGHT_CACHE = os.getenv("PLAYWRIGHT_CACHE", "off")
+PLAYWRIGHT_CACHE_PATH = os.getenv("PLAYWRIGHT_CACHE_PATH", "/tmp/playwright-cache")
+# Hosts cached whatever their headers say, e.g. "rules.example.com=86400,docs.example.com"
+PLAYWRIGHT_CACHE_HOSTS = os.getenv("PLAYWRIGHT_CACHE_HOSTS", "")
+PLAYWRIGHT_CACHE_TTL = float(os.getenv("PLAYWRIGHT_CACHE_TTL", "3600"))
+
+# Screenshots: image/resource content blocks, or files on tmpfs
+SCREENSHOT_FORMATS = {"png": "image/png", "jpeg": "image/jpeg", "webp": "image/webp"}
+SCREENSHOT_OUTPUTS = ("image", "resource", "file")
+PLAYWRIGHT_SCREENSHOT_OUTPUT = os.getenv("PLAYWRIGHT_SCREENSHOT_OUTPUT", "image")
+PLAYWRIGHT_SCREENSHOT_DIR = os.getenv(
+    "PLAYWRIGHT_SCREENSHOT_DIR",
+    "/dev/shm/playwright-screenshots" if os.path.isdir("/dev/shm")
+    else os.path.join(tempfile.gettempdir(), "playwright-screenshots")
+)
+# Longest side in CSS pixels (0 = no downscaling)
+PLAYWRIGHT_SCREENSHOT_MAX_DIMENSION = int(os.getenv("PLAYWRIGHT_SCREENSHOT_MAX_DIMENSION", "0"))
+
+# Heuristically cacheable statuses (RFC 9111); redirects are stored unfollowed
+CACHEABLE_STATUSES = frozenset({200, 203, 204, 300, 301, 308, 404, 410})
+# Hop-by-hop or invalidated by storing the decoded body
+HOP_HEADERS = frozenset({"content-encoding", "content-length", "transfer-encoding", "connection", "keep-alive"})
+# Cookies belong to the context that received them: passed through live, never stored
+UNSTORED_HEADERS = HOP_HEADERS | {"set-cookie"}
+
+class ResponseStore:
+    """Content-addressed disk store of HTTP responses for request interception.
+
+    entries/<sha256 of method and URL>.json holds status, headers, expiry and
+    the values of the request headers named by Vary, which must match for the
+    entry to be served; bodies/<sha256 of body> holds the body, shared by
+    identical responses. In cache mode only fresh entries are served and only
+    responses a shared cache may keep are stored (not private, no Set-Cookie,
+    no Vary: *); record fetches and stores every GET response, replay serves
+    stored responses whatever their age and fails requests it has never seen.
+    Disk I/O runs in worker threads.
+    """
+
+    def __init__(self, path: str, force_hosts: str = "", force_ttl: float = 3600):
+        self.path = path
+        self.force_ttl = force_ttl
+        self.force_hosts = {}
+        for item in filter(None, (part.strip() for part in force_hosts.split(","))):
+            host, _, seconds = item.partition("=")
+            self.force_hosts[host.strip().lower()] = float(seconds) if seconds else force_ttl
+        self.entries: dict[str, dict] = {}
+        self.stats = {
+            "hits": 0, "misses": 0, "vary_misses": 0, "stored": 0, "uncacheable": 0, "replay_misses": 0,
+            "errors": 0, "bytes_served": 0
+        }
+
+    @staticmethod
+    def key(method: str, url: str) -> str:
+        return hashlib.sha256(f"{method} {urldefrag(url)[0]}".encode("utf-8")).hexdigest()
+
+    def _file(self, kind: str, digest: str) -> str:
+        return os.path.join(self.path, kind, digest[:2], digest)
+
+    def _write(self, target: str, data: bytes):
+        os.makedirs(os.path.dirname(target), exist_ok=True)
+        # A unique temp name per write: concurrent worker threads may store the same entry
+        with tempfile.NamedTemporaryFile(dir=os.path.dirname(target), suffix=".tmp", delete=False) as f:
+            f.write(data)
+        os.replace(f.name, target)
+
+    def _load_entry(self, key: str):
+        try:
+            with open(self._file("entries", key), encoding="utf-8") as f:
+                return json.load(f)
+        except (OSError, ValueError):
+            return None
+
+    async def lookup(self, key: str):
+        entry = self.entries.get(key)
+        if entry is None:
+            entry = await asyncio.to_thread(self._load_entry, key)
+            if entry is not None:
+                self.entries[key] = entry
+        return entry
+
+    def _read_body(self, digest: str):
+        try:
+            with open(self._file("bodies", digest), "rb") as f:
+                return f.read()
+        except OSError:
+            return None
+
+    async def read_body(self, entry: dict):
+        return await asyncio.to_thread(self._read_body, entry["body"])
+
+    def _save_files(self, key: str, entry: dict, body: bytes):
+        if not os.path.exists(self._file("bodies", entry["body"])):
+            self._write(self._file("bodies", entry["body"]), body)
+        self._write(self._file("entries", key), json.dumps(entry).encode("utf-8"))
+
+    async def save(self, key: str, url: str, status: int, headers: dict, body: bytes, expires: float,
+                   vary: dict = None):
+        entry = {
+            "url": url, "status": status, "expires": expires, "stored": time.time(),
+            "body": hashlib.sha256(body).hexdigest(), "vary": vary or {},
+            "headers": {name: value for name, value in headers.items() if name.lower() not in UNSTORED_HEADERS}
+        }
+        await asyncio.to_thread(self._save_files, key, entry, body)
+        self.entries[key] = entry
+        self.stats["stored"] += 1
+
+    @staticmethod
+    def cache_control(headers: dict) -> dict:
+        directives = {}
+        for part in headers.get("cache-control", "").split(","):
+            name, _, value = part.strip().lower().partition("=")
+            if name:
+                directives[name] = value.strip('"')
+        return directives
+
+    @staticmethod
+    def vary(headers: dict):
+        """Lowercase request header names a response varies on, or None for Vary: *.
+
+        Accept-Encoding is ignored: bodies are stored decoded.
+        """
+        names = [name.strip().lower() for name in headers.get("vary", "").split(",") if name.strip()]
+        if "*" in names:
+            return None
+        return [name for name in names if name != "accept-encoding"]
+
+    def expires(self, url: str, status: int, headers: dict, request_headers: dict = None):
+        """Absolute expiry for a response, or None when it must not be cached.
+
+        Responses meant for one user (private, setting cookies, Vary: *, or
+        answering an Authorization header without public) are never stored,
+        even for forced hosts, since every page_id shares the store. Forced
+        hosts ignore the origin's caching headers, so there a request carrying
+        cookies is not stored either: its response may be personalised.
+        """
+        now = time.time()
+        headers = {name.lower(): value for name, value in headers.items()}
+        directives = self.cache_control(headers)
+        if "private" in directives or "set-cookie" in headers or self.vary(headers) is None:
+            return None
+        if "authorization" in (request_headers or {}) and "public" not in directives:
+            return None
+        host = (urlsplit(url).hostname or "").lower()
+        for forced, ttl in self.force_hosts.items():
+            if host == forced or host.endswith("." + forced):
+                return None if "cookie" in (request_headers or {}) else now + ttl
+        if status not in CACHEABLE_STATUSES:
+            return None
+        if "no-store" in directives or "no-cache" in directives:
+            return None
+        if directives.get("max-age", "").isdigit():
+            age = int(headers["age"]) if headers.get("age", "").isdigit() else 0
+            seconds = int(directives["max-age"]) - age
+            return now + seconds if seconds > 0 else None
+        if "expires" in headers:
+            try:
+                expires = parsedate_to_datetime(headers["expires"]).timestamp()
+                date = parsedate_to_datetime(headers["date"]).timestamp() if "date" in headers else now
+            except (TypeError, ValueError):
+                return None
+            return now + expires - date if expires > date else None
+        return None
+
+    async def handle(self, route, mode: str):
+        """Fulfil a GET from the store, or fetch it and store the response"""
+        request = route.request
+        key = self.key(request.method, request.url)
+        request_headers = None
+        # Record always refreshes from the network
+        entry = await self.lookup(key) if mode != "record" else None
+        if entry is not None and entry.get("vary"):
+            request_headers = await request.all_headers()
+            if any(request_headers.get(name) != value for name, value in entry["vary"].items()):
+                self.stats["vary_misses"] += 1
+                entry = None
+        if entry is not None and (mode == "replay" or entry["expires"] > time.time()):
+            body = await self.read_body(entry)
+            if body is not None:
+                self.stats["hits"] += 1
+                self.stats["bytes_served"] += len(body)
+                await route.fulfill(status=entry["status"], headers=entry["headers"], body=body)
+                return
+        if mode == "replay":
+            self.stats["replay_misses"] += 1
+            await route.abort("internetdisconnected")
+            return
+
+        self.stats["misses"] += 1
+        try:
+            # Redirects are stored as-is and followed by the browser
+            response = await route.fetch(max_redirects=0)
+            body = await response.body()
+        except Exception:
+            self.stats["errors"] += 1
+            await route.abort()
+            return
+        headers = response.headers
+        lowered = {name.lower(): value for name, value in headers.items()}
+        vary = self.vary(lowered)
+        if mode == "record":
+            expires = float("inf")
+            vary = vary or []
+        else:
+            # request.headers omits Authorization and Cookie, which decide cacheability
+            if request_headers is None:
+                request_headers = await request.all_headers()
+            expires = self.expires(request.url, response.status, lowered, request_headers)
+        if expires is None:
+            self.stats["uncacheable"] += 1
+        else:
+            if vary and request_headers is None:
+                request_headers = await request.all_headers()
+            varied = {name: request_headers.get(name) for name in vary}
+            try:
+                await self.save(key, request.url, response.status, headers, body, expires, varied)
+            except OSError:
+                self.stats["errors"] += 1
+        # The live response keeps its cookies; only headers invalid for the decoded body go
+        await route.fulfill(
+            status=response.status,
+            headers={name: value for name, value in headers.items() if name.lower() not in HOP_HEADERS},
+            body=body
+        )
+
+    def clear(self) -> int:
+        removed = 0
+        for kind in ("entries", "bodies"):
+            for root, _, files in os.walk(os.path.join(self.path, kind)):
+                for name in files:
+                    os.remove(os.path.join(root, name))
+                    removed += kind == "entries"
+        self.entries.clear()
+        return removed
+
+    def report(self) -> dict:
+        lookups = self.stats["hits"] + self.stats["misses"] + self.stats["replay_misses"]
+        return {
+            "path": self.path,
+            "default_mode": PLAYWRIGHT_CACHE,
+            "forced_hosts": self.force_hosts,
+            "entries_loaded": len(self.entries),
+            **self.stats,
+            "hit_rate": round(self.stats["hits"] / lookups, 3) if lookups else None
+        }
+
+response_store = ResponseStore(PLAYWRIGHT_CACHE_PATH, PLAYWRIGHT_CACHE_HOSTS, PLAYWRIGHT_CACHE_TTL)
+
+class PageSlot:
+    """A page with its own browser context, owned by one page_id.
+
+    Ephemeral slots (crawl workers) hold no user state: they are evicted
+    before user pages and never evict one themselves.
+    """
+    __slots__ = ("context", "page", "browser", "created", "last_used", "busy", "navigations",
+                 "javascript", "profile", "cache", "blocked", "router", "snapshot", "stale", "watching",
+                 "ephemeral")
+
+    def __init__(self, context, page, browser, javascript: bool = True, ephemeral: bool = False):
+        self.context = context
+        self.page = page
+        self.browser = browser
+        self.ephemeral = ephemeral
+        self.created = self.last_used = time.monotonic()
+        self.busy = 0
+        self.navigations = 0
+        self.javascript = javascript
+        self.profile = "full"
+        self.cache = "off"
+        self.blocked = 0
+        self.snapshot = None
+        self.stale = True
+        self.watching = False
+        # A plain function (not a bound method) so route/unroute see the same handler
+        self.router = lambda route: self._route(route)
+
+    @property
+    def intercepting(self) -> bool:
+        return self.profile != "full" or self.cache != "off"
+
+    async def _configure(self, profile: str, cache: str):
+        was_intercepting = self.intercepting
+        self.profile, self.cache = profile, cache
+        if was_intercepting and not self.intercepting:
+            await self.page.unroute("**/*", self.router)
+        elif self.intercepting and not was_intercepting:
+            await self.page.route("**/*", self.router)
+
+    async def set_profile(self, profile: str):
+        """Install or remove request interception for a navigation profile"""
+        if profile not in NAVIGATION_PROFILES:
+            raise ValueError(f"Unknown profile: {profile} (available: {', '.join(NAVIGATION_PROFILES)})")
+        await self._configure(profile, self.cache)
+
+    async def set_cache(self, mode: str):
+        """Serve and store this page's GET requests through the response store"""
+        if mode not in CACHE_MODES:
+            raise ValueError(f"Unknown cache mode: {mode} (available: {', '.join(CACHE_MODES)})")
+        await self._configure(self.profile, mode)
+
+    async def _route(self, route):
+        rules = NAVIGATION_PROFILES[self.profile]
+        request = route.request
+        if request.resource_type in rules["types"] or (rules["trackers"] and TRACKER_PATTERN.search(request.url)):
+            self.blocked += 1
+            await route.abort()
+        elif self.cache != "off" and request.method == "GET":
+            await response_store.handle(route, self.cache)
+        else:
+            await route.continue_()
+
+class BrowserPool:
+    """Pre-warmed isolated contexts handed out per page_id.
+
+    At most `max_pages` pages are open; beyond that the least recently used
+    idle page is closed, and pages idle for `idle_timeout` seconds are
+    reaped. After `recycle_after` navigations new pages go to a freshly
+    launched browser while the old one drains and closes with its last page.
+    """
+
+    def __init__(self, prewarm: int, max_pages: int, idle_timeout: float, recycle_after: int):
+        self.prewarm = prewarm
+        self.max_pages = max_pages
+        self.idle_timeout = idle_timeout
+        self.recycle_after = recycle_after
+        self.playwright = None
+        self.browser: Browser = None
+        self.generation = 0
+        self.navigations = 0
+        self.spares: list[tuple] = []
+        self.slots: OrderedDict[str, PageSlot] = OrderedDict()
+        self.retiring: list = []
+        self.lock = asyncio.Lock()
+        self.refill_task = None
+        self.reaper_task = None
+        self.last_error = None
+        self.stats = {
+            "warm_hits": 0, "cold_starts": 0, "prewarmed": 0, "closed": 0,
+            "lru_evictions": 0, "idle_evictions": 0, "recycles": 0, "navigations": 0,
+            "acquire_ms_total": 0.0, "acquires": 0
+        }
+
+    async def _launch(self):
+        if self.playwright is None:
+            self.playwright = await async_playwright().start()
+        self.browser = await self.playwright.chromium.launch(headless=True)
+        self.generation += 1
+        self.navigations = 0
+
+    async def _new_context(self, browser, javascript: bool = True):
+        context = await browser.new_context() if javascript else await browser.new_context(java_script_enabled=False)
+        page = await context.new_page()
+        return context, page
+
+    async def start(self):
+        """Launch the browser and pre-warm contexts ahead of the first request"""
+        try:
+            async with self.lock:
+                if self.browser is None:
+                    await self._launch()
+            await self._refill()
+        except Exception as e:
+            self.last_error = str(e)
+        if self.reaper_task is None and self.idle_timeout > 0:
+            self.reaper_task = asyncio.create_task(self._reap_loop())
+
+    async def _refill(self):
+        browser = self.browser
+        while (browser is not None and browser is self.browser and len(self.spares) < self.prewarm
+               and len(self.slots) + len(self.spares) < self.max_pages):
+            context, page = await self._new_context(browser)
+            if browser is not self.browser:
+                await context.close()
+                break
+            self.spares.append((context, page))
+            self.stats["prewarmed"] += 1
+
+    def _schedule_refill(self):
+        if self.prewarm > 0 and (self.refill_task is None or self.refill_task.done()):
+            self.refill_task = asyncio.create_task(self._refill())
+
+    async def _close_slot(self, slot: PageSlot):
+        try:
+            await slot.context.close()
+        except Exception:
+            pass
+        self.stats["closed"] += 1
+        if slot.browser is not self.browser and slot.browser in self.retiring:
+            if not any(other.browser is slot.browser for other in self.slots.values()):
+                self.retiring.remove(slot.browser)
+                await slot.browser.close()
+
+    async def _evict_for_space(self, ephemeral: bool = False):
+        """Close idle pages until one more fits, least recently used ephemeral pages first.
+
+        Making room for an ephemeral page never closes a user page.
+        """
+        while len(self.slots) >= self.max_pages:
+            idle = [pid for pid, slot in self.slots.items() if slot.busy == 0]
+            victim = next((pid for pid in idle if self.slots[pid].ephemeral), None)
+            if victim is None and not ephemeral:
+                victim = next(iter(idle), None)
+            if victim is None:
+                if ephemeral:
+                    raise RuntimeError(f"Page limit reached: no free page among {self.max_pages} for a crawl worker")
+                raise RuntimeError(f"Page limit reached: all {self.max_pages} pages are busy")
+            await self._close_slot(self.slots.pop(victim))
+            self.stats["lru_evictions"] += 1
+
+    def free_for_ephemeral(self) -> int:
+        """Pages ephemeral slots can use without evicting a user page"""
+        return self.max_pages - sum(1 for slot in self.slots.values() if not slot.ephemeral)
+
+    async def acquire(self, page_id: str, javascript: bool = None, ephemeral: bool = False) -> PageSlot:
+        """Get the page for page_id, creating it from a warm context if needed.
+
+        `javascript` (None = keep the current setting) is a context option, so
+        changing it replaces the page's context. `ephemeral` marks a new page
+        as a crawl worker (see PageSlot).
+        """
+        slot = self.slots.get(page_id)
+        if slot is not None and not slot.page.is_closed() and javascript in (None, slot.javascript):
+            self.slots.move_to_end(page_id)
+            return slot
+
+        started = time.perf_counter()
+        async with self.lock:
+            slot = self.slots.get(page_id)
+            if slot is not None and (slot.page.is_closed() or javascript not in (None, slot.javascript)):
+                await self._close_slot(self.slots.pop(page_id))
+                slot = None
+            if slot is None:
+                javascript = True if javascript is None else javascript
+                if self.browser is None:
+                    await self._launch()
+                await self._evict_for_space(ephemeral)
+                if javascript and self.spares:
+                    context, page = self.spares.pop()
+                    self.stats["warm_hits"] += 1
+                else:
+                    context, page = await self._new_context(self.browser, javascript)
+                    self.stats["cold_starts"] += 1
+                slot = self.slots[page_id] = PageSlot(context, page, self.browser, javascript, ephemeral)
+                self.stats["acquires"] += 1
+                self.stats["acquire_ms_total"] += (time.perf_counter() - started) * 1000
+        self._schedule_refill()
+        return slot
+
+    @asynccontextmanager
+    async def use(self, page_id: str, javascript: bool = None, ephemeral: bool = False):
+        """Borrow the page for page_id; busy pages are never evicted"""
+        slot = await self.acquire(page_id, javascript, ephemeral)
+        slot.busy += 1
+        try:
+            yield slot.page
+        finally:
+            slot.busy -= 1
+            slot.last_used = time.monotonic()
+
+    async def record_navigation(self, page_id: str):
+        slot = self.slots.get(page_id)
+        if slot is not None:
+            slot.navigations += 1
+        self.stats["navigations"] += 1
+        if slot is None or slot.browser is not self.browser:
+            return
+        self.navigations += 1
+        if self.recycle_after and self.navigations >= self.recycle_after:
+            await self._recycle()
+
+    async def _recycle(self):
+        async with self.lock:
+            old = self.browser
+            spares, self.spares = self.spares, []
+            for context, _ in spares:
+                await context.close()
+            await self._launch()
+            self.stats["recycles"] += 1
+            if any(slot.browser is old for slot in self.slots.values()):
+                self.retiring.append(old)
+            else:
+                await old.close()
+        self._schedule_refill()
+
+    async def close(self, page_id: str) -> bool:
+        async with self.lock:
+            slot = self.slots.pop(page_id, None)
+            if slot is None:
+                return False
+            await self._close_slot(slot)
+        self._schedule_refill()
+        return True
+
+    async def reap(self) -> int:
+        """Close pages idle longer than idle_timeout"""
+        now = time.monotonic()
+        reaped = 0
+        async with self.lock:
+            for page_id, slot in list(self.slots.items()):
+                if slot.busy == 0 and now - slot.last_used > self.idle_timeout:
+                    await self._close_slot(self.slots.pop(page_id))
+                    reaped += 1
+        self.stats["idle_evictions"] += reaped
+        if reaped:
+            self._schedule_refill()
+        return reaped
+
+    async def _reap_loop(self):
+        while True:
+            await asyncio.sleep(max(1.0, min(30.0, self.idle_timeout / 4)))
+            try:
+                await self.reap()
+            except Exception as e:
+                self.last_error = str(e)
+
+    async def shutdown(self):
+        for task in (self.reaper_task, self.refill_task):
+            if task is not None:
+                task.cancel()
+        for browser in [self.browser, *self.retiring]:
+            if browser is not None:
+                try:
+                    await browser.close()
+                except Exception:
+                    pass
+        if self.playwright is not None:
+            await self.playwright.stop()
+
+    def report(self) -> dict:
+        now = time.monotonic()
+        stats = dict(self.stats)
+        acquires = stats.pop("acquires")
+        stats["avg_acquire_ms"] = round(stats.pop("acquire_ms_total") / acquires, 1) if acquires else None
+        return {
+            "browser_running": self.browser is not None,
+            "browser_generation": self.generation,
+            "navigations_since_recycle": self.navigations,
+            "recycle_after": self.recycle_after,
+            "retiring_browsers": len(self.retiring),
+            "pages": len(self.slots),
+            "busy_pages": sum(1 for slot in self.slots.values() if slot.busy),
+            "max_pages": self.max_pages,
+            "spare_contexts": len(self.spares),
+            "prewarm": self.prewarm,
+            "idle_timeout": self.idle_timeout,
+            **stats,
+            "last_error": self.last_error,
+            "open_pages": {
+                page_id: {
+                    "url": slot.page.url,
+                    "idle_seconds": round(now - slot.last_used, 1),
+                    "navigations": slot.navigations,
+                    "profile": slot.profile,
+                    "cache": slot.cache,
+                    "javascript": slot.javascript,
+                    "blocked_requests": slot.blocked,
+                    "snapshot_version": slot.snapshot.version if slot.snapshot is not None else None,
+                    "snapshot_valid": slot.snapshot is not None and not slot.stale,
+                    "busy": slot.busy > 0,
+                    "ephemeral": slot.ephemeral
+                }
+                for page_id, slot in self.slots.items()
+            }
+        }
+
+pool = BrowserPool(PLAYWRIGHT_PREWARM, PLAYWRIGHT_MAX_PAGES, PLAYWRIGHT_IDLE_TIMEOUT, PLAYWRIGHT_RECYCLE_AFTER)
+
+class NavigationStats:
+    """Navigation timings and blocked requests per profile over a recent window"""
+
+    def __init__(self, window: int = 200):
+        self.window = window
+        self.profiles: dict[str, dict] = {}
+
+    def record(self, profile: str, javascript: bool, seconds: float, blocked: int, error: bool = False):
+        key = profile if javascript else f"{profile}+nojs"
+        entry = self.profiles.setdefault(key, {
+            "navigations": 0, "errors": 0, "blocked_requests": 0, "timings": deque(maxlen=self.window)
+        })
+        entry["navigations"] += 1
+        entry["errors"] += 1 if error else 0
+        entry["blocked_requests"] += blocked
+        if not error:
+            entry["timings"].append(seconds * 1000)
+
+    def report(self) -> dict:
+        report = {}
+        for key, entry in self.profiles.items():
+            timings = sorted(entry["timings"])
+            report[key] = {
+                "navigations": entry["navigations"],
+                "errors": entry["errors"],
+                "blocked_requests": entry["blocked_requests"],
+                "avg_ms": round(sum(timings) / len(timings), 1) if timings else None,
+                "p50_ms": round(timings[len(timings) // 2], 1) if timings else None,
+                "p95_ms": round(timings[min(len(timings) - 1, int(len(timings) * 0.95))], 1) if timings else None
+            }
+        return report
+
+navigation_stats = NavigationStats()
+
+# Runs in the page: reads every match (or a record of fields per match) in one round trip
+EXTRACT_SCRIPT = """
+(nodes, {attribute, fields, limit, compact}) => {
+    const read = (el, attr) => {
+        if (!el) return null;
+        let value;
+        switch (attr) {
+            case "text": value = el.textContent; break;
+            case "inner_text": value = el.innerText; break;
+            case "html": value = el.innerHTML; break;
+            case "outer_html": value = el.outerHTML; break;
+            case "value": value = el.value ?? null; break;
+            default: value = el.getAttribute(attr);
+        }
+        if (compact && typeof value === "string") value = value.replace(/\\s+/g, " ").trim();
+        return value;
+    };
+    const count = limit ? Math.min(limit, nodes.length) : nodes.length;
+    const items = new Array(count);
+    for (let i = 0; i < count; i++) {
+        const row = nodes[i];
+        if (!fields) {
+            items[i] = read(row, attribute);
+            continue;
+        }
+        const record = {};
+        for (const [name, spec] of Object.entries(fields)) {
+            const attr = spec.attribute || "text";
+            if (spec.all) {
+                const matches = spec.selector ? row.querySelectorAll(spec.selector) : [row];
+                record[name] = Array.from(matches, el => read(el, attr));
+            } else {
+                const value = read(spec.selector ? row.querySelector(spec.selector) : row, attr);
+                if (!(compact && value === null)) record[name] = value;
+            }
+        }
+        items[i] = record;
+    }
+    return {total: nodes.length, items};
+}
+"""
+
+def normalize_fields(fields: dict) -> dict:
+    """Accept {"name": "css"} shorthand alongside {"name": {"selector", "attribute", "all"}}"""
+    normalized = {}
+    for name, spec in fields.items():
+        if isinstance(spec, str):
+            spec = {"selector": spec}
+        if not isinstance(spec, dict):
+            raise ValueError(f"Invalid field spec for {name}: {spec!r}")
+        normalized[name] = {
+            "selector": spec.get("selector", ""),
+            "attribute": spec.get("attribute", "text"),
+            "all": bool(spec.get("all", False))
+        }
+    return normalized
+
+async def extract(page, selector: str, attribute: str = "text", fields: dict = None,
+                  limit: int = None, compact: bool = False) -> dict:
+    """Extract values (or field records) for every match of selector in a single evaluate.
+
+    The selector goes through a locator, so Playwright syntax (text=, xpath=,
+    >>, :has-text(), :visible) works; field selectors are CSS relative to each match.
+    """
+    return await page.locator(selector).evaluate_all(EXTRACT_SCRIPT, {
+        "attribute": attribute,
+        "fields": normalize_fields(fields) if fields else None,
+        "limit": limit,
+        "compact": compact
+    })
+
+def dump_json(value, compact: bool = False) -> str:
+    if compact:
+        return json.dumps(value, separators=(",", ":"), ensure_ascii=False)
+    return json.dumps(value, indent=2)
+
+# DOM snapshots: serialized once per page version, queried locally until invalidated
+VOID_ELEMENTS = frozenset({"area", "base", "br", "col", "embed", "hr", "img", "input", "link", "meta",
+                           "param", "source", "track", "wbr"})
+RAW_TEXT_ELEMENTS = frozenset({"script", "style"})
+# Not part of the text outline used by format=text and diffs
+HIDDEN_ELEMENTS = frozenset({"head", "script", "style", "noscript", "template"})
+
+# Runs in the page: watch for mutations, then serialize the document and current form values
+SNAPSHOT_SCRIPT = """
+() => {
+    if (window.__mcpSnapshotObserver) window.__mcpSnapshotObserver.disconnect();
+    const observer = new MutationObserver(() => {
+        observer.disconnect();
+        if (window.__mcpSnapshotDirty) window.__mcpSnapshotDirty();
+    });
+    observer.observe(document, {subtree: true, childList: true, attributes: true, characterData: true});
+    window.__mcpSnapshotObserver = observer;
+    return {
+        html: document.documentElement.outerHTML,
+        values: Array.from(document.querySelectorAll("input, textarea, select"), el => el.value),
+        url: location.href,
+        title: document.title
+    };
+}
+"""
+
+class UnsupportedSelector(ValueError):
+    """The snapshot cannot answer this query; use the live page"""
+
+class DomNode:
+    __slots__ = ("tag", "attrs", "children", "parent", "value")
+
+    def __init__(self, tag: str, attrs: dict, parent=None):
+        self.tag = tag
+        self.attrs = attrs
+        self.children: list = []
+        self.parent = parent
+        self.value = None
+
+    def elements(self):
+        """Descendant elements in document order"""
+        stack = [child for child in reversed(self.children) if isinstance(child, DomNode)]
+        while stack:
+            node = stack.pop()
+            yield node
+            stack.extend(child for child in reversed(node.children) if isinstance(child, DomNode))
+
+    def text(self) -> str:
+        parts = []
+        stack = [self]
+        while stack:
+            node = stack.pop()
+            if isinstance(node, str):
+                parts.append(node)
+            else:
+                stack.extend(reversed(node.children))
+        return "".join(parts)
+
+    def inner_html(self) -> str:
+        return "".join(
+            child.outer_html() if isinstance(child, DomNode)
+            else child if self.tag in RAW_TEXT_ELEMENTS else html.escape(child, quote=False)
+            for child in self.children
+        )
+
+    def outer_html(self) -> str:
+        attrs = "".join(f' {name}="{html.escape(value or "", quote=True)}"' for name, value in self.attrs.items())
+        if self.tag in VOID_ELEMENTS:
+            return f"<{self.tag}{attrs}>"
+        return f"<{self.tag}{attrs}>{self.inner_html()}</{self.tag}>"
+
+    def read(self, attribute: str):
+        if attribute == "text":
+            return self.text()
+        if attribute == "html":
+            return self.inner_html()
+        if attribute == "outer_html":
+            return self.outer_html()
+        if attribute == "value":
+            return self.value
+        if attribute == "inner_text":
+            raise UnsupportedSelector("inner_text depends on layout")
+        value = self.attrs.get(attribute.lower())
+        return "" if value is None and attribute.lower() in self.attrs else value
+
+class DomBuilder(HTMLParser):
+    """Build a DomNode tree from the browser's own (well-formed) serialization"""
+
+    def __init__(self):
+        super().__init__(convert_charrefs=True)
+        self.root = DomNode("#document", {})
+        self.current = self.root
+
+    def handle_starttag(self, tag, attrs):
+        node = DomNode(tag, dict(attrs), self.current)
+        self.current.children.append(node)
+        if tag not in VOID_ELEMENTS:
+            self.current = node
+
+    def handle_startendtag(self, tag, attrs):
+        self.current.children.append(DomNode(tag, dict(attrs), self.current))
+
+    def handle_endtag(self, tag):
+        node = self.current
+        while node is not self.root and node.tag != tag:
+            node = node.parent
+        if node is not self.root:
+            self.current = node.parent
+
+    def handle_data(self, data):
+        self.current.children.append(data)
+
+SELECTOR_TOKEN = re.compile(r"""
+    (?P<comma>\s*,\s*)
+  | (?P<combinator>\s*[>+~]\s*)
+  | (?P<space>\s+)
+  | (?P<tag>\*|[a-zA-Z][\w-]*)
+  | \#(?P<id>[\w-]+)
+  | \.(?P<cls>[\w-]+)
+  | \[\s*(?P<attr>[\w:-]+)\s*(?:(?P<op>[~|^$*]?=)\s*(?:"(?P<dq>[^"]*)"|'(?P<sq>[^']*)'|(?P<bare>[^\]\s]+))\s*)?\]
+""", re.X)
+
+@lru_cache(maxsize=256)
+def parse_selector(selector: str) -> tuple:
+    """Parse a CSS selector list into alternatives of (combinator, tag, ids, classes, attrs) parts"""
+    alternatives, parts = [], []
+    combinator, compound = None, None
+    position = 0
+    selector = selector.strip()
+    while position < len(selector):
+        match = SELECTOR_TOKEN.match(selector, position)
+        if match is None:
+            raise UnsupportedSelector(f"Unsupported selector syntax: {selector[position:]}")
+        position = match.end()
+        kind = match.lastgroup if match.lastgroup in ("comma", "combinator", "space") else "simple"
+        if kind in ("comma", "combinator", "space"):
+            if compound is None:
+                if kind == "space":
+                    continue
+                raise UnsupportedSelector(f"Unsupported selector syntax: {selector}")
+            parts.append((combinator, *compound))
+            compound = None
+            combinator = match.group(kind).strip() or " "
+            if kind == "comma":
+                alternatives.append(tuple(parts))
+                parts, combinator = [], None
+            continue
+        if compound is None:
+            compound = [None, (), (), ()]
+        if match.group("tag"):
+            compound[0] = None if match.group("tag") == "*" else match.group("tag").lower()
+        elif match.group("id"):
+            compound[1] += (match.group("id"),)
+        elif match.group("cls"):
+            compound[2] += (match.group("cls"),)
+        else:
+            value = next((v for v in match.group("dq", "sq", "bare") if v is not None), None)
+            compound[3] += ((match.group("attr").lower(), match.group("op"), value),)
+    if compound is None:
+        raise UnsupportedSelector(f"Unsupported selector syntax: {selector}")
+    parts.append((combinator, *compound))
+    alternatives.append(tuple(parts))
+    return tuple(alternatives)
+
+def match_compound(node: DomNode, tag, ids, classes, attrs) -> bool:
+    if tag is not None and node.tag != tag:
+        return False
+    if ids and any(node.attrs.get("id") != value for value in ids):
+        return False
+    if classes:
+        present = (node.attrs.get("class") or "").split()
+        if any(name not in present for name in classes):
+            return False
+    for name, op, value in attrs:
+        actual = node.attrs.get(name)
+        if name not in node.attrs:
+            return False
+        actual = actual or ""
+        if op is None:
+            continue
+        if not (
+            (op == "=" and actual == value)
+            or (op == "~=" and value in actual.split())
+            or (op == "|=" and (actual == value or actual.startswith(value + "-")))
+            or (op == "^=" and value and actual.startswith(value))
+            or (op == "$=" and value and actual.endswith(value))
+            or (op == "*=" and value and value in actual)
+        ):
+            return False
+    return True
+
+def previous_elements(node: DomNode):
+    siblings = [child for child in node.parent.children if isinstance(child, DomNode)]
+    return reversed(siblings[:siblings.index(node)])
+
+def match_parts(node: DomNode, parts: tuple, index: int) -> bool:
+    combinator, *compound = parts[index]
+    if not match_compound(node, *compound):
+        return False
+    if index == 0:
+        return True
+    if combinator == ">":
+        parent = node.parent
+        return parent is not None and parent.tag != "#document" and match_parts(parent, parts, index - 1)
+    if combinator == " ":
+        parent = node.parent
+        while parent is not None and parent.tag != "#document":
+            if match_parts(parent, parts, index - 1):
+                return True
+            parent = parent.parent
+        return False
+    if node.parent is None:
+        return False
+    if combinator == "+":
+        previous = next(iter(previous_elements(node)), None)
+        return previous is not None and match_parts(previous, parts, index - 1)
+    return any(match_parts(sibling, parts, index - 1) for sibling in previous_elements(node))
+
+def query_all(scope: DomNode, selector: str, elements: list = None) -> list[DomNode]:
+    """Matches below scope in document order (elements: scope's descendants, if already listed)"""
+    alternatives = parse_selector(selector)
+    return [node for node in (elements if elements is not None else scope.elements())
+            if any(match_parts(node, parts, len(parts) - 1) for parts in alternatives)]
+
+class DomSnapshot:
+    """A parsed document captured at one page version"""
+
+    def __init__(self, version: int, url: str, title: str, markup: str, values: list):
+        self.version = version
+        self.url = url
+        self.title = title
+        self.bytes = len(markup)
+        builder = DomBuilder()
+        builder.feed(markup)
+        builder.close()
+        self.root = builder.root
+        self.elements = list(self.root.elements())
+        fields = [node for node in self.elements if node.tag in ("input", "textarea", "select")]
+        for node, value in zip(fields, values):
+            node.value = value
+        self.element_count = len(self.elements)
+        self.captured = time.time()
+        self._outline = None
+
+    def extract(self, selector: str, attribute: str = "text", fields: dict = None,
+                limit: int = None, compact: bool = False) -> dict:
+        """Same result as extract() on the live page, from the parsed tree"""
+        def read(node, attr):
+            if node is None:
+                return None
+            value = node.read(attr)
+            if compact and isinstance(value, str):
+                value = " ".join(value.split())
+            return value
+
+        fields = normalize_fields(fields) if fields else None
+        matches = query_all(self.root, selector, self.elements)
+        items = []
+        for row in matches[:limit] if limit else matches:
+            if not fields:
+                items.append(read(row, attribute))
+                continue
+            record = {}
+            for name, spec in fields.items():
+                if spec["all"]:
+                    nodes = query_all(row, spec["selector"]) if spec["selector"] else [row]
+                    record[name] = [read(node, spec["attribute"]) for node in nodes]
+                else:
+                    node = row
+                    if spec["selector"]:
+                        node = next(iter(query_all(row, spec["selector"])), None)
+                    value = read(node, spec["attribute"])
+                    if not (compact and value is None):
+                        record[name] = value
+            items.append(record)
+        return {"total": len(matches), "items": items}
+
+    def outline(self) -> list[str]:
+        """One line per element with its own text (or form value), for reading and diffing"""
+        if self._outline is not None:
+            return self._outline
+        lines = []
+        stack = [(self.root, False)]
+        while stack:
+            node, hidden = stack.pop()
+            hidden = hidden or node.tag in HIDDEN_ELEMENTS
+            if hidden:
+                continue
+            label = node.tag
+            if node.attrs.get("id"):
+                label += "#" + node.attrs["id"]
+            elif node.attrs.get("class"):
+                label += "." + node.attrs["class"].split()[0]
+            own = " ".join(" ".join(child.split()) for child in node.children
+                           if isinstance(child, str) and child.strip())
+            if node.value is not None:
+                lines.append(f"{label}[name={node.attrs.get('name', '')}] = {node.value}")
+            elif own:
+                lines.append(f"{label}: {own}")
+            stack.extend((child, False) for child in reversed(node.children) if isinstance(child, DomNode))
+        self._outline = lines
+        return lines
+
+snapshot_stats = {"captures": 0, "reused": 0, "invalidations": 0, "local_extracts": 0, "live_extracts": 0}
+
+async def watch_page(slot: PageSlot):
+    """Mark the slot's snapshot stale on main-frame navigation or on the page's mutation callback"""
+    if slot.watching:
+        return
+
+    def invalidate(*_):
+        if slot.snapshot is not None and not slot.stale:
+            snapshot_stats["invalidations"] += 1
+        slot.stale = True
+
+    page = slot.page
+    page.on("framenavigated", lambda frame: invalidate() if frame == page.main_frame else None)
+    await page.expose_binding("__mcpSnapshotDirty", invalidate)
+    slot.watching = True
+
+async def take_snapshot(slot: PageSlot, force: bool = False) -> tuple[DomSnapshot, bool]:
+    """Return (snapshot, reused): the cached snapshot while it is valid, else a new capture"""
+    if slot.snapshot is not None and not slot.stale and not force:
+        snapshot_stats["reused"] += 1
+        return slot.snapshot, True
+    await watch_page(slot)
+    # Cleared before capturing so a mutation during the capture marks the new snapshot stale
+    slot.stale = False
+    result = await slot.page.evaluate(SNAPSHOT_SCRIPT)
+    version = slot.snapshot.version + 1 if slot.snapshot is not None else 1
+    slot.snapshot = DomSnapshot(version, result["url"], result["title"], result["html"], result["values"])
+    snapshot_stats["captures"] += 1
+    return slot.snapshot, False
+
+def diff_snapshots(before: DomSnapshot, after: DomSnapshot, max_lines: int = 200) -> dict:
+    old, new = (before.outline() if before is not None else []), after.outline()
+    added, removed = [], []
+    for op, i1, i2, j1, j2 in difflib.SequenceMatcher(None, old, new, autojunk=False).get_opcodes():
+        if op in ("replace", "delete"):
+            removed.extend(old[i1:i2])
+        if op in ("replace", "insert"):
+            added.extend(new[j1:j2])
+    return {
+        "changed": bool(added or removed) or before is None or before.url != after.url,
+        "from_version": before.version if before is not None else None,
+        "to_version": after.version,
+        "url_changed": before is not None and before.url != after.url,
+        "added_count": len(added),
+        "removed_count": len(removed),
+        "added": added[:max_lines],
+        "removed": removed[:max_lines]
+    }
+
+async def extract_cached(slot: PageSlot, selector: str, attribute: str = "text", fields: dict = None,
+                         limit: int = None, compact: bool = False) -> dict:
+    """Answer from a valid snapshot when there is one and it supports the query, else from the live page"""
+    if slot.snapshot is not None and not slot.stale:
+        try:
+            result = slot.snapshot.extract(selector, attribute, fields, limit, compact)
+            snapshot_stats["local_extracts"] += 1
+            return result
+        except UnsupportedSelector:
+            pass
+    snapshot_stats["live_extracts"] += 1
+    return await extract(slot.page, selector, attribute, fields, limit, compact)
+
+async def capture_screenshot(page, image_format: str = "png", quality: int = 80, clip: dict = None,
+                             selector: str = None, full_page: bool = False,
+                             max_dimension: int = 0) -> tuple[str, int, int]:
+    """Capture over CDP and return (base64 data, width, height) exactly as Chromium encoded it.
+
+    clip is in page coordinates. Downscaling uses the capture scale, so the
+    browser renders straight to the target size and nothing is re-encoded here.
+    """
+    if image_format not in SCREENSHOT_FORMATS:
+        raise ValueError(f"Unknown format: {image_format} (available: {', '.join(SCREENSHOT_FORMATS)})")
+    # PNG is lossless and takes no quality; for the others reject what CDP would refuse
+    if image_format != "png" and (
+        isinstance(quality, bool) or not isinstance(quality, (int, float))
+        or quality != int(quality) or not 0 <= quality <= 100
+    ):
+        raise ValueError(f"quality must be an integer from 0 to 100, got {quality!r}")
+    cdp = await page.context.new_cdp_session(page)
+    try:
+        metrics = await cdp.send("Page.getLayoutMetrics")
+        viewport = metrics["cssLayoutViewport"]
+        if selector:
+            element = await page.query_selector(selector)
+            box = await element.bounding_box() if element is not None else None
+            if box is None:
+                raise ValueError(f"Element not found or not visible: {selector}")
+            region = {"x": box["x"] + viewport["pageX"], "y": box["y"] + viewport["pageY"],
+                      "width": box["width"], "height": box["height"]}
+        elif clip:
+            region = {key: float(clip[key]) for key in ("x", "y", "width", "height")}
+        elif full_page:
+            content = metrics["cssContentSize"]
+            region = {"x": 0, "y": 0, "width": content["width"], "height": content["height"]}
+        else:
+            region = {"x": viewport["pageX"], "y": viewport["pageY"],
+                      "width": viewport["clientWidth"], "height": viewport["clientHeight"]}
+        if region["width"] <= 0 or region["height"] <= 0:
+            raise ValueError("Empty screenshot region")
+
+        scale = min(1.0, max_dimension / max(region["width"], region["height"])) if max_dimension else 1.0
+        inside_viewport = (
+            region["x"] >= viewport["pageX"] and region["y"] >= viewport["pageY"]
+            and region["x"] + region["width"] <= viewport["pageX"] + viewport["clientWidth"]
+            and region["y"] + region["height"] <= viewport["pageY"] + viewport["clientHeight"]
+        )
+        params = {"format": image_format, "clip": {**region, "scale": scale},
+                  "captureBeyondViewport": not inside_viewport}
+        if image_format != "png":
+            params["quality"] = int(quality)
+        result = await cdp.send("Page.captureScreenshot", params)
+    finally:
+        await cdp.detach()
+    return result["data"], round(region["width"] * scale), round(region["height"] * scale)
+
+def progress_reporter():
+    """Return an async (done, total, text) callback sending MCP progress notifications, if the client asked for them"""
+    try:
+        ctx = server.request_context
+    except LookupError:
+        return None
+    token = ctx.meta.progressToken if ctx.meta else None
+    if token is None:
+        return None
+
+    async def report(done: int, total: int, text: str):
+        try:
+            await ctx.session.send_progress_notification(
+                token, done, total=total, message=text, related_request_id=ctx.request_id
+            )
+        except Exception:
+            pass  # A lost notification must not abort the crawl
+
+    return report
+
+# Runs in the page: absolute URLs of the links a crawl may follow
+LINKS_SCRIPT = """
+(nodes) => nodes.map(el => el.href || el.getAttribute("href"))
+    .filter(href => typeof href === "string" && href)
+"""
+
+class HostLimiter:
+    """Spaces navigation starts on the same host at least 1/rate seconds apart"""
+
+    def __init__(self, rate: float):
+        self.interval = 1.0 / rate if rate > 0 else 0.0
+        self.next_start: dict[str, float] = {}
+        self.waited = 0.0
+
+    async def wait(self, url: str):
+        if not self.interval:
+            return
+        host = urlsplit(url).netloc
+        now = time.monotonic()
+        start = max(now, self.next_start.get(host, now))
+        # Reserve the slot before sleeping so concurrent workers queue up behind it
+        self.next_start[host] = start + self.interval
+        if start > now:
+            self.waited += start - now
+            await asyncio.sleep(start - now)
+
+crawl_ids = itertools.count(1)
+
+async def crawl(urls: list[str], follow: dict = None, spec: dict = None,
+                concurrency: int = PLAYWRIGHT_CRAWL_CONCURRENCY, max_pages: int = PLAYWRIGHT_CRAWL_MAX_PAGES,
+                timeout: float = PLAYWRIGHT_CRAWL_TIMEOUT, host_rate: float = PLAYWRIGHT_CRAWL_HOST_RATE,
+                profile: str = PLAYWRIGHT_PROFILE, javascript: bool = None, wait_until: str = "load",
+                cache: str = PLAYWRIGHT_CACHE, compact: bool = False, report=None) -> dict:
+    """Visit urls (and the links `follow` allows) on up to `concurrency` pool pages at once.
+
+    Each page is navigated, run through the extraction `spec` and, when
+    following links, scanned for new URLs. Results are passed to `report`
+    as they complete and returned in discovery order.
+    """
+    if profile not in NAVIGATION_PROFILES:
+        raise ValueError(f"Unknown profile: {profile} (available: {', '.join(NAVIGATION_PROFILES)})")
+    if cache not in CACHE_MODES:
+        raise ValueError(f"Unknown cache mode: {cache} (available: {', '.join(CACHE_MODES)})")
+    if spec is not None and not spec.get("selector"):
+        raise ValueError("extract needs a selector")
+    follow = follow or {}
+    max_depth = int(follow.get("max_depth", 1)) if follow else 0
+    link_selector = follow.get("selector", "a[href]")
+    link_pattern = re.compile(follow["pattern"]) if follow.get("pattern") else None
+    same_host = follow.get("same_host", True)
+    hosts = {urlsplit(url).netloc for url in urls}
+
+    limiter = HostLimiter(host_rate)
+    queue: asyncio.Queue = asyncio.Queue()
+    seen: dict[str, int] = {}
+    results: list[dict] = []
+
+    def enqueue(url: str, depth: int):
+        url = urldefrag(url)[0]
+        if url in seen or len(seen) >= max_pages:
+            return
+        seen[url] = len(seen)
+        queue.put_nowait((url, depth))
+
+    def allowed(url: str) -> bool:
+        parts = urlsplit(url)
+        if parts.scheme not in ("http", "https"):
+            return False
+        if same_host and parts.netloc not in hosts:
+            return False
+        return link_pattern is None or link_pattern.search(url) is not None
+
+    async def visit(page, url: str, depth: int) -> dict:
+        response = await page.goto(url, wait_until=wait_until, timeout=timeout * 1000)
+        entry = {"url": url, "depth": depth, "status": response.status if response else None,
+                 "title": await page.title()}
+        if spec is not None:
+            limit = None if spec.get("all", False) else 1
+            limit = spec.get("limit", limit)
+            result = await extract(page, spec["selector"], spec.get("attribute", "text"),
+                                   spec.get("fields"), limit, compact)
+            entry["data"] = result["items"] if spec.get("all", False) else (result["items"] or [None])[0]
+        if depth < max_depth:
+            for href in await page.locator(link_selector).evaluate_all(LINKS_SCRIPT):
+                link = urljoin(page.url, href)
+                if allowed(link):
+                    enqueue(link, depth + 1)
+        return entry
+
+    async def fetch(page_id: str, url: str, depth: int) -> dict:
+        async with pool.use(page_id, javascript, ephemeral=True) as page:
+            slot = pool.slots[page_id]
+            await slot.set_profile(profile)
+            await slot.set_cache(cache)
+            await limiter.wait(url)
+            blocked = slot.blocked
+            started = time.perf_counter()
+            try:
+                entry = await asyncio.wait_for(visit(page, url, depth), timeout)
+            except Exception as e:
+                navigation_stats.record(profile, slot.javascript, time.perf_counter() - started,
+                                        slot.blocked - blocked, error=True)
+                message = f"Timed out after {timeout:g}s" if isinstance(e, asyncio.TimeoutError) else str(e)
+                return {"url": url, "depth": depth, "error": message}
+            elapsed = time.perf_counter() - started
+            navigation_stats.record(profile, slot.javascript, elapsed, slot.blocked - blocked)
+            entry["ms"] = round(elapsed * 1000)
+        await pool.record_navigation(page_id)
+        return entry
+
+    async def worker(page_id: str):
+        try:
+            while True:
+                url, depth = await queue.get()
+                try:
+                    try:
+                        entry = await fetch(page_id, url, depth)
+                    except Exception as e:
+                        entry = {"url": url, "depth": depth, "error": str(e)}
+                    results.append(entry)
+                    if report is not None:
+                        await report(len(results), len(seen), dump_json(entry, True))
+                finally:
+                    queue.task_done()
+        finally:
+            await pool.close(page_id)
+
+    # Workers only use pages no user page_id holds, so a crawl never evicts a session
+    capacity = pool.free_for_ephemeral()
+    if capacity < 1:
+        raise ValueError(f"No free pages for crawl workers: all {pool.max_pages} pages are in use; "
+                         "close some pages or raise PLAYWRIGHT_MAX_PAGES")
+    for url in urls:
+        enqueue(url, 0)
+    crawl_id = next(crawl_ids)
+    workers = max(1, min(concurrency, capacity, max_pages))
+    started = time.perf_counter()
+    tasks = [asyncio.create_task(worker(f"crawl-{crawl_id}-{n}")) for n in range(workers)]
+    try:
+        await queue.join()
+    finally:
+        for task in tasks:
+            task.cancel()
+        await asyncio.gather(*tasks, return_exceptions=True)
+    elapsed = time.perf_counter() - started
+
+    results.sort(key=lambda entry: seen[entry["url"]])
+    errors = sum(1 for entry in results if "error" in entry)
+    return {
+        "pages": len(results),
+        "errors": errors,
+        "concurrency": workers,
+        "seconds": round(elapsed, 3),
+        "pages_per_sec": round(len(results) / elapsed, 2) if elapsed else None,
+        "host_wait_seconds": round(limiter.waited, 3),
+        "results": results
+    }
 
 @server.list_tools()
 async def list_tools() -> list[Tool]:
@@ -53,6 +1354,24 @@ async def list_tools() -> list[Tool]:
                         "type": "string",
                         "enum": ["load", "domcontentloaded", "networkidle"],
                         "default": "load"
+                    },
+                    "profile": {
+                        "type": "string",
+                        "enum": list(NAVIGATION_PROFILES),
+                        "default": PLAYWRIGHT_PROFILE,
+                        "description": "full loads everything; no-media blocks images, media, fonts and trackers; "
+                                       "text-only also blocks stylesheets"
+                    },
+                    "javascript": {
+                        "type": "boolean",
+                        "description": "Run page JavaScript (default: keep the page's current setting; new pages run it)"
+                    },
+                    "cache": {
+                        "type": "string",
+                        "enum": list(CACHE_MODES),
+                        "default": PLAYWRIGHT_CACHE,
+                        "description": "Response cache: cache honours HTTP cache headers (or forced hosts), "
+                                       "record stores every response, replay serves only stored responses"
                     }
                 },
                 "required": ["url"]
@@ -66,7 +1385,25 @@ async def list_tools() -> list[Tool]:
                 "properties": {
                     "page_id": {"type": "string", "default": "default"},
                     "selector": {"type": "string", "description": "CSS selector to screenshot"},
-                    "full_page": {"type": "boolean", "default": False}
+                    "full_page": {"type": "boolean", "default": False},
+                    "clip": {
+                        "type": "object",
+                        "description": "Region in page coordinates: {x, y, width, height}"
+                    },
+                    "format": {"type": "string", "enum": list(SCREENSHOT_FORMATS), "default": "png"},
+                    "quality": {
+                        "type": "integer", "minimum": 0, "maximum": 100, "default": 80,
+                        "description": "JPEG/WebP quality (ignored for png)"
+                    },
+                    "max_dimension": {
+                        "type": "integer", "default": PLAYWRIGHT_SCREENSHOT_MAX_DIMENSION,
+                        "description": "Downscale so the longest side is at most this many pixels (0 = off)"
+                    },
+                    "output": {
+                        "type": "string", "enum": list(SCREENSHOT_OUTPUTS), "default": PLAYWRIGHT_SCREENSHOT_OUTPUT,
+                        "description": "image or resource content block, or a file in the screenshot directory"
+                    },
+                    "filename": {"type": "string", "description": "File name for output=file"}
                 }
             }
         ),
@@ -84,18 +1421,49 @@ async def list_tools() -> list[Tool]:
         ),
         Tool(
             name="browser_extract",
-            description="Extract data from the page",
+            description="Extract data from the page in a single round trip, as values or as records of fields",
             inputSchema={
                 "type": "object",
                 "properties": {
-                    "selector": {"type": "string", "description": "CSS selector"},
-                    "attribute": {"type": "string", "description": "Attribute to extract (text, html, href, etc.)"},
+                    "selector": {"type": "string", "description": "CSS selector (the row selector when fields are given)"},
+                    "attribute": {
+                        "type": "string",
+                        "description": "Attribute to extract (text, inner_text, html, outer_html, value, href, etc.)"
+                    },
                     "page_id": {"type": "string", "default": "default"},
-                    "all": {"type": "boolean", "default": False, "description": "Extract all matching elements"}
+                    "all": {"type": "boolean", "default": False, "description": "Extract all matching elements"},
+                    "fields": {
+                        "type": "object",
+                        "description": "Record fields per match: {name: css} or {name: {selector, attribute, all}}; "
+                                       "an empty selector means the matched element itself"
+                    },
+                    "limit": {"type": "integer", "description": "Return at most this many matches, with the total count"},
+                    "compact": {
+                        "type": "boolean", "default": False,
+                        "description": "Collapse whitespace, drop missing fields and emit minified JSON"
+                    }
                 },
                 "required": ["selector"]
             }
         ),
+        Tool(
+            name="browser_snapshot",
+            description="Capture a DOM snapshot once per page version; browser_extract is then answered from it "
+                        "until a navigation or mutation. diff reports what changed since the previous snapshot",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "page_id": {"type": "string", "default": "default"},
+                    "format": {
+                        "type": "string", "enum": ["summary", "text", "html"], "default": "summary",
+                        "description": "summary, a text outline (one line per element with text) or the serialized HTML"
+                    },
+                    "diff": {"type": "boolean", "default": False, "description": "Report changes since the previous snapshot"},
+                    "force": {"type": "boolean", "default": False, "description": "Capture even if the snapshot is valid"},
+                    "max_chars": {"type": "integer", "default": 20000, "description": "Truncate text/html output"}
+                }
+            }
+        ),
         Tool(
             name="browser_fill",
             description="Fill a form field",
@@ -118,11 +1486,66 @@ async def list_tools() -> list[Tool]:
                     "page_id": {"type": "string", "default": "default"}
                 }
             }
+        ),
+        Tool(
+            name="browser_crawl",
+            description="Visit many URLs concurrently (a list, or a seed URL with link-follow rules), "
+                        "extract data from each page and stream results as progress notifications",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "urls": {"type": "array", "items": {"type": "string"}, "description": "URLs to visit"},
+                    "url": {"type": "string", "description": "Seed URL (alternative to urls)"},
+                    "follow": {
+                        "type": "object",
+                        "description": "Link-follow rules: {selector (default a[href]), pattern (regex on the "
+                                       "absolute URL), same_host (default true), max_depth (default 1)}"
+                    },
+                    "extract": {
+                        "type": "object",
+                        "description": "Extraction spec applied to every page, as in browser_extract: "
+                                       "{selector, attribute, fields, all, limit}"
+                    },
+                    "concurrency": {
+                        "type": "integer", "default": PLAYWRIGHT_CRAWL_CONCURRENCY,
+                        "description": "Pages fetched at once (capped by the page pool size)"
+                    },
+                    "max_pages": {"type": "integer", "default": PLAYWRIGHT_CRAWL_MAX_PAGES},
+                    "timeout": {
+                        "type": "number", "default": PLAYWRIGHT_CRAWL_TIMEOUT,
+                        "description": "Seconds allowed per page (navigation plus extraction)"
+                    },
+                    "host_rate": {
+                        "type": "number", "default": PLAYWRIGHT_CRAWL_HOST_RATE,
+                        "description": "Navigations started per second on the same host (0 = unlimited)"
+                    },
+                    "profile": {"type": "string", "enum": list(NAVIGATION_PROFILES), "default": PLAYWRIGHT_PROFILE},
+                    "javascript": {"type": "boolean", "description": "Run page JavaScript (default: true)"},
+                    "cache": {"type": "string", "enum": list(CACHE_MODES), "default": PLAYWRIGHT_CACHE},
+                    "wait_until": {
+                        "type": "string",
+                        "enum": ["load", "domcontentloaded", "networkidle"],
+                        "default": "load"
+                    },
+                    "compact": {"type": "boolean", "default": False}
+                }
+            }
+        ),
+        Tool(
+            name="browser_stats",
+            description="Show page pool statistics (open pages, warm hits, evictions, browser recycling), "
+                        "navigation timings per profile and response cache hits",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "clear_cache": {"type": "boolean", "default": False, "description": "Empty the response cache"}
+                }
+            }
         )
     ]
 
 @server.call_tool()
-async def call_tool(name: str, arguments: Any) -> list[TextContent]:
+async def call_tool(name: str, arguments: Any) -> list[TextContent | ImageContent | EmbeddedResource]:
     if not PLAYWRIGHT_AVAILABLE:
         return [TextContent(
             type="text",
@@ -131,82 +1554,145 @@ async def call_tool(name: str, arguments: Any) -> list[TextContent]:
 
     try:
         if name == "browser_navigate":
-            page = await get_page(arguments.get("page_id", "default"))
-            await page.goto(
-                arguments["url"],
-                wait_until=arguments.get("wait_until", "load")
-            )
-            title = await page.title()
+            page_id = arguments.get("page_id", "default")
+            profile = arguments.get("profile", PLAYWRIGHT_PROFILE)
+            async with pool.use(page_id, arguments.get("javascript")) as page:
+                slot = pool.slots[page_id]
+                javascript = slot.javascript
+                await slot.set_profile(profile)
+                await slot.set_cache(arguments.get("cache", PLAYWRIGHT_CACHE))
+                blocked = slot.blocked
+                started = time.perf_counter()
+                try:
+                    await page.goto(
+                        arguments["url"],
+                        wait_until=arguments.get("wait_until", "load")
+                    )
+                except Exception:
+                    navigation_stats.record(profile, javascript, time.perf_counter() - started,
+                                            slot.blocked - blocked, error=True)
+                    raise
+                elapsed = time.perf_counter() - started
+                blocked = slot.blocked - blocked
+                navigation_stats.record(profile, javascript, elapsed, blocked)
+                title = await page.title()
+            await pool.record_navigation(page_id)
             return [TextContent(
                 type="text",
-                text=f"Navigated to: {arguments['url']}\nTitle: {title}"
+                text=f"Navigated to: {arguments['url']}\nTitle: {title}\n"
+                     f"Time: {elapsed * 1000:.0f} ms ({profile}{'' if javascript else ', no JS'}, {blocked} requests blocked)"
             )]
 
         elif name == "browser_screenshot":
-            page = await get_page(arguments.get("page_id", "default"))
-            selector = arguments.get("selector")
-
-            if selector:
-                element = await page.query_selector(selector)
-                screenshot = await element.screenshot()
-            else:
-                screenshot = await page.screenshot(
-                    full_page=arguments.get("full_page", False)
+            page_id = arguments.get("page_id", "default")
+            image_format = arguments.get("format", "png")
+            output = arguments.get("output", PLAYWRIGHT_SCREENSHOT_OUTPUT)
+            if output not in SCREENSHOT_OUTPUTS:
+                return [TextContent(type="text", text=f"Error: Unknown output: {output} "
+                                                      f"(available: {', '.join(SCREENSHOT_OUTPUTS)})")]
+            async with pool.use(page_id) as page:
+                data, width, height = await capture_screenshot(
+                    page,
+                    image_format,
+                    quality=arguments.get("quality", 80),
+                    clip=arguments.get("clip"),
+                    selector=arguments.get("selector"),
+                    full_page=arguments.get("full_page", False),
+                    max_dimension=arguments.get("max_dimension", PLAYWRIGHT_SCREENSHOT_MAX_DIMENSION)
                 )
 
-            # Return base64 encoded screenshot
-            import base64
-            encoded = base64.b64encode(screenshot).decode()
-            return [TextContent(
-                type="text",
-                text=f"Screenshot captured ({len(screenshot)} bytes)\nBase64: {encoded[:100]}..."
-            )]
+            size = len(data) * 3 // 4 - data[-2:].count("=")
+            summary = f"{width}x{height} {image_format}, {size} bytes"
+            safe_id = re.sub(r"[^\w.-]", "_", page_id)
+            filename = os.path.basename(arguments.get("filename") or "") or f"{safe_id}-{time.time_ns()}.{image_format}"
+            if output == "file":
+                # Only the file needs the raw bytes; the other outputs pass Chromium's base64 through
+                os.makedirs(PLAYWRIGHT_SCREENSHOT_DIR, exist_ok=True)
+                path = os.path.join(PLAYWRIGHT_SCREENSHOT_DIR, filename)
+                with open(path, "wb") as f:
+                    f.write(base64.b64decode(data))
+                return [TextContent(type="text", text=f"Screenshot saved: {path} ({summary})")]
+            if output == "resource":
+                return [EmbeddedResource(type="resource", resource=BlobResourceContents(
+                    uri=f"screenshot://{page_id}/{filename}", mimeType=SCREENSHOT_FORMATS[image_format], blob=data
+                ))]
+            return [
+                TextContent(type="text", text=f"Screenshot captured ({summary})"),
+                ImageContent(type="image", data=data, mimeType=SCREENSHOT_FORMATS[image_format])
+            ]
 
         elif name == "browser_click":
-            page = await get_page(arguments.get("page_id", "default"))
-            await page.click(arguments["selector"])
+            page_id = arguments.get("page_id", "default")
+            async with pool.use(page_id) as page:
+                pool.slots[page_id].stale = True
+                await page.click(arguments["selector"])
             return [TextContent(
                 type="text",
                 text=f"Clicked element: {arguments['selector']}"
             )]
 
         elif name == "browser_extract":
-            page = await get_page(arguments.get("page_id", "default"))
             selector = arguments["selector"]
             attribute = arguments.get("attribute", "text")
+            fields = arguments.get("fields")
+            compact = arguments.get("compact", False)
+            limit = arguments.get("limit")
 
-            if arguments.get("all", False):
-                elements = await page.query_selector_all(selector)
-                results = []
-                for element in elements:
-                    if attribute == "text":
-                        value = await element.text_content()
-                    elif attribute == "html":
-                        value = await element.inner_html()
+            page_id = arguments.get("page_id", "default")
+            async with pool.use(page_id):
+                slot = pool.slots[page_id]
+                if arguments.get("all", False):
+                    result = await extract_cached(slot, selector, attribute, fields, limit, compact)
+                    if limit is not None:
+                        output = {"total": result["total"], "returned": len(result["items"]), "items": result["items"]}
                     else:
-                        value = await element.get_attribute(attribute)
-                    results.append(value)
-                return [TextContent(
-                    type="text",
-                    text=json.dumps(results, indent=2)
-                )]
-            else:
-                element = await page.query_selector(selector)
-                if not element:
-                    return [TextContent(type="text", text=f"Element not found: {selector}")]
-
-                if attribute == "text":
-                    value = await element.text_content()
-                elif attribute == "html":
-                    value = await element.inner_html()
+                        output = result["items"]
+                    return [TextContent(type="text", text=dump_json(output, compact))]
                 else:
-                    value = await element.get_attribute(attribute)
+                    result = await extract_cached(slot, selector, attribute, fields, 1, compact)
+                    if not result["items"]:
+                        return [TextContent(type="text", text=f"Element not found: {selector}")]
+
+                    value = result["items"][0]
+                    return [TextContent(type="text", text=dump_json(value, compact) if fields else str(value))]
 
-                return [TextContent(type="text", text=str(value))]
+        elif name == "browser_snapshot":
+            page_id = arguments.get("page_id", "default")
+            output_format = arguments.get("format", "summary")
+            max_chars = arguments.get("max_chars", 20000)
+            async with pool.use(page_id):
+                slot = pool.slots[page_id]
+                previous = slot.snapshot
+                started = time.perf_counter()
+                snapshot, reused = await take_snapshot(slot, arguments.get("force", False))
+                elapsed = time.perf_counter() - started
+
+            output = {
+                "version": snapshot.version,
+                "url": snapshot.url,
+                "title": snapshot.title,
+                "reused": reused,
+                "elements": snapshot.element_count,
+                "bytes": snapshot.bytes,
+                "capture_ms": None if reused else round(elapsed * 1000, 1)
+            }
+            if arguments.get("diff", False):
+                if reused:
+                    output.update(changed=False, from_version=snapshot.version, to_version=snapshot.version)
+                else:
+                    output.update(diff_snapshots(previous, snapshot))
+            if output_format == "text":
+                output["text"] = "\n".join(snapshot.outline())[:max_chars]
+            elif output_format == "html":
+                output["html"] = snapshot.root.inner_html()[:max_chars]
+            return [TextContent(type="text", text=json.dumps(output, indent=2))]
 
         elif name == "browser_fill":
-            page = await get_page(arguments.get("page_id", "default"))
-            await page.fill(arguments["selector"], arguments["value"])
+            page_id = arguments.get("page_id", "default")
+            async with pool.use(page_id) as page:
+                # Typing changes .value without a DOM mutation
+                pool.slots[page_id].stale = True
+                await page.fill(arguments["selector"], arguments["value"])
             return [TextContent(
                 type="text",
                 text=f"Filled {arguments['selector']} with value"
@@ -214,26 +1700,63 @@ async def call_tool(name: str, arguments: Any) -> list[TextContent]:
 
         elif name == "browser_close":
             page_id = arguments.get("page_id", "default")
-            if page_id in pages:
-                await pages[page_id].close()
-                del pages[page_id]
+            if await pool.close(page_id):
                 return [TextContent(type="text", text=f"Closed page: {page_id}")]
             return [TextContent(type="text", text=f"Page not found: {page_id}")]
 
+        elif name == "browser_crawl":
+            urls = list(arguments.get("urls") or [])
+            if arguments.get("url"):
+                urls.insert(0, arguments["url"])
+            if not urls:
+                return [TextContent(type="text", text="Error: provide urls or a seed url")]
+            compact = arguments.get("compact", False)
+            result = await crawl(
+                urls,
+                follow=arguments.get("follow"),
+                spec=arguments.get("extract"),
+                concurrency=arguments.get("concurrency", PLAYWRIGHT_CRAWL_CONCURRENCY),
+                max_pages=arguments.get("max_pages", PLAYWRIGHT_CRAWL_MAX_PAGES),
+                timeout=arguments.get("timeout", PLAYWRIGHT_CRAWL_TIMEOUT),
+                host_rate=arguments.get("host_rate", PLAYWRIGHT_CRAWL_HOST_RATE),
+                profile=arguments.get("profile", PLAYWRIGHT_PROFILE),
+                javascript=arguments.get("javascript"),
+                wait_until=arguments.get("wait_until", "load"),
+                cache=arguments.get("cache", PLAYWRIGHT_CACHE),
+                compact=compact,
+                report=progress_reporter()
+            )
+            return [TextContent(type="text", text=dump_json(result, compact))]
+
+        elif name == "browser_stats":
+            if arguments.get("clear_cache", False):
+                removed = response_store.clear()
+                return [TextContent(type="text", text=f"Response cache cleared ({removed} entries)")]
+            stats = {
+                **pool.report(),
+                "navigation": navigation_stats.report(),
+                "cache": response_store.report(),
+                "snapshots": snapshot_stats
+            }
+            return [TextContent(type="text", text=json.dumps(stats, indent=2))]
+
     except Exception as e:
         return [TextContent(type="text", text=f"Error: {str(e)}")]
 
     raise ValueError(f"Unknown tool: {name}")
 
 async def main():
+    if PLAYWRIGHT_AVAILABLE:
+        # Launch and pre-warm in the background so the first request finds a ready context
+        warmup = asyncio.create_task(pool.start())
     async with stdio_server() as (read_stream, write_stream):
         try:
             await server.run(read_stream, write_stream, server.create_initialization_options())
         finally:
             # Cleanup
-            global browser
-            if browser:
-                await browser.close()
+            if PLAYWRIGHT_AVAILABLE:
+                warmup.cancel()
+                await pool.shutdown()
 
 if __name__ == "__main__":
     asyncio.run(main())
@@ -0,0 +1,114 @@
+#!/usr/bin/env python3
+"""Sequential server benchmark - many parallel chains with many steps each
+
+Drives the server's call_tool handler in-process (no stdio transport) and
+prints a JSON report with throughput for single and batched step appends.
+
+Usage:
+    python benchmark.py --chains 2000 --steps 50 --batch 25
+"""
+
+import argparse
+import asyncio
+import json
+import os
+import sys
+import tempfile
+import time
+import tracemalloc
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--chains", type=int, default=2000, help="Parallel chains to start")
+    parser.add_argument("--steps", type=int, default=50, help="Steps appended to each chain")
+    parser.add_argument("--batch", type=int, default=25, help="Steps per sequential_steps call")
+    parser.add_argument("--max-active", type=int, default=None,
+                        help="SEQUENTIAL_MAX_ACTIVE (default: keep every chain resident)")
+    parser.add_argument("--memory", action="store_true", help="Trace peak memory (slower)")
+    return parser.parse_args()
+
+async def run_phase(call_tool, chain_ids, steps, batch):
+    """Append `steps` steps to every chain, interleaving chains like concurrent clients"""
+    async def single(chain_id):
+        for i in range(steps):
+            await call_tool("sequential_step", {
+                "chain_id": chain_id,
+                "step": f"step {i} of {chain_id}",
+                "observation": "observed" if i % 3 == 0 else ""
+            })
+            await asyncio.sleep(0)
+
+    async def batched(chain_id):
+        for start in range(0, steps, batch):
+            await call_tool("sequential_steps", {
+                "chain_id": chain_id,
+                "steps": [
+                    {"step": f"step {i} of {chain_id}", "observation": "observed" if i % 3 == 0 else ""}
+                    for i in range(start, min(start + batch, steps))
+                ]
+            })
+            await asyncio.sleep(0)
+
+    started = time.perf_counter()
+    await asyncio.gather(*(batched(cid) if batch > 1 else single(cid) for cid in chain_ids))
+    elapsed = time.perf_counter() - started
+    total = len(chain_ids) * steps
+    return {
+        "steps": total,
+        "calls": len(chain_ids) * (-(-steps // batch) if batch > 1 else steps),
+        "seconds": round(elapsed, 3),
+        "steps_per_sec": round(total / elapsed) if elapsed else None
+    }
+
+async def benchmark(args):
+    import server
+
+    if args.memory:
+        tracemalloc.start()
+
+    started = time.perf_counter()
+    results = await asyncio.gather(*(
+        server.call_tool("sequential_start", {"task": f"benchmark task {i}"})
+        for i in range(args.chains)
+    ))
+    start_seconds = time.perf_counter() - started
+    chain_ids = [r[0].text.split("'")[1] for r in results]
+    assert len(set(chain_ids)) == len(chain_ids), "chain ID collision"
+
+    single = await run_phase(server.call_tool, chain_ids, args.steps, 1)
+    batched = await run_phase(server.call_tool, chain_ids, args.steps, args.batch)
+
+    started = time.perf_counter()
+    for chain_id in chain_ids:
+        await server.call_tool("sequential_conclude", {"chain_id": chain_id, "conclusion": "done"})
+    conclude_seconds = time.perf_counter() - started
+
+    started = time.perf_counter()
+    await server.call_tool("sequential_search", {"query": "step 7 observed"})
+    search_seconds = time.perf_counter() - started
+
+    report = {
+        "chains": args.chains,
+        "steps_per_chain": args.steps * 2,
+        "max_active": server.chain_store.max_active,
+        "start": {"seconds": round(start_seconds, 3), "chains_per_sec": round(args.chains / start_seconds)},
+        "single_steps": single,
+        "batched_steps": {**batched, "batch": args.batch},
+        "conclude": {"seconds": round(conclude_seconds, 3)},
+        "search_ms": round(search_seconds * 1000, 2)
+    }
+    if args.memory:
+        report["peak_memory_mb"] = round(tracemalloc.get_traced_memory()[1] / 1024 / 1024, 1)
+    return report
+
+def main():
+    args = parse_args()
+    with tempfile.TemporaryDirectory() as data_dir:
+        os.environ["SEQUENTIAL_PATH"] = data_dir
+        os.environ["SEQUENTIAL_MAX_ACTIVE"] = str(args.max_active or args.chains)
+        sys.path.insert(0, os.path.dirname(os.path.abspath(__file__)))
+        report = asyncio.run(benchmark(args))
+    print(json.dumps(report, indent=2))
+
+if __name__ == "__main__":
+    main()
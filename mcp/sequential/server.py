@@ -2,6 +2,13 @@
 """Sequential Thinking MCP Server - Step-by-step reasoning"""
 
 import json
+import os
+import re
+import sqlite3
+import time
+import uuid
+from collections import OrderedDict
+from pathlib import Path
 from typing import Any
 from datetime import datetime
 
@@ -11,8 +18,333 @@ from mcp.types import Tool, TextContent
 
 server = Server("sequential-thinking")
 
-# Store for reasoning chains
-reasoning_chains = {}
+SEQUENTIAL_PATH = Path(os.getenv("SEQUENTIAL_PATH", "/data"))
+# Max chains kept in memory; least recently used ones are spilled to disk
+SEQUENTIAL_MAX_ACTIVE = int(os.getenv("SEQUENTIAL_MAX_ACTIVE", "256"))
+if SEQUENTIAL_MAX_ACTIVE < 1:
+    raise ValueError(f"SEQUENTIAL_MAX_ACTIVE must be at least 1, got {SEQUENTIAL_MAX_ACTIVE}")
+
+TOKEN_RE = re.compile(r"\w+")
+
+class Step:
+    """A reasoning step, kept compact with __slots__ and an epoch timestamp"""
+
+    __slots__ = ("step", "observation", "timestamp")
+
+    def __init__(self, step: str, observation: str = "", timestamp: float = None):
+        self.step = step
+        self.observation = observation
+        self.timestamp = time.time() if timestamp is None else timestamp
+
+    def to_json(self) -> list:
+        return [self.step, self.observation, self.timestamp]
+
+    @classmethod
+    def from_json(cls, data) -> "Step":
+        if isinstance(data, dict):
+            # Chains persisted before steps were compacted
+            return cls(
+                data["step"],
+                data.get("observation", ""),
+                datetime.fromisoformat(data["timestamp"]).timestamp()
+            )
+        return cls(*data)
+
+    def to_dict(self) -> dict:
+        return {
+            "step": self.step,
+            "observation": self.observation,
+            "timestamp": datetime.fromtimestamp(self.timestamp).isoformat()
+        }
+
+def new_chain_id() -> str:
+    return f"chain_{uuid.uuid4().hex[:16]}"
+
+def render_header(task: str) -> str:
+    return f"## Reasoning Chain: {task}\n\n"
+
+def render_step(number: int, step: Step) -> str:
+    fragment = f"**Step {number}:** {step.step}\n"
+    if step.observation:
+        fragment += f"*Observation:* {step.observation}\n"
+    return fragment + "\n"
+
+def render_conclusion(conclusion: str) -> str:
+    return f"**Conclusion:** {conclusion}\n"
+
+class ChainStore:
+    """Reasoning chains held in a bounded in-memory LRU backed by SQLite.
+
+    When more than `max_active` chains are resident, the least recently used
+    completed chain is spilled to disk (or the least recently used chain if
+    none has completed). Spilled chains are reloaded lazily on access.
+    Completed chains are persisted as soon as they are concluded.
+
+    Each resident chain keeps its rendered markdown fragments (one per step)
+    and a cached transcript under "_"-prefixed keys, which are never
+    persisted. Tasks, steps, observations and conclusions are indexed in an
+    FTS5 table; rows are buffered and written before searches and spills.
+    """
+
+    def __init__(self, path: Path, max_active: int):
+        path.mkdir(parents=True, exist_ok=True)
+        self.max_active = max_active
+        self.chains: OrderedDict[str, dict] = OrderedDict()
+        self.db = sqlite3.connect(str(path / "chains.sqlite3"))
+        self.db.execute("PRAGMA journal_mode=WAL")
+        self.db.execute("PRAGMA synchronous=NORMAL")
+        self.db.execute("""
+            CREATE TABLE IF NOT EXISTS chains (
+                chain_id TEXT PRIMARY KEY,
+                task TEXT NOT NULL,
+                status TEXT NOT NULL,
+                step_count INTEGER NOT NULL,
+                started_at TEXT,
+                completed_at TEXT,
+                data TEXT NOT NULL
+            )
+        """)
+        self.db.execute("CREATE INDEX IF NOT EXISTS chains_started ON chains (status, started_at)")
+        # Summaries of resident chains, refreshed before each list() so paging happens in SQL
+        self.db.execute("""
+            CREATE TEMP TABLE resident (
+                chain_id TEXT PRIMARY KEY,
+                task TEXT NOT NULL,
+                status TEXT NOT NULL,
+                step_count INTEGER NOT NULL,
+                started_at TEXT,
+                completed_at TEXT
+            )
+        """)
+        backfill = self.db.execute(
+            "SELECT 1 FROM sqlite_master WHERE name = 'chain_text'"
+        ).fetchone() is None
+        self.db.execute("""
+            CREATE VIRTUAL TABLE IF NOT EXISTS chain_text USING fts5(
+                chain_id UNINDEXED, kind UNINDEXED, step UNINDEXED, text
+            )
+        """)
+        self.pending_index: list[tuple] = []
+        if backfill:
+            for chain_id, data in self.db.execute("SELECT chain_id, data FROM chains").fetchall():
+                self._queue_chain(chain_id, self._decode(data))
+            self._flush_index()
+        self.db.commit()
+
+    def _queue_chain(self, chain_id: str, chain: dict):
+        self.pending_index.append((chain_id, "task", None, chain["task"]))
+        for number, step in enumerate(chain["steps"], 1):
+            self._queue_step(chain_id, number, step)
+        if chain.get("conclusion"):
+            self.pending_index.append((chain_id, "conclusion", None, chain["conclusion"]))
+
+    def _queue_step(self, chain_id: str, number: int, step: Step):
+        self.pending_index.append((chain_id, "step", number, step.step))
+        if step.observation:
+            self.pending_index.append((chain_id, "observation", number, step.observation))
+
+    def _flush_index(self):
+        if self.pending_index:
+            self.db.executemany(
+                "INSERT INTO chain_text (chain_id, kind, step, text) VALUES (?, ?, ?, ?)",
+                self.pending_index
+            )
+            self.pending_index = []
+            self.db.commit()
+
+    def _delete_index(self, chain_id: str):
+        self.pending_index = [row for row in self.pending_index if row[0] != chain_id]
+        self.db.execute("DELETE FROM chain_text WHERE chain_id = ?", (chain_id,))
+
+    def _persist(self, chain_id: str, chain: dict):
+        self._flush_index()
+        data = {key: value for key, value in chain.items() if not key.startswith("_")}
+        data["steps"] = [step.to_json() for step in chain["steps"]]
+        self.db.execute(
+            "INSERT OR REPLACE INTO chains "
+            "(chain_id, task, status, step_count, started_at, completed_at, data) "
+            "VALUES (?, ?, ?, ?, ?, ?, ?)",
+            (chain_id, chain["task"], chain["status"], len(chain["steps"]),
+             chain["started_at"], chain.get("completed_at"), json.dumps(data))
+        )
+        self.db.commit()
+
+    def _spill(self, keep: str):
+        while len(self.chains) > self.max_active:
+            candidates = [cid for cid in self.chains if cid != keep]
+            if not candidates:
+                return
+            victim = next(
+                (cid for cid in candidates if self.chains[cid]["status"] == "completed"),
+                candidates[0]
+            )
+            self._persist(victim, self.chains.pop(victim))
+
+    def __contains__(self, chain_id: str) -> bool:
+        return chain_id in self.chains or self.db.execute(
+            "SELECT 1 FROM chains WHERE chain_id = ?", (chain_id,)
+        ).fetchone() is not None
+
+    @staticmethod
+    def _decode(data: str) -> dict:
+        chain = json.loads(data)
+        chain["steps"] = [Step.from_json(step) for step in chain["steps"]]
+        return chain
+
+    def add(self, chain_id: str, chain: dict):
+        if chain_id in self:
+            # Restarting an existing chain replaces it, including its index rows
+            self._delete_index(chain_id)
+            self.db.commit()
+        self._queue_chain(chain_id, chain)
+        self.chains[chain_id] = chain
+        self.chains.move_to_end(chain_id)
+        self._spill(chain_id)
+
+    def get(self, chain_id: str) -> dict:
+        """Return a chain, reloading it from disk if it was spilled"""
+        chain = self.chains.get(chain_id)
+        if chain is None:
+            row = self.db.execute(
+                "SELECT data FROM chains WHERE chain_id = ?", (chain_id,)
+            ).fetchone()
+            if row is None:
+                raise ValueError(f"Chain {chain_id} not found")
+            chain = self._decode(row[0])
+            self.chains[chain_id] = chain
+            self._spill(chain_id)
+        self.chains.move_to_end(chain_id)
+        return chain
+
+    def append_steps(self, chain_id: str, steps: list[Step]) -> int:
+        """Append steps, render their fragments and queue them for indexing.
+
+        Returns the number of the last step appended.
+        """
+        chain = self.get(chain_id)
+        chain_steps = chain["steps"]
+        fragments = chain.get("_fragments")
+        for step in steps:
+            chain_steps.append(step)
+            number = len(chain_steps)
+            if fragments is not None:
+                fragments.append(render_step(number, step))
+            self._queue_step(chain_id, number, step)
+        chain.pop("_transcript", None)
+        return len(chain_steps)
+
+    def transcript(self, chain_id: str) -> str:
+        """Markdown transcript of a chain, joined once and cached until it changes"""
+        chain = self.get(chain_id)
+        if "_transcript" not in chain:
+            if "_fragments" not in chain:
+                chain["_fragments"] = [render_header(chain["task"])] + [
+                    render_step(number, step) for number, step in enumerate(chain["steps"], 1)
+                ]
+            transcript = "".join(chain["_fragments"])
+            if chain.get("conclusion") is not None:
+                transcript += render_conclusion(chain["conclusion"])
+            chain["_transcript"] = transcript
+        return chain["_transcript"]
+
+    def complete(self, chain_id: str, conclusion: str) -> str:
+        """Conclude a chain, persist it so it survives restarts and return its transcript"""
+        chain = self.get(chain_id)
+        chain["conclusion"] = conclusion
+        chain["status"] = "completed"
+        chain["completed_at"] = datetime.now().isoformat()
+        chain.pop("_transcript", None)
+        # Concluding again replaces the indexed conclusion instead of adding a second one
+        self.pending_index = [
+            row for row in self.pending_index if row[0] != chain_id or row[1] != "conclusion"
+        ]
+        self.db.execute("DELETE FROM chain_text WHERE chain_id = ? AND kind = 'conclusion'", (chain_id,))
+        self.pending_index.append((chain_id, "conclusion", None, conclusion))
+        self._persist(chain_id, chain)
+        return self.transcript(chain_id)
+
+    def _summary(self, chain_id: str) -> dict:
+        chain = self.chains.get(chain_id)
+        if chain is not None:
+            return {"task": chain["task"], "status": chain["status"]}
+        row = self.db.execute(
+            "SELECT task, status FROM chains WHERE chain_id = ?", (chain_id,)
+        ).fetchone()
+        return {"task": row[0], "status": row[1]} if row else {}
+
+    def search(self, query: str, limit: int = 10) -> list[dict]:
+        """Full-text search over tasks, steps, observations and conclusions.
+
+        Matches are ranked with BM25 and grouped by chain, best chain first.
+        """
+        terms = TOKEN_RE.findall(query)
+        if not terms or limit <= 0:
+            return []
+        self._flush_index()
+        match = "text : (" + " OR ".join(f'"{term}"' for term in terms) + ")"
+        rows = self.db.execute(
+            "SELECT chain_id, kind, step, snippet(chain_text, 3, '**', '**', '...', 16), "
+            "bm25(chain_text) FROM chain_text WHERE chain_text MATCH ? ORDER BY rank LIMIT ?",
+            (match, limit * 10)
+        ).fetchall()
+
+        results: dict[str, dict] = {}
+        for chain_id, kind, step, snippet, rank in rows:
+            if chain_id not in results:
+                if len(results) >= limit:
+                    continue
+                results[chain_id] = {
+                    "chain_id": chain_id,
+                    **self._summary(chain_id),
+                    "score": round(-rank, 4),
+                    "matches": []
+                }
+            results[chain_id]["matches"].append({"kind": kind, "step": step, "snippet": snippet})
+        return list(results.values())
+
+    def delete(self, chain_id: str) -> bool:
+        self._delete_index(chain_id)
+        removed = self.chains.pop(chain_id, None) is not None
+        removed |= self.db.execute("DELETE FROM chains WHERE chain_id = ?", (chain_id,)).rowcount > 0
+        self.db.commit()
+        return removed
+
+    def list(self, status: str = None, limit: int = 50, offset: int = 0) -> list[dict]:
+        """Summaries of resident and spilled chains, most recently started first.
+
+        Resident chains may be newer than their stored rows, so their summaries
+        are copied to a temp table that shadows `chains` in the query.
+        """
+        self.db.execute("DELETE FROM resident")
+        self.db.executemany(
+            "INSERT INTO resident VALUES (?, ?, ?, ?, ?, ?)",
+            [(chain_id, chain["task"], chain["status"], len(chain["steps"]),
+              chain["started_at"], chain.get("completed_at"))
+             for chain_id, chain in self.chains.items()]
+        )
+        rows = self.db.execute(
+            "SELECT chain_id, task, status, step_count, started_at, completed_at FROM ("
+            "  SELECT * FROM resident"
+            "  UNION ALL"
+            "  SELECT chain_id, task, status, step_count, started_at, completed_at FROM chains"
+            "  WHERE chain_id NOT IN (SELECT chain_id FROM resident)"
+            ") WHERE ?1 IS NULL OR status = ?1 "
+            "ORDER BY started_at DESC LIMIT ?2 OFFSET ?3",
+            (status, limit, offset)
+        ).fetchall()
+        return [
+            {"chain_id": chain_id, "task": task, "status": chain_status, "steps": step_count,
+             "started_at": started_at, "completed_at": completed_at}
+            for chain_id, task, chain_status, step_count, started_at, completed_at in rows
+        ]
+
+    def flush(self):
+        """Persist every resident chain, e.g. on shutdown"""
+        self._flush_index()
+        for chain_id, chain in self.chains.items():
+            self._persist(chain_id, chain)
+
+chain_store = ChainStore(SEQUENTIAL_PATH, SEQUENTIAL_MAX_ACTIVE)
 
 @server.list_tools()
 async def list_tools() -> list[Tool]:
@@ -42,6 +374,30 @@ async def list_tools() -> list[Tool]:
                 "required": ["chain_id", "step"]
             }
         ),
+        Tool(
+            name="sequential_steps",
+            description="Add several reasoning steps to an existing chain in one call",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "chain_id": {"type": "string", "description": "Chain ID"},
+                    "steps": {
+                        "type": "array",
+                        "items": {
+                            "type": "object",
+                            "properties": {
+                                "step": {"type": "string", "description": "Reasoning step"},
+                                "observation": {"type": "string", "description": "Optional observation"}
+                            },
+                            "required": ["step"]
+                        },
+                        "minItems": 1,
+                        "description": "Steps to append, in order"
+                    }
+                },
+                "required": ["chain_id", "steps"]
+            }
+        ),
         Tool(
             name="sequential_conclude",
             description="Conclude a reasoning chain with final answer",
@@ -53,19 +409,80 @@ async def list_tools() -> list[Tool]:
                 },
                 "required": ["chain_id", "conclusion"]
             }
+        ),
+        Tool(
+            name="sequential_get",
+            description="Get a reasoning chain with all its steps",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "chain_id": {"type": "string", "description": "Chain ID"},
+                    "format": {
+                        "type": "string",
+                        "enum": ["json", "markdown"],
+                        "default": "json",
+                        "description": "Raw chain data or the rendered markdown transcript"
+                    }
+                },
+                "required": ["chain_id"]
+            }
+        ),
+        Tool(
+            name="sequential_list",
+            description="List reasoning chains, most recently started first",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "status": {
+                        "type": "string",
+                        "enum": ["active", "completed"],
+                        "description": "Only list chains with this status"
+                    },
+                    "limit": {"type": "number", "default": 50, "description": "Max results"},
+                    "offset": {"type": "number", "default": 0, "description": "Results to skip"}
+                }
+            }
+        ),
+        Tool(
+            name="sequential_search",
+            description="Search previous reasoning (tasks, steps, observations, conclusions) to reuse it",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "query": {"type": "string", "description": "Search query"},
+                    "limit": {"type": "number", "default": 10, "description": "Max chains to return"}
+                },
+                "required": ["query"]
+            }
+        ),
+        Tool(
+            name="sequential_delete",
+            description="Delete a reasoning chain",
+            inputSchema={
+                "type": "object",
+                "properties": {
+                    "chain_id": {"type": "string", "description": "Chain ID"}
+                },
+                "required": ["chain_id"]
+            }
         )
     ]
 
 @server.call_tool()
 async def call_tool(name: str, arguments: Any) -> list[TextContent]:
     if name == "sequential_start":
-        chain_id = arguments.get("chain_id", f"chain_{len(reasoning_chains)}")
-        reasoning_chains[chain_id] = {
+        chain_id = arguments.get("chain_id")
+        if chain_id is None:
+            chain_id = new_chain_id()
+            while chain_id in chain_store:
+                chain_id = new_chain_id()
+        chain_store.add(chain_id, {
             "task": arguments["task"],
             "steps": [],
             "started_at": datetime.now().isoformat(),
-            "status": "active"
-        }
+            "status": "active",
+            "_fragments": [render_header(arguments["task"])]
+        })
         return [TextContent(
             type="text",
             text=f"Started reasoning chain '{chain_id}' for task: {arguments['task']}"
@@ -73,47 +490,70 @@ async def call_tool(name: str, arguments: Any) -> list[TextContent]:
 
     elif name == "sequential_step":
         chain_id = arguments["chain_id"]
-        if chain_id not in reasoning_chains:
-            raise ValueError(f"Chain {chain_id} not found")
+        step = Step(arguments["step"], arguments.get("observation", ""))
+        number = chain_store.append_steps(chain_id, [step])
 
-        step = {
-            "step": arguments["step"],
-            "observation": arguments.get("observation", ""),
-            "timestamp": datetime.now().isoformat()
-        }
-        reasoning_chains[chain_id]["steps"].append(step)
+        return [TextContent(
+            type="text",
+            text=f"Added step {number} to chain '{chain_id}'"
+        )]
+
+    elif name == "sequential_steps":
+        chain_id = arguments["chain_id"]
+        if not arguments["steps"]:
+            raise ValueError("steps must contain at least one step")
+        steps = [Step(item["step"], item.get("observation", "")) for item in arguments["steps"]]
+        last = chain_store.append_steps(chain_id, steps)
 
         return [TextContent(
             type="text",
-            text=f"Added step {len(reasoning_chains[chain_id]['steps'])} to chain '{chain_id}'"
+            text=f"Added steps {last - len(steps) + 1}-{last} to chain '{chain_id}'"
         )]
 
     elif name == "sequential_conclude":
+        result = chain_store.complete(arguments["chain_id"], arguments["conclusion"])
+        return [TextContent(type="text", text=result)]
+
+    elif name == "sequential_get":
         chain_id = arguments["chain_id"]
-        if chain_id not in reasoning_chains:
-            raise ValueError(f"Chain {chain_id} not found")
+        if arguments.get("format", "json") == "markdown":
+            return [TextContent(type="text", text=chain_store.transcript(chain_id))]
+        chain = {
+            key: value for key, value in chain_store.get(chain_id).items()
+            if not key.startswith("_")
+        }
+        chain["steps"] = [step.to_dict() for step in chain["steps"]]
+        return [TextContent(
+            type="text",
+            text=json.dumps({"chain_id": chain_id, **chain}, indent=2)
+        )]
 
-        reasoning_chains[chain_id]["conclusion"] = arguments["conclusion"]
-        reasoning_chains[chain_id]["status"] = "completed"
-        reasoning_chains[chain_id]["completed_at"] = datetime.now().isoformat()
+    elif name == "sequential_search":
+        results = chain_store.search(arguments["query"], int(arguments.get("limit", 10)))
+        return [TextContent(type="text", text=json.dumps(results, indent=2))]
 
-        # Format the full chain
-        chain = reasoning_chains[chain_id]
-        result = f"## Reasoning Chain: {chain['task']}\n\n"
-        for i, step in enumerate(chain['steps'], 1):
-            result += f"**Step {i}:** {step['step']}\n"
-            if step['observation']:
-                result += f"*Observation:* {step['observation']}\n"
-            result += "\n"
-        result += f"**Conclusion:** {chain['conclusion']}\n"
+    elif name == "sequential_list":
+        chains = chain_store.list(
+            arguments.get("status"),
+            int(arguments.get("limit", 50)),
+            int(arguments.get("offset", 0))
+        )
+        return [TextContent(type="text", text=json.dumps(chains, indent=2))]
 
-        return [TextContent(type="text", text=result)]
+    elif name == "sequential_delete":
+        chain_id = arguments["chain_id"]
+        if not chain_store.delete(chain_id):
+            raise ValueError(f"Chain {chain_id} not found")
+        return [TextContent(type="text", text=f"Deleted chain '{chain_id}'")]
 
     raise ValueError(f"Unknown tool: {name}")
 
 async def main():
     async with stdio_server() as (read_stream, write_stream):
-        await server.run(read_stream, write_stream, server.create_initialization_options())
+        try:
+            await server.run(read_stream, write_stream, server.create_initialization_options())
+        finally:
+            chain_store.flush()
 
 if __name__ == "__main__":
     import asyncio
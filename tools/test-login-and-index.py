@@ -1,17 +1,60 @@
 #!/usr/bin/env python3
-"""Test login and chess indexing"""
-import requests
+"""Test login and chess indexing
+
+Without options runs one login followed by one /chess/index call (smoke
+test). With --load runs an asyncio load test of login and search (index
+only when listed in --steps, since it rebuilds the knowledge index): virtual
+users share one pooled HTTP client, start over a ramp-up period, pause for
+a think time between requests and repeat until the duration or iteration
+count is reached. Latency percentiles, histograms, error rates and
+throughput per endpoint are printed as JSON. --stub serves a local fake
+API so the harness can be exercised without the backend.
+
+Usage:
+    python tools/test-login-and-index.py
+    python tools/test-login-and-index.py --load --users 20 --ramp-up 10 --duration 60 --think-time 1
+    python tools/test-login-and-index.py --load --stub --users 50 --duration 10 --steps login,search
+"""
+import argparse
+import asyncio
 import json
+import os
+import random
 import sys
+import threading
+import time
+import uuid
+from http.cookiejar import CookieJar, DefaultCookiePolicy
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import parse_qs, urlsplit
+
+try:
+    import requests
+    REQUESTS_AVAILABLE = True
+except ImportError:
+    REQUESTS_AVAILABLE = False
 
-BASE_URL = "http://localhost:8080"
+try:
+    import httpx
+    HTTPX_AVAILABLE = True
+except ImportError:
+    HTTPX_AVAILABLE = False
+
+BASE_URL = os.getenv("BASE_URL", "http://localhost:8080")
+API_PREFIX = os.getenv("API_PREFIX", "/api/v1")
+EMAIL = os.getenv("MEEPLE_EMAIL", "admin@meepleai.dev")
+PASSWORD = os.getenv("MEEPLE_PASSWORD", "Demo123!")
+SESSION_COOKIE = "meeple_session"
+
+# Upper bounds (ms) of the latency histogram buckets
+HISTOGRAM_BUCKETS_MS = (5, 10, 25, 50, 100, 250, 500, 1000, 2500, 5000, 10000, 30000, 60000)
 
 def test_login():
     """Test login endpoint"""
     print("Testing login...")
     response = requests.post(
-        f"{BASE_URL}/auth/login",
-        json={"email": "admin@meepleai.dev", "password": "Demo123!"},
+        f"{BASE_URL}{API_PREFIX}/auth/login",
+        json={"email": EMAIL, "password": PASSWORD},
         timeout=10
     )
 
@@ -26,7 +69,7 @@ def test_chess_indexing(cookies):
     """Test chess knowledge indexing"""
     print("\nIndexing chess knowledge...")
     response = requests.post(
-        f"{BASE_URL}/chess/index",
+        f"{BASE_URL}{API_PREFIX}/chess/index",
         cookies=cookies,
         timeout=180
     )
@@ -42,7 +85,339 @@ def test_chess_indexing(cookies):
         print(f"[FAIL] Indexing failed: {response.status_code} - {response.text}")
         return False
 
+# --- Load test -------------------------------------------------------------
+
+class EndpointStats:
+    """Latencies and outcomes of one endpoint"""
+
+    def __init__(self):
+        self.latencies: list[float] = []
+        self.errors = 0
+        self.statuses: dict[str, int] = {}
+
+    def record(self, seconds: float, status: str, error: bool):
+        self.latencies.append(seconds * 1000)
+        self.statuses[status] = self.statuses.get(status, 0) + 1
+        self.errors += 1 if error else 0
+
+    def report(self, elapsed: float) -> dict:
+        latencies = sorted(self.latencies)
+        count = len(latencies)
+
+        def percentile(p: float):
+            # Nearest-rank percentile
+            return round(latencies[max(0, -(-count * p // 100) - 1)], 1) if count else None
+
+        histogram, start = {}, 0
+        for bound in HISTOGRAM_BUCKETS_MS:
+            end = start
+            while end < count and latencies[end] <= bound:
+                end += 1
+            histogram[f"<={bound}ms"] = end - start
+            start = end
+        histogram[f">{HISTOGRAM_BUCKETS_MS[-1]}ms"] = count - start
+        return {
+            "requests": count,
+            "errors": self.errors,
+            "error_rate": round(self.errors / count, 4) if count else None,
+            "throughput_rps": round(count / elapsed, 2) if elapsed else None,
+            "latency_ms": {
+                "min": round(latencies[0], 1) if count else None,
+                "mean": round(sum(latencies) / count, 1) if count else None,
+                "p50": percentile(50),
+                "p95": percentile(95),
+                "p99": percentile(99),
+                "max": round(latencies[-1], 1) if count else None
+            },
+            "histogram": histogram,
+            "statuses": self.statuses
+        }
+
+class RejectCookies(DefaultCookiePolicy):
+    """Keep the shared client's jar empty; each virtual user sends its own session"""
+
+    def set_ok(self, cookie, request):
+        return False
+
+class LoadTest:
+    def __init__(self, args, base_url: str):
+        self.args = args
+        self.base_url = base_url + args.api_prefix
+        self.steps = [step.strip() for step in args.steps.split(",") if step.strip()]
+        unknown = set(self.steps) - {"login", "index", "search"}
+        if unknown:
+            raise ValueError(f"Unknown steps: {', '.join(sorted(unknown))} (available: login, index, search)")
+        self.stats: dict[str, EndpointStats] = {}
+        self.random = random.Random(args.seed)
+        self.active_users = 0
+        self.peak_users = 0
+        self.iterations = 0
+        self.deadline = None
+
+    async def request(self, client, name: str, method: str, path: str, session: str = None, **kwargs):
+        headers = {"Cookie": f"{SESSION_COOKIE}={session}"} if session else None
+        started = time.perf_counter()
+        try:
+            response = await client.request(method, self.base_url + path, headers=headers, **kwargs)
+            await response.aread()
+            status, error = str(response.status_code), response.status_code >= 400
+        except httpx.TimeoutException:
+            response, status, error = None, "timeout", True
+        except httpx.HTTPError as e:
+            response, status, error = None, type(e).__name__, True
+        self.stats.setdefault(name, EndpointStats()).record(time.perf_counter() - started, status, error)
+        return response
+
+    async def login(self, client):
+        response = await self.request(client, "POST /auth/login", "POST", "/auth/login",
+                                      json={"email": self.args.email, "password": self.args.password},
+                                      timeout=self.args.login_timeout)
+        if response is None or response.status_code != 200:
+            return None
+        return response.cookies.get(SESSION_COOKIE)
+
+    async def think(self):
+        if self.args.think_time > 0:
+            jitter = self.args.think_jitter
+            await asyncio.sleep(self.args.think_time * self.random.uniform(1 - jitter, 1 + jitter))
+
+    def running(self, iteration: int) -> bool:
+        if self.args.iterations:
+            return iteration < self.args.iterations
+        return time.monotonic() < self.deadline
+
+    async def virtual_user(self, client, delay: float):
+        await asyncio.sleep(delay)
+        self.active_users += 1
+        self.peak_users = max(self.peak_users, self.active_users)
+        try:
+            session = None if "login" in self.steps else await self.login(client)
+            iteration = 0
+            while self.running(iteration):
+                for step in self.steps:
+                    if step == "login":
+                        session = await self.login(client)
+                    elif step == "index":
+                        await self.request(client, "POST /chess/index", "POST", "/chess/index", session,
+                                           timeout=self.args.timeout)
+                    elif step == "search":
+                        await self.request(client, "GET /chess/search", "GET", "/chess/search", session,
+                                           params={"q": self.args.query, "limit": 5}, timeout=self.args.timeout)
+                    await self.think()
+                iteration += 1
+                self.iterations += 1
+        finally:
+            self.active_users -= 1
+
+    async def run(self) -> dict:
+        users = self.args.users
+        limits = httpx.Limits(max_connections=self.args.max_connections or users,
+                              max_keepalive_connections=self.args.max_connections or users)
+        client = httpx.AsyncClient(limits=limits, cookies=CookieJar(policy=RejectCookies()))
+        started = time.perf_counter()
+        self.deadline = time.monotonic() + self.args.ramp_up + self.args.duration
+        try:
+            # Linear ramp-up: user i starts at i/users of the ramp-up period
+            await asyncio.gather(*(
+                self.virtual_user(client, self.args.ramp_up * i / users) for i in range(users)
+            ))
+        finally:
+            await client.aclose()
+        elapsed = time.perf_counter() - started
+
+        total = EndpointStats()
+        for stats in self.stats.values():
+            total.latencies.extend(stats.latencies)
+            total.errors += stats.errors
+            for status, count in stats.statuses.items():
+                total.statuses[status] = total.statuses.get(status, 0) + count
+        return {
+            "base_url": self.base_url,
+            "users": users,
+            "peak_users": self.peak_users,
+            "ramp_up_seconds": self.args.ramp_up,
+            "think_time_seconds": self.args.think_time,
+            "steps": self.steps,
+            "elapsed_seconds": round(elapsed, 3),
+            "iterations": self.iterations,
+            "endpoints": {name: stats.report(elapsed) for name, stats in sorted(self.stats.items())},
+            "total": total.report(elapsed)
+        }
+
+# --- Stub API --------------------------------------------------------------
+
+class StubApi(ThreadingHTTPServer):
+    daemon_threads = True
+    # Default backlog of 5 stalls bursts of new connections on SYN retries
+    request_queue_size = 256
+
+class StubApiHandler(BaseHTTPRequestHandler):
+    """Fake /auth/login, /chess/index and /chess/search with configurable latency and failures"""
+    protocol_version = "HTTP/1.1"
+    # Headers and body go out in separate writes; Nagle + delayed ACK would add ~40 ms to each reply
+    disable_nagle_algorithm = True
+
+    def log_message(self, format, *args):
+        pass
+
+    def send_json(self, status: int, payload: dict, cookie: str = None):
+        body = json.dumps(payload).encode("utf-8")
+        self.send_response(status)
+        self.send_header("Content-Type", "application/json")
+        if cookie:
+            self.send_header("Set-Cookie", f"{SESSION_COOKIE}={cookie}; Path=/; HttpOnly")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def session(self):
+        for part in self.headers.get("Cookie", "").split(";"):
+            name, _, value = part.strip().partition("=")
+            if name == SESSION_COOKIE and value in self.server.sessions:
+                return value
+        return None
+
+    def respond(self, endpoint: str):
+        stub = self.server
+        time.sleep(stub.delays.get(endpoint, stub.delay))
+        with stub.lock:
+            stub.requests += 1
+            fail = stub.random.random() < stub.error_rate
+        if fail:
+            self.send_json(500, {"error": "Injected failure"})
+            return
+        if endpoint == "login":
+            length = int(self.headers.get("Content-Length", 0))
+            payload = json.loads(self.rfile.read(length) or b"{}")
+            if payload.get("email") != stub.email or payload.get("password") != stub.password:
+                self.send_json(401, {"error": "Invalid credentials"})
+                return
+            token = uuid.uuid4().hex
+            with stub.lock:
+                stub.sessions.add(token)
+            self.send_json(200, {"user": {"email": stub.email, "role": "Admin"}, "expiresAt": None}, cookie=token)
+        elif self.session() is None:
+            self.send_json(401, {"error": "Unauthorized"})
+        elif endpoint == "index":
+            self.send_json(200, {"success": True, "totalItems": 42, "totalChunks": 128,
+                                 "categoryCounts": {"openings": 20, "tactics": 22}})
+        else:
+            query = parse_qs(urlsplit(self.path).query).get("q", [""])[0]
+            self.send_json(200, {"success": True, "results": [
+                {"score": 0.9, "text": f"stub result for {query}", "page": 1, "chunkIndex": 0}
+            ]})
+
+    def do_POST(self):
+        path = urlsplit(self.path).path
+        if path == f"{self.server.prefix}/auth/login":
+            self.respond("login")
+        elif path == f"{self.server.prefix}/chess/index":
+            self.respond("index")
+        else:
+            self.send_json(404, {"error": f"Unknown path {path}"})
+
+    def do_GET(self):
+        if urlsplit(self.path).path == f"{self.server.prefix}/chess/search":
+            self.respond("search")
+        else:
+            self.send_json(404, {"error": f"Unknown path {self.path}"})
+
+def start_stub(port: int = 0, prefix: str = API_PREFIX, delay: float = 0.02, delays: dict = None,
+               error_rate: float = 0.0, seed: int = None) -> StubApi:
+    """Start the stub API in a daemon thread; the bound port is httpd.server_address[1]"""
+    httpd = StubApi(("127.0.0.1", port), StubApiHandler)
+    httpd.prefix = prefix
+    httpd.delay = delay
+    httpd.delays = delays or {}
+    httpd.error_rate = error_rate
+    httpd.random = random.Random(seed)
+    httpd.email = EMAIL
+    httpd.password = PASSWORD
+    httpd.sessions = set()
+    httpd.requests = 0
+    httpd.lock = threading.Lock()
+    threading.Thread(target=httpd.serve_forever, daemon=True).start()
+    return httpd
+
+def parse_delays(spec: str) -> dict:
+    """"login=0.05,index=2" -> {"login": 0.05, "index": 2.0}"""
+    delays = {}
+    for item in filter(None, (part.strip() for part in spec.split(","))):
+        endpoint, _, seconds = item.partition("=")
+        delays[endpoint.strip()] = float(seconds)
+    return delays
+
+def parse_args():
+    parser = argparse.ArgumentParser(description=__doc__.splitlines()[0])
+    parser.add_argument("--load", action="store_true", help="Run the load test instead of the smoke test")
+    parser.add_argument("--users", type=int, default=10, help="Virtual users")
+    parser.add_argument("--ramp-up", type=float, default=5.0, help="Seconds to start all virtual users")
+    parser.add_argument("--duration", type=float, default=30.0, help="Seconds to run after the ramp-up")
+    parser.add_argument("--iterations", type=int, default=0, help="Iterations per user (overrides --duration)")
+    parser.add_argument("--think-time", type=float, default=1.0, help="Mean pause between requests (seconds)")
+    parser.add_argument("--think-jitter", type=float, default=0.5, help="Think time varies by +/- this fraction")
+    parser.add_argument("--steps", default="login,search",
+                        help="Requests per iteration: login, index, search (a session is opened first if login is absent); "
+                             "index is admin-only and rebuilds the knowledge index, so it only runs when listed")
+    parser.add_argument("--query", default="italian opening", help="Query for the search step")
+    parser.add_argument("--timeout", type=float, default=180.0, help="Timeout of index/search requests")
+    parser.add_argument("--login-timeout", type=float, default=10.0, help="Timeout of login requests")
+    parser.add_argument("--max-connections", type=int, default=0, help="Connection pool size (default: --users)")
+    parser.add_argument("--base-url", default=BASE_URL)
+    parser.add_argument("--api-prefix", default=API_PREFIX)
+    parser.add_argument("--email", default=EMAIL)
+    parser.add_argument("--password", default=PASSWORD)
+    parser.add_argument("--seed", type=int, default=None, help="Random seed for think times and stub failures")
+    parser.add_argument("--output", help="Write the JSON report to this file instead of stdout")
+    parser.add_argument("--stub", action="store_true", help="Load-test a local stub API instead of BASE_URL")
+    parser.add_argument("--stub-delay", type=float, default=0.02, help="Stub latency per request (seconds)")
+    parser.add_argument("--stub-delays", default="", help="Per-endpoint stub latency, e.g. login=0.05,index=0.5")
+    parser.add_argument("--stub-error-rate", type=float, default=0.0, help="Fraction of stub requests failing with 500")
+    return parser.parse_args()
+
+def run_load(args):
+    if not HTTPX_AVAILABLE:
+        print("[FAIL] httpx not available. Install with: pip install httpx")
+        sys.exit(1)
+    base_url = args.base_url
+    httpd = None
+    if args.stub:
+        httpd = start_stub(prefix=args.api_prefix, delay=args.stub_delay, delays=parse_delays(args.stub_delays),
+                           error_rate=args.stub_error_rate, seed=args.seed)
+        base_url = f"http://127.0.0.1:{httpd.server_address[1]}"
+    elif "index" in args.steps.split(","):
+        print(f"[WARN] --steps includes index: every iteration rebuilds the knowledge index on {base_url}")
+    try:
+        report = asyncio.run(LoadTest(args, base_url).run())
+    except ValueError as e:
+        print(f"[FAIL] {e}")
+        sys.exit(1)
+    finally:
+        if httpd is not None:
+            httpd.shutdown()
+    if httpd is not None:
+        report["stub_requests"] = httpd.requests
+    text = json.dumps(report, indent=2)
+    if args.output:
+        with open(args.output, "w", encoding="utf-8") as f:
+            f.write(text + "\n")
+        print(f"[OK] Report written to {args.output}")
+    else:
+        print(text)
+    if not report["total"]["requests"] or report["total"]["errors"] == report["total"]["requests"]:
+        sys.exit(1)
+
 def main():
+    args = parse_args()
+    if args.load:
+        run_load(args)
+        return
+
+    global BASE_URL, API_PREFIX, EMAIL, PASSWORD
+    BASE_URL, API_PREFIX, EMAIL, PASSWORD = args.base_url, args.api_prefix, args.email, args.password
+    if not REQUESTS_AVAILABLE:
+        print("[FAIL] requests not available. Install with: pip install requests")
+        sys.exit(1)
     cookies = test_login()
     if cookies:
         test_chess_indexing(cookies)